@@ -0,0 +1,200 @@
+import numpy as np
+import pandas as pd
+
+CORE = "Core"
+INNOVATION = "Innovation"
+# Rows whose franchise is Unknown, unmapped or unclassified
+UNASSIGNED = "Unassigned"
+FRANCHISE_TYPES = [CORE, INNOVATION, UNASSIGNED]
+
+DEFAULT_INNOVATION_WINDOW_MONTHS = 36
+
+GROUP_COLS = ["DIVISION", "BRAND", "PERIOD"]
+
+
+def classify_franchise_types(master_df, franchise_col, type_col=None, launch_date_col=None):
+    """
+    Reads franchise classification inputs from the master file.
+
+    Returns (franchise_types, launch_dates): a {franchise: "Core"/"Innovation"}
+    dict from type_col (values containing "innov" are Innovation, "core" Core),
+    and a {franchise: Timestamp} dict from launch_date_col. Either may be empty.
+    """
+    franchise_types = {}
+    if type_col:
+        types = master_df[[franchise_col, type_col]].dropna().drop_duplicates(franchise_col)
+        labels = types[type_col].astype(str).str.lower()
+        classified = np.where(labels.str.contains("innov"), INNOVATION,
+                              np.where(labels.str.contains("core"), CORE, UNASSIGNED))
+        franchise_types = {
+            franchise: label
+            for franchise, label in zip(types[franchise_col], classified.tolist())
+            if label != UNASSIGNED
+        }
+
+    launch_dates = {}
+    if launch_date_col:
+        launches = master_df[[franchise_col, launch_date_col]].copy()
+        launches[launch_date_col] = pd.to_datetime(launches[launch_date_col], errors="coerce")
+        launches = launches.dropna().groupby(franchise_col, observed=True)[launch_date_col].min()
+        launch_dates = launches.to_dict()
+
+    return franchise_types, launch_dates
+
+
+class AllocationEngine:
+    """
+    Core vs innovation allocation of spend/impressions over franchise-mapped
+    campaign data.
+
+    Franchises are classified from an explicit {franchise: type} mapping
+    and/or a launch-date rule: a franchise counts as innovation in periods that
+    start within innovation_window_months of its launch, and as core after
+    that. Explicit types win over the launch-date rule.
+
+    Aggregates are kept per period partition. update() recomputes only the
+    periods present in the data passed in, accumulate() adds streamed chunks
+    into existing partitions, and result() derives shares from the stored
+    aggregates without touching row-level data again.
+    """
+
+    def __init__(self, metric_cols, period_col, franchise_col="FRANCHISE", division_col="DIVISION",
+                 brand_col="BRAND", period_freq="M", franchise_types=None, launch_dates=None,
+                 innovation_window_months=DEFAULT_INNOVATION_WINDOW_MONTHS):
+        self.metric_cols = list(metric_cols)
+        self.period_col = period_col
+        self.franchise_col = franchise_col
+        self.division_col = division_col
+        self.brand_col = brand_col
+        self.period_freq = period_freq
+        self.franchise_types = dict(franchise_types or {})
+        self.launch_dates = {k: pd.Timestamp(v) for k, v in (launch_dates or {}).items()}
+        self.innovation_window = pd.DateOffset(months=innovation_window_months)
+        self._partitions = {}
+
+    def periods(self):
+        return sorted(self._partitions)
+
+    def update(self, df):
+        """
+        Recomputes the partitions of every period present in df, replacing
+        whatever was stored for those periods. Rows without a valid period are
+        ignored.
+        """
+        for period, part in self._split_periods(df):
+            self._partitions[period] = self._aggregate(part, period)
+        return self
+
+    def accumulate(self, df):
+        """
+        Adds df's rows to the stored partitions, e.g. for chunks streamed from
+        iter_table_from_query where one period can span several chunks.
+        """
+        for period, part in self._split_periods(df):
+            aggregated = self._aggregate(part, period)
+            if period in self._partitions:
+                aggregated = (
+                    pd.concat([self._partitions[period], aggregated])
+                    .groupby(GROUP_COLS, sort=False, observed=True, dropna=False, as_index=False)
+                    .sum()
+                )
+            self._partitions[period] = aggregated
+        return self
+
+    def remove(self, period):
+        self._partitions.pop(self._to_period(pd.Series([period])).iloc[0], None)
+        return self
+
+    def result(self, by=GROUP_COLS):
+        """
+        Returns one row per group in by (any of DIVISION, BRAND, PERIOD) with,
+        for each metric, core/innovation/unassigned totals and shares of the
+        total.
+        """
+        value_cols = [f"{metric}_{kind.lower()}" for metric in self.metric_cols for kind in FRANCHISE_TYPES]
+        if not self._partitions:
+            return pd.DataFrame(columns=list(by) + value_cols)
+
+        combined = pd.concat([self._partitions[p] for p in self.periods()], ignore_index=True)
+        if list(by) != GROUP_COLS:
+            combined = combined.groupby(list(by), sort=True, observed=True, dropna=False, as_index=False)[value_cols].sum()
+
+        for metric in self.metric_cols:
+            totals = combined[[f"{metric}_{kind.lower()}" for kind in FRANCHISE_TYPES]].to_numpy().sum(axis=1)
+            combined[f"{metric}_total"] = totals
+            with np.errstate(divide="ignore", invalid="ignore"):
+                for kind in (CORE, INNOVATION):
+                    share = combined[f"{metric}_{kind.lower()}"].to_numpy() / totals
+                    combined[f"{metric}_{kind.lower()}_share"] = np.where(totals > 0, share, np.nan)
+        return combined.reset_index(drop=True)
+
+    def _to_period(self, values):
+        if self.period_freq is None:
+            return values
+        if isinstance(values.dtype, pd.PeriodDtype):
+            return values.dt.asfreq(self.period_freq)
+        return pd.to_datetime(values, errors="coerce").dt.to_period(self.period_freq)
+
+    def _split_periods(self, df):
+        periods = self._to_period(df[self.period_col])
+        codes, uniques = pd.factorize(periods, sort=True)
+        if len(uniques) == 1:
+            yield uniques[0], df[codes == 0]
+            return
+        # Row positions per period in one pass instead of one mask per period
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        for idx, period in enumerate(uniques):
+            yield period, df.iloc[order[bounds[idx]:bounds[idx + 1]]]
+
+    def _type_codes(self, franchises, period):
+        """
+        Franchise type code (index into FRANCHISE_TYPES) per category.
+        """
+        types = np.full(len(franchises), FRANCHISE_TYPES.index(UNASSIGNED))
+        if self.launch_dates:
+            period_start = period.start_time if isinstance(period, pd.Period) else pd.Timestamp(period)
+            launches = pd.to_datetime(pd.Series(franchises).map(self.launch_dates))
+            launched = launches.notna().to_numpy()
+            recent = (launches + self.innovation_window > period_start).to_numpy()
+            types[launched] = np.where(recent[launched], FRANCHISE_TYPES.index(INNOVATION),
+                                       FRANCHISE_TYPES.index(CORE))
+        if self.franchise_types:
+            explicit = pd.Series(franchises).map(self.franchise_types)
+            known = explicit.notna().to_numpy()
+            types[known] = [FRANCHISE_TYPES.index(t) for t in explicit[known]]
+        return types
+
+    def _aggregate(self, part, period):
+        """
+        Sums every metric by division, brand and franchise type for one period
+        using categorical codes and bincount.
+        """
+        franchise_codes, franchises = pd.factorize(part[self.franchise_col])
+        type_by_franchise = self._type_codes(franchises, period)
+        # Missing franchises (code -1) fall into the appended Unassigned slot
+        type_by_franchise = np.append(type_by_franchise, FRANCHISE_TYPES.index(UNASSIGNED))
+        row_types = type_by_franchise[franchise_codes]
+
+        # Combined (division, brand) key; codes are shifted by one so missing
+        # values (-1) stay distinct and decode back to None
+        division_codes, divisions = pd.factorize(part[self.division_col])
+        brand_codes, brands = pd.factorize(part[self.brand_col])
+        radix = len(brands) + 1
+        pair_codes, pairs = pd.factorize((division_codes.astype(np.int64) + 1) * radix + brand_codes + 1)
+        divisions = np.append(np.asarray(divisions, dtype=object), None)
+        brands = np.append(np.asarray(brands, dtype=object), None)
+
+        n_types = len(FRANCHISE_TYPES)
+        bins = pair_codes * n_types + row_types
+        aggregated = {
+            "DIVISION": divisions[pairs // radix - 1],
+            "BRAND": brands[pairs % radix - 1],
+            "PERIOD": [period] * len(pairs),
+        }
+        for metric in self.metric_cols:
+            weights = pd.to_numeric(part[metric], errors="coerce").fillna(0).to_numpy(dtype=float)
+            sums = np.bincount(bins, weights=weights, minlength=len(pairs) * n_types).reshape(len(pairs), n_types)
+            for idx, kind in enumerate(FRANCHISE_TYPES):
+                aggregated[f"{metric}_{kind.lower()}"] = sums[:, idx]
+        return pd.DataFrame(aggregated)
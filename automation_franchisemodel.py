@@ -6,23 +6,78 @@ import os
 
 import numpy as np
 import pandas as pd
-from google.cloud import bigquery
+
+from bigquery_io import (DEFAULT_PAGE_SIZE, QueryCache, quote_identifier, read_query, read_query_batches,
+                         read_query_chunks, write_dataframe)
+from instrumentation import Instrumentation, configure_json_log, timed
 
 # Define BigQuery main function
-def get_table_from_query(query, project_id):
+def get_table_from_query(query, project_id, params=None, backend=None, cache=None, metrics=None):
     """
     Executes a query in BigQuery and returns the result as a Pandas DataFrame.
+    The BigQuery client for each project is created once and reused. Pass a
+    QueryCache to serve repeated queries from local Parquet files, and an
+    Instrumentation to record query time, rows and bytes processed.
     """
     try:
-        client = bigquery.Client(project=project_id)
-        query_job = client.query(query)
-        result = query_job.result()
-        df = result.to_dataframe()
+        with timed(metrics, "bigquery_read") as stage:
+            df = read_query(query, project_id, params=params, backend=backend, cache=cache, metrics=metrics)
+            stage["rows"] = len(df)
         return df
     except Exception as e:
         print(f"Error executing query: {e}")
         return None
 
+def iter_table_from_query(query, project_id, page_size=DEFAULT_PAGE_SIZE, as_arrow=False, params=None,
+                          backend=None, metrics=None):
+    """
+    Executes a query in BigQuery and yields the result in pages, either as
+    DataFrame chunks or as pyarrow RecordBatches, so full tables can be
+    processed in bounded memory.
+    """
+    if as_arrow:
+        return read_query_batches(query, project_id, page_size=page_size, params=params, backend=backend,
+                                  metrics=metrics)
+    return read_query_chunks(query, project_id, page_size=page_size, params=params, backend=backend,
+                             metrics=metrics)
+
+def get_unique_campaigns(table, campaign_col, project_id, division_col=None, division=None,
+                         brand_col=None, brand=None, backend=None, cache=None, metrics=None):
+    """
+    Returns the distinct campaign strings for a division/brand, with the
+    filter and the DISTINCT pushed down into the query so only unique
+    campaigns are transferred.
+    """
+    campaign = quote_identifier(campaign_col)
+    conditions = [f"{campaign} IS NOT NULL"]
+    params = {}
+    if division_col and division is not None:
+        conditions.append(f"{quote_identifier(division_col)} = @division")
+        params["division"] = division
+    if brand_col and brand is not None:
+        conditions.append(f"{quote_identifier(brand_col)} = @brand")
+        params["brand"] = brand
+
+    query = f"""
+        SELECT DISTINCT {campaign} AS campaign
+        FROM {quote_identifier(table)}
+        WHERE {" AND ".join(conditions)}
+    """
+    with timed(metrics, "bigquery_unique_campaigns") as stage:
+        df = read_query(query, project_id, params=params, backend=backend, cache=cache, metrics=metrics)
+        stage["rows"] = len(df)
+    # An empty result has no columns at all
+    if df.empty:
+        return []
+    return df["campaign"].astype(str).tolist()
+
+def write_mappings_to_bigquery(mappings_df, destination_table, project_id, replace=False, backend=None):
+    """
+    Writes a campaign -> franchise mappings table back to BigQuery as a
+    single bulk load job (appending unless replace=True).
+    """
+    write_dataframe(mappings_df, destination_table, project_id, replace=replace, backend=backend)
+
 # Main execution
 if __name__ == "__main__":
     project_id = "amer-mediadata-us-amer-pd"
@@ -32,9 +87,16 @@ if __name__ == "__main__":
         LIMIT 1000
     """
 
+    # Opt-in local result cache: set BQ_QUERY_CACHE_DIR to enable it
+    cache_dir = os.environ.get("BQ_QUERY_CACHE_DIR")
+    cache = QueryCache(cache_dir) if cache_dir else None
+    metrics = Instrumentation(logger=configure_json_log())
+
     print("Executing BigQuery...")
 
-    df = get_table_from_query(query, project_id)
+    df = get_table_from_query(query, project_id, cache=cache, metrics=metrics)
+    queries = metrics.summary()["queries"]
+    print(f"Query time: {queries['seconds']:.2f}s, bytes processed: {queries['bytes_processed']:,}")
 
     if df is not None:
         print("✅ Query executed successfully!")
@@ -0,0 +1,309 @@
+"""
+Headless franchise mapping for every Division/Brand pair in a master file.
+
+Example:
+    python batch_mapping.py --master master.xlsx --campaigns campaigns.csv \
+        --campaign-col Campaign --campaign-division-col Division --campaign-brand-col Brand \
+        --output mappings.csv --workers 8
+
+Campaigns can also be read straight from BigQuery (only the distinct campaign
+strings of each Division/Brand are transferred) and the mappings written back
+with one load job:
+    python batch_mapping.py --master master.xlsx --bq-project my-project \
+        --bq-campaign-table my-project.dataset.campaigns --campaign-col Campaign \
+        --campaign-division-col Division --campaign-brand-col Brand \
+        --bq-output-table my-project.dataset.campaign_franchise_mappings
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from automation_franchisemodel import get_unique_campaigns, write_mappings_to_bigquery
+from chunked_io import unique_values, unique_values_by_group
+from data_io import read_table
+from franchise_mapping import DEFAULT_MAX_WORKERS, map_campaigns, mappings_table
+from hierarchy import MasterHierarchy
+from mapping_cache import DEFAULT_CACHE_PATH, MappingCache
+from neighbors import MappingHistory
+from prematch import FranchiseMatcher
+
+
+def write_table(df, path):
+    """
+    Writes a DataFrame as CSV, Parquet or Excel depending on the file extension.
+    """
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    elif path.endswith(('.xlsx', '.xls')):
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def check_pair_columns(campaign_division_col, campaign_brand_col, all_brands=False):
+    """
+    Raises ValueError unless the campaign data has both division and brand
+    columns. Without them every campaign is mapped against every brand, which
+    only all_brands=True allows.
+    """
+    if all_brands or (campaign_division_col and campaign_brand_col):
+        return
+    missing = [name for name, col in (("division", campaign_division_col), ("brand", campaign_brand_col))
+               if not col]
+    raise ValueError(
+        f"No campaign {' or '.join(missing)} column: every campaign would be mapped against every brand. "
+        f"Pass the campaign division and brand columns, or all_brands=True (--all-brands) to do so anyway."
+    )
+
+
+def campaigns_for_pair(campaign_df, campaign_col, division, brand,
+                       campaign_division_col=None, campaign_brand_col=None, all_brands=False):
+    """
+    Unique campaigns to map for one pair. Without division/brand columns in the
+    campaign file, every campaign is mapped against every brand, which only
+    all_brands=True allows.
+    """
+    check_pair_columns(campaign_division_col, campaign_brand_col, all_brands)
+    rows = campaign_df
+    if campaign_division_col:
+        rows = rows[rows[campaign_division_col] == division]
+    if campaign_brand_col:
+        rows = rows[rows[campaign_brand_col] == brand]
+    return rows[campaign_col].dropna().unique().tolist()
+
+
+def file_campaign_source(campaign_df, campaign_col, campaign_division_col=None, campaign_brand_col=None,
+                         all_brands=False):
+    """
+    Campaign source reading unique campaigns per pair from a loaded file.
+    """
+    check_pair_columns(campaign_division_col, campaign_brand_col, all_brands)
+
+    def source(division, brand):
+        return campaigns_for_pair(campaign_df, campaign_col, division, brand,
+                                  campaign_division_col, campaign_brand_col, all_brands)
+    return source
+
+
+def chunked_file_campaign_source(path, campaign_col, campaign_division_col=None, campaign_brand_col=None,
+                                 all_brands=False):
+    """
+    Campaign source for large files: one chunked pass reads only the campaign
+    (and division/brand) columns and collects the unique campaigns per pair.
+    """
+    check_pair_columns(campaign_division_col, campaign_brand_col, all_brands)
+    group_cols = [col for col in (campaign_division_col, campaign_brand_col) if col]
+    if not group_cols:
+        campaigns = unique_values(path, campaign_col)
+        return lambda division, brand: campaigns
+
+    # Keys compared as text: CSV chunks are read as strings, Excel chunks are not
+    groups = {tuple(map(str, key)): campaigns
+              for key, campaigns in unique_values_by_group(path, campaign_col, group_cols).items()}
+
+    def source(division, brand):
+        key = tuple(str(value) for value, col in ((division, campaign_division_col), (brand, campaign_brand_col))
+                    if col)
+        return groups.get(key, [])
+    return source
+
+
+def bigquery_campaign_source(table, campaign_col, project_id, campaign_division_col=None,
+                             campaign_brand_col=None, backend=None, all_brands=False):
+    """
+    Campaign source running SELECT DISTINCT per pair in BigQuery.
+    """
+    check_pair_columns(campaign_division_col, campaign_brand_col, all_brands)
+
+    def source(division, brand):
+        return get_unique_campaigns(table, campaign_col, project_id,
+                                    division_col=campaign_division_col, division=division,
+                                    brand_col=campaign_brand_col, brand=brand, backend=backend)
+    return source
+
+
+def map_pair(client, division, brand, franchises_list, campaign_source, cache=None,
+             use_prematch=True, chunk_workers=DEFAULT_MAX_WORKERS, canonicalize=True, history=None):
+    """
+    Maps one Division/Brand pair and returns (its rows of the consolidated
+    table, the map_campaigns result), or (None, None) when the pair has no
+    campaigns.
+    """
+    campaigns = campaign_source(division, brand)
+    if not campaigns:
+        return None, None
+    mapping_result = map_campaigns(
+        client,
+        division,
+        brand,
+        franchises_list,
+        campaigns,
+        max_workers=chunk_workers,
+        cache=cache,
+        matcher=FranchiseMatcher(franchises_list) if use_prematch else None,
+        canonicalize=canonicalize,
+        history=history
+    )
+    table = mappings_table(mapping_result['mappings'], mapping_result['sources'], division, brand)
+    return table, mapping_result
+
+
+def run_batch(client, master_df, campaign_source, division_col, brand_col, franchise_col, workers=4,
+              chunk_workers=DEFAULT_MAX_WORKERS, cache=None, use_prematch=True, canonicalize=True,
+              history=None):
+    """
+    Maps every Division/Brand pair in parallel and returns one consolidated
+    mappings table plus a list of (division, brand, error) for failed pairs.
+
+    campaign_source(division, brand) returns the unique campaigns of a pair;
+    see file_campaign_source and bigquery_campaign_source.
+    """
+    pairs = list(MasterHierarchy(master_df, division_col, brand_col, franchise_col).pairs())
+    print(f"Mapping {len(pairs)} Division/Brand pairs with {workers} workers...")
+
+    tables = []
+    failures = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {}
+        for division, brand, franchises_list in pairs:
+            future = executor.submit(map_pair, client, division, brand, franchises_list, campaign_source,
+                                     cache=cache, use_prematch=use_prematch, chunk_workers=chunk_workers,
+                                     canonicalize=canonicalize, history=history)
+            futures[future] = (division, brand)
+
+        for done, future in enumerate(as_completed(futures), 1):
+            division, brand = futures[future]
+            try:
+                table, mapping_result = future.result()
+            except Exception as e:
+                failures.append((division, brand, str(e)))
+                print(f"❌ [{done}/{len(futures)}] {division} / {brand}: {e}")
+                continue
+            if table is None:
+                continue
+            tables.append(table)
+            for campaign in mapping_result['failed_campaigns']:
+                failures.append((division, brand, f"unmapped campaign: {campaign}"))
+            print(
+                f"✅ [{done}/{len(futures)}] {division} / {brand}: {len(table)} campaigns "
+                f"({mapping_result['cached_campaigns']} cached, "
+                f"{mapping_result['prematched_campaigns']} pre-matched, "
+                f"{mapping_result['history_campaigns']} from history, "
+                f"{mapping_result['model_campaigns']} sent to model)"
+            )
+
+    columns = ["Campaign", "Franchise", "Source", "Division", "Brand"]
+    consolidated = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=columns)
+    consolidated['MAPPED_DATE'] = pd.Timestamp.now()
+    return consolidated, failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Map campaigns to franchises for every Division/Brand pair.")
+    parser.add_argument("--master", required=True, help="Master file (CSV/Excel) with Division/Brand/Franchise")
+    parser.add_argument("--campaigns", help="Campaign data file (CSV/Excel)")
+    parser.add_argument("--chunked", action="store_true",
+                        help="Scan --campaigns in chunks, reading only the campaign/division/brand columns "
+                             "(for files too large to load)")
+    parser.add_argument("--output", help="Consolidated mappings output (.csv, .parquet or .xlsx)")
+    parser.add_argument("--division-col", default="Division")
+    parser.add_argument("--brand-col", default="Brand")
+    parser.add_argument("--franchise-col", default="Franchise")
+    parser.add_argument("--campaign-col", default="Campaign")
+    parser.add_argument("--campaign-division-col", help="Division column in the campaign data, to filter per pair")
+    parser.add_argument("--campaign-brand-col", help="Brand column in the campaign data, to filter per pair")
+    parser.add_argument("--all-brands", action="store_true",
+                        help="Without --campaign-division-col/--campaign-brand-col, map every campaign against "
+                             "every brand")
+    parser.add_argument("--bq-project", help="BigQuery project for --bq-campaign-table / --bq-output-table")
+    parser.add_argument("--bq-campaign-table", help="Read campaigns from this BigQuery table instead of a file")
+    parser.add_argument("--bq-output-table", help="Also write the mappings to this BigQuery table (one load job)")
+    parser.add_argument("--bq-replace", action="store_true", help="Replace --bq-output-table instead of appending")
+    parser.add_argument("--workers", type=int, default=4, help="Division/Brand pairs processed in parallel")
+    parser.add_argument("--chunk-workers", type=int, default=DEFAULT_MAX_WORKERS,
+                        help="Concurrent model calls per pair")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="SQLite mapping cache location")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the mapping cache")
+    parser.add_argument("--no-prematch", action="store_true", help="Send every campaign to the model")
+    parser.add_argument("--history", nargs="+", metavar="FILE",
+                        help="Earlier mappings files (Campaign/Franchise/Division/Brand) to learn from; "
+                             "confident nearest-neighbour matches skip the model")
+    parser.add_argument("--no-canonicalize", action="store_true",
+                        help="Send every campaign variant instead of one per canonical form")
+    parser.add_argument("--api-key", default=os.environ.get("ANTHROPIC_API_KEY"),
+                        help="Anthropic API key (defaults to ANTHROPIC_API_KEY)")
+    args = parser.parse_args(argv)
+    if not args.campaigns and not args.bq_campaign_table:
+        parser.error("one of --campaigns or --bq-campaign-table is required")
+    if not args.output and not args.bq_output_table:
+        parser.error("one of --output or --bq-output-table is required")
+    if (args.bq_campaign_table or args.bq_output_table) and not args.bq_project:
+        parser.error("--bq-project is required for BigQuery input or output")
+    if not args.all_brands and not (args.campaign_division_col and args.campaign_brand_col):
+        parser.error("--campaign-division-col and --campaign-brand-col are required to map each pair's own "
+                     "campaigns; pass --all-brands to map every campaign against every brand")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.api_key:
+        print("❌ No Anthropic API key: pass --api-key or set ANTHROPIC_API_KEY")
+        return 2
+
+    import anthropic
+    client = anthropic.Anthropic(api_key=args.api_key)
+    cache = None if args.no_cache else MappingCache(args.cache_path)
+    history = MappingHistory.from_files(args.history) if args.history else None
+    if history is not None:
+        print(f"Learned {history.stats()['campaigns']} campaigns from {len(args.history)} mapping files")
+
+    start = time.time()
+    master_df = read_table(args.master)
+    if args.bq_campaign_table:
+        campaign_source = bigquery_campaign_source(
+            args.bq_campaign_table, args.campaign_col, args.bq_project,
+            args.campaign_division_col, args.campaign_brand_col, all_brands=args.all_brands
+        )
+    elif args.chunked:
+        campaign_source = chunked_file_campaign_source(
+            args.campaigns, args.campaign_col,
+            args.campaign_division_col, args.campaign_brand_col, all_brands=args.all_brands
+        )
+    else:
+        campaign_source = file_campaign_source(
+            read_table(args.campaigns), args.campaign_col,
+            args.campaign_division_col, args.campaign_brand_col, all_brands=args.all_brands
+        )
+
+    consolidated, failures = run_batch(
+        client, master_df, campaign_source,
+        args.division_col, args.brand_col, args.franchise_col,
+        workers=args.workers,
+        chunk_workers=args.chunk_workers,
+        cache=cache,
+        use_prematch=not args.no_prematch,
+        canonicalize=not args.no_canonicalize,
+        history=history
+    )
+    if args.output:
+        write_table(consolidated, args.output)
+        print(f"\nWrote {len(consolidated)} mappings to {args.output}")
+    if args.bq_output_table:
+        write_mappings_to_bigquery(consolidated, args.bq_output_table, args.bq_project, replace=args.bq_replace)
+        print(f"\nLoaded {len(consolidated)} mappings into {args.bq_output_table}")
+    print(f"Finished in {time.time() - start:.1f}s")
+    if failures:
+        print(f"⚠️ {len(failures)} failures:")
+        for division, brand, error in failures[:20]:
+            print(f"  {division} / {brand}: {error}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
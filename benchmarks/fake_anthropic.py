@@ -0,0 +1,204 @@
+"""
+Deterministic stand-in for the Anthropic client used by the mapper.
+"""
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from franchise_mapping import MIN_CACHEABLE_TOKENS, estimate_tokens
+
+FRANCHISES_MARKER = "Available Franchises"
+CAMPAIGNS_MARKER = "Campaign Data to Analyze"
+
+NON_ALNUM_PATTERN = re.compile(r"[^a-z0-9]+")
+
+
+def _squash(text):
+    return NON_ALNUM_PATTERN.sub("", str(text).lower())
+
+
+def _json_after(text, marker):
+    """
+    Decodes the first JSON array that follows marker in text.
+    """
+    start = text.find(marker)
+    if start < 0:
+        return []
+    start = text.find("[", start)
+    if start < 0:
+        return []
+    value, _ = json.JSONDecoder().raw_decode(text, start)
+    return value
+
+
+def _cached_prefix(request_args):
+    """
+    Text of the system blocks up to the last one marked with cache_control.
+    """
+    system = request_args.get("system")
+    if not system or isinstance(system, str):
+        return ""
+    marked = [i for i, block in enumerate(system) if block.get("cache_control")]
+    if not marked:
+        return ""
+    return "\n".join(block.get("text", "") for block in system[:marked[-1] + 1])
+
+
+def _prompt_text(request_args):
+    parts = []
+    system = request_args.get("system")
+    if isinstance(system, str):
+        parts.append(system)
+    elif system:
+        parts.extend(block.get("text", "") for block in system)
+    for message in request_args.get("messages", []):
+        content = message["content"]
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get("text", "") for block in content)
+    return "\n".join(parts)
+
+
+class _Stream:
+    def __init__(self, client, message, chunk_chars):
+        self._client = client
+        self._message = message
+        self._chunk_chars = chunk_chars
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        text = self._message.content[0].text
+        usage = self._message.usage
+        self._client._sleep(usage.input_tokens, 0)
+        for start in range(0, len(text), self._chunk_chars):
+            piece = text[start:start + self._chunk_chars]
+            self._client._sleep(0, estimate_tokens(piece), base=False)
+            yield piece
+
+    def get_final_message(self):
+        return self._message
+
+
+class _Messages:
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, **request_args):
+        message = self._client._respond(request_args)
+        self._client._sleep(message.usage.input_tokens, message.usage.output_tokens)
+        return message
+
+    def stream(self, **request_args):
+        return _Stream(self._client, self._client._respond(request_args), self._client.stream_chunk_chars)
+
+
+class FakeAnthropicClient:
+    """
+    Answers mapping prompts like the model would, without the network.
+
+    Each campaign is mapped to the longest franchise whose letters and digits
+    appear in it (ignoring case and separators), otherwise "Unknown". Latency
+    is simulated as latency_seconds per call plus per-token costs, and
+    message.usage carries estimated input/output token counts. System prompt
+    blocks marked with cache_control are billed as cache writes the first time
+    and cache reads afterwards, as with prompt caching. Responses longer than
+    max_tokens are cut off mid-JSON, as the real API would.
+
+    Calls, token totals and raw response texts are recorded for reporting.
+    """
+
+    def __init__(self, latency_seconds=0.05, seconds_per_input_token=0.0, seconds_per_output_token=0.0,
+                 stream_chunk_chars=64, sleep=time.sleep):
+        self.latency_seconds = latency_seconds
+        self.seconds_per_input_token = seconds_per_input_token
+        self.seconds_per_output_token = seconds_per_output_token
+        self.stream_chunk_chars = stream_chunk_chars
+        self.messages = _Messages(self)
+        self._sleep_func = sleep
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.input_tokens = 0
+            self.output_tokens = 0
+            self.cache_read_tokens = 0
+            self.cache_write_tokens = 0
+            self._cached_prefixes = set()
+            self.responses = []
+
+    def _sleep(self, input_tokens, output_tokens, base=True):
+        seconds = (self.latency_seconds if base else 0.0) \
+            + input_tokens * self.seconds_per_input_token \
+            + output_tokens * self.seconds_per_output_token
+        if seconds > 0:
+            self._sleep_func(seconds)
+
+    def _respond(self, request_args):
+        prompt = _prompt_text(request_args)
+        franchises = _json_after(prompt, FRANCHISES_MARKER)
+        campaigns = _json_after(prompt, CAMPAIGNS_MARKER)
+
+        # Longest franchise first so "Effaclar Duo" wins over "Effaclar"
+        keys = sorted(((_squash(f), f) for f in franchises if _squash(f)), key=lambda item: -len(item[0]))
+        mappings = {}
+        for campaign in campaigns:
+            squashed = _squash(campaign)
+            mappings[campaign] = next((name for key, name in keys if key in squashed), "Unknown")
+
+        counts = {}
+        for franchise in mappings.values():
+            counts[franchise] = counts.get(franchise, 0) + 1
+        text = json.dumps({
+            "mappings": mappings,
+            "summary": {
+                "total_campaigns": len(mappings),
+                "franchises_identified": counts,
+                "confidence": "high",
+            },
+        }, indent=2)
+
+        output_tokens = estimate_tokens(text)
+        max_tokens = request_args.get("max_tokens")
+        stop_reason = "end_turn"
+        if max_tokens and output_tokens > max_tokens:
+            text = text[:max_tokens * len(text) // output_tokens]
+            output_tokens = max_tokens
+            stop_reason = "max_tokens"
+
+        prefix = _cached_prefix(request_args)
+        prefix_tokens = estimate_tokens(prefix) if prefix else 0
+        if prefix_tokens < MIN_CACHEABLE_TOKENS:
+            prefix_tokens = 0
+        with self._lock:
+            cache_hit = bool(prefix_tokens) and prefix in self._cached_prefixes
+            if prefix_tokens:
+                self._cached_prefixes.add(prefix)
+            usage = SimpleNamespace(
+                input_tokens=estimate_tokens(prompt) - prefix_tokens,
+                output_tokens=output_tokens,
+                cache_read_input_tokens=prefix_tokens if cache_hit else 0,
+                cache_creation_input_tokens=0 if cache_hit else prefix_tokens,
+            )
+            self.calls += 1
+            self.input_tokens += usage.input_tokens
+            self.output_tokens += usage.output_tokens
+            self.cache_read_tokens += usage.cache_read_input_tokens
+            self.cache_write_tokens += usage.cache_creation_input_tokens
+            self.responses.append(text)
+        return SimpleNamespace(
+            content=[SimpleNamespace(type="text", text=text)],
+            usage=usage,
+            stop_reason=stop_reason,
+            model=request_args.get("model"),
+        )
@@ -0,0 +1,311 @@
+"""
+Times each stage of the mapping flow on synthetic data and records the results.
+
+    python -m benchmarks.run_benchmarks --sizes 1000,100000,1000000
+
+Every run appends one JSON record per size to --results. With --check the run
+exits non-zero when a stage is slower than the median of earlier runs with the
+same settings by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from automation_franchisemodel import get_table_from_query, get_unique_campaigns
+from benchmarks.fake_anthropic import FakeAnthropicClient
+from benchmarks.synthetic import generate_campaigns, generate_master
+from bigquery_io import LocalBackend, quote_identifier
+from data_io import HAS_PYARROW, read_upload
+from exports import EXCEL_MAX_ROWS, to_csv_bytes, to_excel_bytes, to_parquet_bytes
+from canonicalize import CampaignClusters
+from franchise_mapping import (apply_mappings, build_request, chunk_campaigns, map_campaigns,
+                               parse_response_tolerant, StreamingMappingParser)
+from hierarchy import MasterHierarchy
+from prematch import FranchiseMatcher
+
+DEFAULT_SIZES = "1000,10000,100000"
+DEFAULT_RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+DEFAULT_EXCEL_MAX_ROWS = 200000
+DEFAULT_TOLERANCE = 0.25
+# Stages faster than this are too noisy to flag
+MIN_REGRESSION_SECONDS = 0.05
+# Earlier runs used as the baseline for --check
+BASELINE_RUNS = 5
+
+BQ_PROJECT = "benchmark-project"
+BQ_TABLE = "benchmark-project.marketing.campaigns"
+
+
+class StageTimer:
+    """
+    Collects wall-clock seconds and row counts per named stage.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def __call__(self, name, rows=None):
+        return _Stage(self, name, rows)
+
+
+class _Stage:
+    def __init__(self, timer, name, rows):
+        self.timer = timer
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        stage = {"seconds": round(seconds, 6)}
+        if self.rows:
+            stage["rows"] = self.rows
+            stage["rows_per_second"] = round(self.rows / seconds, 1) if seconds else None
+        self.timer.stages[self.name] = stage
+        return False
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(n_rows, args):
+    """
+    Runs every stage once for a campaign file of n_rows rows.
+    """
+    timer = StageTimer()
+    master_df = generate_master(
+        n_divisions=args.divisions, brands_per_division=args.brands,
+        franchises_per_brand=args.franchises, seed=args.seed,
+    )
+    campaign_df = generate_campaigns(master_df, n_rows, unique_ratio=args.unique_ratio, seed=args.seed)
+    master_bytes = to_csv_bytes(master_df)
+    campaign_bytes = to_csv_bytes(campaign_df)
+
+    # Step 1-2: uploads
+    with timer("parse_master", rows=len(master_df)):
+        master_df = read_upload(master_bytes, "master.csv")
+    with timer("parse_campaigns", rows=n_rows):
+        campaign_df = read_upload(campaign_bytes, "campaigns.csv")
+
+    # Step 3-4: Division/Brand selection; the busiest pair stands in for the user's choice
+    with timer("filter", rows=n_rows):
+        hierarchy = MasterHierarchy(master_df, "Division", "Brand", "Franchise")
+        division, brand = campaign_df.groupby(["Division", "Brand"], observed=True).size().idxmax()
+        franchises_list = hierarchy.franchises_for(division, brand)
+        pair_df = campaign_df[(campaign_df["Division"] == division) & (campaign_df["Brand"] == brand)]
+        campaigns = [str(c) for c in pair_df["Campaign"].dropna().unique().tolist()]
+
+    # Step 5: pre-match, prompts, model calls and response parsing
+    if args.prematch:
+        with timer("prematch", rows=len(campaigns)):
+            FranchiseMatcher(franchises_list).resolve(campaigns)
+
+    model_campaigns = campaigns
+    if args.canonicalize:
+        with timer("canonicalize", rows=len(campaigns)):
+            model_campaigns = CampaignClusters(campaigns, franchises_list).representatives
+
+    with timer("prompt_build", rows=len(model_campaigns)):
+        chunks = chunk_campaigns(model_campaigns, franchises_list)
+        for chunk in chunks:
+            build_request(division, brand, franchises_list, chunk)
+
+    client = FakeAnthropicClient(
+        latency_seconds=args.latency,
+        seconds_per_input_token=args.seconds_per_input_token,
+        seconds_per_output_token=args.seconds_per_output_token,
+    )
+    with timer("model_call", rows=len(campaigns)):
+        result = map_campaigns(client, division, brand, franchises_list, campaigns,
+                               max_workers=args.chunk_workers, stream=args.stream,
+                               canonicalize=args.canonicalize)
+
+    response_bytes = sum(len(text) for text in client.responses)
+    with timer("json_parse", rows=len(campaigns)):
+        for text in client.responses:
+            parse_response_tolerant(text)
+    with timer("stream_parse", rows=len(campaigns)):
+        for text in client.responses:
+            parser = StreamingMappingParser()
+            for start in range(0, len(text), client.stream_chunk_chars):
+                parser.feed(text[start:start + client.stream_chunk_chars])
+
+    # Step 7: apply the mapping to every row of the pair
+    with timer("apply", rows=len(pair_df)):
+        df_cleaned = apply_mappings(pair_df, "Campaign", result["mappings"], result["sources"],
+                                    division=division, brand=brand)
+
+    # Step 8: exports
+    with timer("export_csv", rows=len(df_cleaned)):
+        to_csv_bytes(df_cleaned)
+    if len(df_cleaned) <= min(args.excel_max_rows, EXCEL_MAX_ROWS - 1):
+        with timer("export_excel", rows=len(df_cleaned)):
+            to_excel_bytes(df_cleaned, sheet_name="Mapped Data")
+    if HAS_PYARROW:
+        with timer("export_parquet", rows=len(df_cleaned)):
+            to_parquet_bytes(df_cleaned)
+
+    # BigQuery reads against the local stand-in
+    backend = LocalBackend()
+    backend.load_table(BQ_TABLE, campaign_df.astype({"Date": str}))
+    with timer("bq_read_table", rows=n_rows):
+        get_table_from_query(f"SELECT * FROM {quote_identifier(BQ_TABLE)}", BQ_PROJECT, backend=backend)
+    with timer("bq_unique_campaigns", rows=n_rows):
+        get_unique_campaigns(BQ_TABLE, "Campaign", BQ_PROJECT, division_col="Division", division=division,
+                             brand_col="Brand", brand=brand, backend=backend)
+
+    return {
+        "rows": n_rows,
+        "pair_rows": len(pair_df),
+        "unique_campaigns": len(campaigns),
+        "franchises": len(franchises_list),
+        "model": {
+            "calls": client.calls,
+            "campaigns_sent": len(model_campaigns),
+            "input_tokens": client.input_tokens,
+            "output_tokens": client.output_tokens,
+            "cache_read_tokens": client.cache_read_tokens,
+            "cache_write_tokens": client.cache_write_tokens,
+            "response_bytes": response_bytes,
+            "failed_campaigns": len(result["failed_campaigns"]),
+        },
+        "stages": timer.stages,
+    }
+
+
+def settings_key(args):
+    """
+    Settings that must match for two runs to be comparable.
+    """
+    return {
+        "divisions": args.divisions,
+        "brands": args.brands,
+        "franchises": args.franchises,
+        "unique_ratio": args.unique_ratio,
+        "seed": args.seed,
+        "latency": args.latency,
+        "seconds_per_input_token": args.seconds_per_input_token,
+        "seconds_per_output_token": args.seconds_per_output_token,
+        "chunk_workers": args.chunk_workers,
+        "stream": args.stream,
+        "prematch": args.prematch,
+        "canonicalize": args.canonicalize,
+    }
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_regressions(record, history, tolerance=DEFAULT_TOLERANCE):
+    """
+    Returns [(stage, seconds, baseline_seconds)] for stages slower than the
+    median of the last BASELINE_RUNS comparable records by more than tolerance.
+    """
+    previous = [
+        r for r in history
+        if r["rows"] == record["rows"] and r["settings"] == record["settings"]
+    ][-BASELINE_RUNS:]
+    regressions = []
+    for stage, timing in record["stages"].items():
+        samples = [r["stages"][stage]["seconds"] for r in previous if stage in r["stages"]]
+        if not samples:
+            continue
+        baseline = statistics.median(samples)
+        seconds = timing["seconds"]
+        if seconds > baseline * (1 + tolerance) and seconds - baseline > MIN_REGRESSION_SECONDS:
+            regressions.append((stage, seconds, baseline))
+    return regressions
+
+
+def print_record(record):
+    model = record["model"]
+    print(f"\n{record['rows']:,} rows ({record['pair_rows']:,} in pair, "
+          f"{record['unique_campaigns']:,} unique campaigns, {model['campaigns_sent']:,} sent in "
+          f"{model['calls']} model calls, {model['input_tokens']:,} input + {model['cache_read_tokens']:,} "
+          f"cached + {model['output_tokens']:,} output tokens)")
+    for stage, timing in record["stages"].items():
+        rate = timing.get("rows_per_second")
+        rate = f"{rate:>14,.0f} rows/s" if rate else ""
+        print(f"  {stage:<22}{timing['seconds']:>10.3f}s {rate}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the campaign mapping flow on synthetic data.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="Comma-separated campaign file row counts (1000 to 10000000)")
+    parser.add_argument("--unique-ratio", type=float, default=0.05, help="Unique campaigns per campaign row")
+    parser.add_argument("--divisions", type=int, default=4)
+    parser.add_argument("--brands", type=int, default=10, help="Brands per division")
+    parser.add_argument("--franchises", type=int, default=12, help="Franchises per brand")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per model call")
+    parser.add_argument("--seconds-per-input-token", type=float, default=0.0)
+    parser.add_argument("--seconds-per-output-token", type=float, default=0.0)
+    parser.add_argument("--chunk-workers", type=int, default=4, help="Concurrent model calls")
+    parser.add_argument("--stream", action="store_true", help="Stream model responses")
+    parser.add_argument("--no-prematch", dest="prematch", action="store_false", help="Skip the pre-match stage")
+    parser.add_argument("--no-canonicalize", dest="canonicalize", action="store_false",
+                        help="Send every campaign variant to the model")
+    parser.add_argument("--excel-max-rows", type=int, default=DEFAULT_EXCEL_MAX_ROWS,
+                        help="Skip the Excel export above this many rows")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_PATH, help="JSON Lines file results are appended to")
+    parser.add_argument("--no-record", action="store_true", help="Do not append results")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 if a stage regressed")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown over the baseline median (0.25 = 25%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    history = load_history(args.results)
+    run_info = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.node(),
+        "settings": settings_key(args),
+    }
+
+    regressed = False
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        record = {**run_info, **run_size(size, args)}
+        print_record(record)
+
+        regressions = find_regressions(record, history, args.tolerance)
+        for stage, seconds, baseline in regressions:
+            regressed = True
+            print(f"  ⚠️ {stage} regressed: {seconds:.3f}s vs {baseline:.3f}s baseline")
+
+        if not args.no_record:
+            with open(args.results, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+    return 1 if args.check and regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
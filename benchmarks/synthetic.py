@@ -0,0 +1,123 @@
+"""
+Synthetic master and campaign files shaped like the real Division/Brand/Franchise data.
+"""
+import numpy as np
+import pandas as pd
+
+DIVISIONS = ["Consumer Products", "Luxe", "Dermatological Beauty", "Professional Products",
+             "Active Cosmetics", "Salon", "Travel Retail", "Digital"]
+PLATFORMS = ["FB", "IG", "TT", "YT", "PIN", "SNAP", "DV360", "TTD", "AMZN", "GOOG"]
+OBJECTIVES = ["Awareness", "Consideration", "Conversion", "Launch", "Always_On", "Promo"]
+
+SYLLABLES = ["ef", "fa", "clar", "to", "le", "ri", "ane", "an", "the", "lios", "ci", "ca", "plast",
+             "hy", "alu", "ron", "vi", "ta", "lift", "re", "vive", "elvi", "ve", "glow", "pure",
+             "mat", "lux", "sol", "aqua", "nova", "derm", "ultra", "bio", "max"]
+
+
+def _name(rng, min_syllables=2, max_syllables=4):
+    count = rng.integers(min_syllables, max_syllables + 1)
+    return "".join(rng.choice(SYLLABLES, size=count)).capitalize()
+
+
+def _unique_names(rng, count, used, **kwargs):
+    names = []
+    while len(names) < count:
+        name = _name(rng, **kwargs)
+        if name not in used:
+            used.add(name)
+            names.append(name)
+    return names
+
+
+def generate_master(n_divisions=4, brands_per_division=10, franchises_per_brand=12, skus_per_franchise=5,
+                    seed=0):
+    """
+    SKU-level master file with Division, Brand, Franchise, SKU, Franchise Type
+    and Launch Date columns.
+    """
+    rng = np.random.default_rng(seed)
+    used = set()
+    rows = []
+    for division in DIVISIONS[:n_divisions] + [f"Division {i}" for i in range(n_divisions - len(DIVISIONS))]:
+        for brand in _unique_names(rng, brands_per_division, used, min_syllables=2, max_syllables=3):
+            franchises = _unique_names(rng, franchises_per_brand, used)
+            # Some franchises are two words ("Effaclar Duo" style)
+            franchises = [
+                f"{name} {_name(rng, 1, 2)}" if rng.random() < 0.3 else name
+                for name in franchises
+            ]
+            for franchise in franchises:
+                innovation = rng.random() < 0.25
+                launch = pd.Timestamp("2024-01-01") + pd.Timedelta(days=int(rng.integers(0, 900))) if innovation \
+                    else pd.Timestamp("2005-01-01") + pd.Timedelta(days=int(rng.integers(0, 5000)))
+                for sku in range(skus_per_franchise):
+                    rows.append({
+                        "Division": division,
+                        "Brand": brand,
+                        "Franchise": franchise,
+                        "SKU": f"{brand[:3].upper()}-{franchise[:4].upper()}-{sku:03d}",
+                        "Franchise Type": "Innovation" if innovation else "Core",
+                        "Launch Date": launch,
+                    })
+    return pd.DataFrame(rows)
+
+
+def _campaign_name(rng, brand, franchise):
+    """
+    Realistic campaign string: brand abbreviation, franchise (sometimes
+    abbreviated, compacted or misspelled, sometimes absent), and noise tokens.
+    """
+    abbreviation = "".join(word[0] for word in brand.split()).upper() or brand[:3].upper()
+    roll = rng.random()
+    if franchise is None or roll < 0.1:
+        subject = rng.choice(["Brand_Awareness", "Masterbrand", "Holiday_Gifting", "Retailer_CoOp"])
+    elif roll < 0.2 and len(franchise) > 5:
+        # Dropped letter typo
+        cut = int(rng.integers(1, len(franchise) - 1))
+        subject = franchise[:cut] + franchise[cut + 1:]
+    elif roll < 0.3:
+        subject = franchise.replace(" ", "")
+    else:
+        subject = franchise.replace(" ", "_")
+    return "_".join([
+        abbreviation,
+        subject,
+        f"Q{rng.integers(1, 5)}",
+        str(rng.integers(2022, 2026)),
+        str(rng.choice(PLATFORMS)),
+        str(rng.choice(OBJECTIVES)),
+        f"v{rng.integers(1, 6)}",
+    ])
+
+
+def generate_campaigns(master_df, n_rows, unique_ratio=0.05, seed=0, division_col="Division",
+                       brand_col="Brand", franchise_col="Franchise"):
+    """
+    Campaign file with n_rows rows drawn from about n_rows * unique_ratio
+    unique campaign strings, plus Division, Brand, Date, Spend and Impressions.
+    """
+    rng = np.random.default_rng(seed)
+    pairs = master_df[[division_col, brand_col, franchise_col]].drop_duplicates().to_numpy()
+    n_unique = max(1, min(n_rows, int(n_rows * unique_ratio)))
+
+    picks = pairs[rng.integers(0, len(pairs), size=n_unique)]
+    names = []
+    seen = set()
+    for division, brand, franchise in picks:
+        name = _campaign_name(rng, brand, franchise)
+        while name in seen:
+            name = f"{name}_{rng.integers(0, 10 ** 6)}"
+        seen.add(name)
+        names.append(name)
+
+    # Rows reference unique campaigns by code, so 10M rows stay cheap to build
+    codes = rng.integers(0, n_unique, size=n_rows)
+    start = np.datetime64("2022-01-01")
+    return pd.DataFrame({
+        "Campaign": pd.Categorical.from_codes(codes, categories=names),
+        "Division": pd.Categorical(picks[codes, 0]),
+        "Brand": pd.Categorical(picks[codes, 1]),
+        "Date": start + rng.integers(0, 4 * 365, size=n_rows).astype("timedelta64[D]"),
+        "Spend": rng.gamma(2.0, 150.0, size=n_rows).round(2),
+        "Impressions": rng.integers(100, 200000, size=n_rows),
+    })
@@ -0,0 +1,372 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Rows fetched per page / record batch
+DEFAULT_PAGE_SIZE = 100000
+
+DEFAULT_QUERY_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".bigquery_query_cache")
+DEFAULT_QUERY_CACHE_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_QUERY_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Quoted strings and identifiers are kept verbatim when normalizing SQL
+SQL_QUOTED_PATTERN = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)""")
+
+
+def _parameter_value(value):
+    """
+    (BigQuery type, plain Python value) of a query parameter; numpy scalars,
+    e.g. values taken from a DataFrame, keep their numeric type.
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool):
+        return "BOOL", value
+    if isinstance(value, int):
+        return "INT64", value
+    if isinstance(value, float):
+        return "FLOAT64", value
+    return "STRING", value
+
+
+def _query_parameters(params):
+    """
+    Converts {name: value} into BigQuery query parameters (@name in SQL).
+    """
+    from google.cloud import bigquery
+
+    parameters = []
+    for name, value in (params or {}).items():
+        if isinstance(value, (list, tuple, np.ndarray)):
+            items = [_parameter_value(item) for item in value]
+            item_type = items[0][0] if items else "STRING"
+            parameters.append(bigquery.ArrayQueryParameter(name, item_type, [item for _, item in items]))
+        else:
+            parameters.append(bigquery.ScalarQueryParameter(name, *_parameter_value(value)))
+    return parameters
+
+
+class BigQueryBackend:
+    """
+    Runs queries on BigQuery, reusing one client per project across calls.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, project_id):
+        with self._lock:
+            if project_id not in self._clients:
+                from google.cloud import bigquery
+                self._clients[project_id] = bigquery.Client(project=project_id)
+            return self._clients[project_id]
+
+    def _run(self, query, project_id, page_size, params, metrics, as_arrow):
+        from google.cloud import bigquery
+
+        start = time.perf_counter()
+        job_config = bigquery.QueryJobConfig(query_parameters=_query_parameters(params))
+        query_job = self.client(project_id).query(query, job_config=job_config)
+        rows = query_job.result(page_size=page_size)
+        pages = rows.to_arrow_iterable() if as_arrow else rows.to_dataframe_iterable()
+        count = 0
+        try:
+            for page in pages:
+                count += len(page)
+                yield page
+        finally:
+            if metrics is not None:
+                metrics.record_query(time.perf_counter() - start, rows=count,
+                                     bytes_processed=query_job.total_bytes_processed,
+                                     cache_hit=query_job.cache_hit, backend="bigquery")
+
+    def iter_arrow(self, query, project_id, page_size=DEFAULT_PAGE_SIZE, params=None, metrics=None):
+        """
+        Yields the result as pyarrow RecordBatches, one page at a time.
+        """
+        yield from self._run(query, project_id, page_size, params, metrics, as_arrow=True)
+
+    def iter_dataframes(self, query, project_id, page_size=DEFAULT_PAGE_SIZE, params=None, metrics=None):
+        """
+        Yields the result as DataFrame chunks, one page at a time.
+        """
+        yield from self._run(query, project_id, page_size, params, metrics, as_arrow=False)
+
+    def load_dataframe(self, df, table, project_id, replace=False):
+        """
+        Writes a DataFrame to a table with a single load job.
+        """
+        from google.cloud import bigquery
+
+        job_config = bigquery.LoadJobConfig(
+            write_disposition="WRITE_TRUNCATE" if replace else "WRITE_APPEND"
+        )
+        self.client(project_id).load_table_from_dataframe(df, table, job_config=job_config).result()
+
+
+class LocalBackend:
+    """
+    File-based stand-in for BigQuery backed by a SQLite database.
+
+    Tables are stored under their full BigQuery names, so the same SQL
+    (backtick-quoted `project.dataset.table` names, @name parameters) runs
+    unchanged as long as it sticks to the SQL subset both engines share.
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_files(cls, tables, path=":memory:"):
+        """
+        Builds a stand-in from {bigquery_table_name: csv_or_parquet_path}.
+        """
+        backend = cls(path)
+        for table, file_path in tables.items():
+            if str(file_path).endswith(".parquet"):
+                df = pd.read_parquet(file_path)
+            else:
+                df = pd.read_csv(file_path)
+            backend.load_table(table, df)
+        return backend
+
+    def load_table(self, table, df, if_exists="replace"):
+        """
+        Creates or replaces a table from a DataFrame.
+        """
+        with self._lock:
+            df.to_sql(table, self._conn, if_exists=if_exists, index=False)
+
+    def load_dataframe(self, df, table, project_id=None, replace=False):
+        self.load_table(table, df, if_exists="replace" if replace else "append")
+
+    def iter_dataframes(self, query, project_id=None, page_size=DEFAULT_PAGE_SIZE, params=None, metrics=None):
+        start = time.perf_counter()
+        with self._lock:
+            cursor = self._conn.execute(query, params or {})
+        columns = [col[0] for col in cursor.description]
+        count = 0
+        try:
+            while True:
+                with self._lock:
+                    rows = cursor.fetchmany(page_size)
+                if not rows:
+                    break
+                count += len(rows)
+                yield pd.DataFrame.from_records(rows, columns=columns)
+            if not count:
+                yield pd.DataFrame(columns=columns)
+        finally:
+            if metrics is not None:
+                metrics.record_query(time.perf_counter() - start, rows=count, backend="local")
+
+    def iter_arrow(self, query, project_id=None, page_size=DEFAULT_PAGE_SIZE, params=None, metrics=None):
+        import pyarrow as pa
+
+        for chunk in self.iter_dataframes(query, project_id, page_size, params, metrics):
+            yield pa.RecordBatch.from_pandas(chunk, preserve_index=False)
+
+
+def normalize_query(query):
+    """
+    Collapses whitespace and drops a trailing semicolon outside quoted
+    strings, so formatting-only differences share one cache entry.
+    """
+    parts = SQL_QUOTED_PATTERN.split(query.strip().rstrip(";").strip())
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part)
+        for i, part in enumerate(parts)
+    )
+
+
+class QueryCache:
+    """
+    Opt-in on-disk cache of query results as Parquet files.
+
+    Entries are keyed by normalized query text, project and parameters, expire
+    after ttl_seconds, and the least recently read files are evicted once the
+    cache grows past max_bytes.
+    """
+
+    def __init__(self, directory=DEFAULT_QUERY_CACHE_DIR, ttl_seconds=DEFAULT_QUERY_CACHE_TTL_SECONDS,
+                 max_bytes=DEFAULT_QUERY_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, query, project_id, params=None):
+        payload = json.dumps([project_id, normalize_query(query), params or {}], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def get(self, query, project_id, params=None):
+        """
+        Returns the cached DataFrame, or None on a miss or expired entry.
+        """
+        path = self._path(self.key(query, project_id, params))
+        with self._lock:
+            try:
+                created = os.path.getmtime(path)
+            except OSError:
+                self.misses += 1
+                return None
+            if time.time() - created > self.ttl_seconds:
+                os.remove(path)
+                self.misses += 1
+                return None
+            # Access time drives LRU eviction; mtime keeps the creation time for the TTL
+            os.utime(path, (time.time(), created))
+        # Read outside the lock so lookups do not wait on each other's reads
+        try:
+            df = pd.read_parquet(path)
+        except FileNotFoundError:
+            # Evicted or cleared by another thread since the check above
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return df
+
+    def put(self, query, project_id, df, params=None):
+        """
+        Stores a query result and evicts entries past the TTL or size limit.
+        """
+        path = self._path(self.key(query, project_id, params))
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        with self._lock:
+            os.replace(tmp_path, path)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries():
+                os.remove(entry[0])
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(entry[3] for entry in entries),
+        }
+
+    def _entries(self):
+        """
+        Returns [(path, accessed, created, size)] for every cached file.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".parquet"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((path, stat.st_atime, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _evict(self):
+        now = time.time()
+        entries = []
+        for entry in self._entries():
+            if now - entry[2] > self.ttl_seconds:
+                os.remove(entry[0])
+            else:
+                entries.append(entry)
+        total = sum(entry[3] for entry in entries)
+        for path, _, _, size in sorted(entries, key=lambda entry: entry[1]):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Process-wide BigQuery backend, so clients are pooled across callers.
+    """
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is None:
+            _default_backend = BigQueryBackend()
+        return _default_backend
+
+
+def read_query_batches(query, project_id, page_size=DEFAULT_PAGE_SIZE, params=None, backend=None, metrics=None):
+    """
+    Streams a query result as pyarrow RecordBatches.
+    """
+    return (backend or get_backend()).iter_arrow(query, project_id, page_size=page_size, params=params,
+                                                 metrics=metrics)
+
+
+def read_query_chunks(query, project_id, page_size=DEFAULT_PAGE_SIZE, params=None, backend=None, metrics=None):
+    """
+    Streams a query result as DataFrame chunks.
+    """
+    return (backend or get_backend()).iter_dataframes(query, project_id, page_size=page_size, params=params,
+                                                      metrics=metrics)
+
+
+def quote_identifier(name):
+    """
+    Backtick-quotes a table or column name for SQL built from user input.
+    """
+    name = str(name)
+    if not name or "`" in name or "\\" in name:
+        raise ValueError(f"Invalid SQL identifier: {name!r}")
+    return f"`{name}`"
+
+
+def write_dataframe(df, table, project_id, replace=False, backend=None):
+    """
+    Writes a DataFrame to a table in one bulk load job.
+    """
+    (backend or get_backend()).load_dataframe(df, table, project_id, replace=replace)
+
+
+def read_query(query, project_id, params=None, backend=None, cache=None, metrics=None):
+    """
+    Reads a whole query result into one DataFrame, going through a
+    QueryCache when one is given. Query time, rows, bytes processed and cache
+    hits are recorded on metrics (an Instrumentation) when one is given.
+    """
+    if cache is not None:
+        df = cache.get(query, project_id, params)
+        if metrics is not None:
+            metrics.record_cache("query_cache", int(df is not None), int(df is None))
+        if df is not None:
+            return df
+
+    chunks = list(read_query_chunks(query, project_id, params=params, backend=backend, metrics=metrics))
+    if not chunks:
+        df = pd.DataFrame()
+    else:
+        df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+    if cache is not None:
+        cache.put(query, project_id, df, params)
+    return df
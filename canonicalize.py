@@ -0,0 +1,120 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from prematch import normalize_series
+
+# Dates are removed from the raw text, before separators are normalized away.
+# "_" counts as a separator here, which \b would treat as part of a word
+DATE_PATTERN = r"(?<![0-9A-Za-z])\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}(?![0-9A-Za-z])"
+
+MONTHS = (r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+          r"|sept?(?:ember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?")
+
+PLATFORMS = ("fb|facebook|ig|instagram|meta|tt|tiktok|yt|youtube|pin|pinterest|snap|snapchat|twitter|reddit"
+             "|dv360|ttd|tradedesk|amzn|amazon|goog|google|pmax|sem|search|social|display|programmatic"
+             "|ctv|ott|olv|hulu|roku")
+PLACEMENTS = "feed|story|stories|reel|reels|preroll|instream|banner|carousel|static|video|native"
+OBJECTIVES = (r"awareness|consideration|conversions?|traffic|reach|engagement|promo|retargeting|prospecting"
+              r"|launch|always\s?on|evergreen|bau")
+
+# Tokens (in normalized, space-separated text) that carry no franchise
+# signal: quarters, years and long numbers, months, flight/phase/week numbers,
+# versions, alphanumeric IDs, ad sizes and durations, platforms, placements
+# and campaign objectives
+NOISE_TOKENS = [
+    r"q[1-4]", r"h[12]", r"fq[1-4]", r"fy\d{2,4}",
+    r"\d{4,}",
+    rf"(?:{MONTHS})\d{{0,4}}",
+    r"(?:flight|phase|wave|burst|week|wk|fl|ph|w|f)\s?\d{1,3}",
+    r"(?:version|ver|v)\s?\d{1,3}",
+    r"[a-z]{1,4}\d{3,}",
+    r"\d{2,4}x\d{2,4}", r"\d{1,3}s",
+    PLATFORMS, PLACEMENTS, OBJECTIVES,
+]
+
+
+def _noise_pattern(protected):
+    """
+    One regex matching any whole noise token, except the protected ones.
+    """
+    guard = ""
+    if protected:
+        guard = "(?!(?:" + "|".join(sorted(map(re.escape, protected), key=len, reverse=True)) + r")(?:\s|$))"
+    return re.compile(r"(?:^|(?<=\s))" + guard + "(?:" + "|".join(NOISE_TOKENS) + r")(?=\s|$)")
+
+
+def protected_tokens(franchises_list):
+    """
+    Words of the franchise names, which are never stripped as noise.
+    """
+    tokens = set()
+    for name in normalize_series(list(franchises_list or [])):
+        tokens.update(name.split())
+    return tokens
+
+
+def canonicalize_series(campaigns, franchises_list=None):
+    """
+    Canonical form of each campaign: normalized text with noise tokens
+    (dates, quarters, flight IDs, versions, platform and placement codes)
+    removed. Campaigns made only of noise keep their full normalized text.
+    """
+    raw = pd.Series(campaigns, dtype="object").astype(str)
+    normalized = normalize_series(raw.str.replace(DATE_PATTERN, " ", regex=True))
+    canonical = (
+        normalized.str.replace(_noise_pattern(protected_tokens(franchises_list)), " ", regex=True)
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+    fallback = normalize_series(raw)
+    return canonical.where(canonical != "", fallback).set_axis(raw.index)
+
+
+def canonicalize_campaign(campaign, franchises_list=None):
+    return canonicalize_series([campaign], franchises_list).iloc[0]
+
+
+class CampaignClusters:
+    """
+    Campaigns grouped by canonical form.
+
+    Only representatives (the first campaign of each cluster, in input order)
+    need to be mapped; expand() and fan_out() copy their franchises to every
+    member of the cluster.
+    """
+
+    def __init__(self, campaigns, franchises_list=None):
+        campaigns = [str(c) for c in campaigns]
+        codes, keys = pd.factorize(canonicalize_series(campaigns, franchises_list))
+        _, first = np.unique(codes, return_index=True)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+
+        self.keys = {}
+        self.members = {}
+        for code in np.argsort(first):
+            members = [campaigns[i] for i in order[bounds[code]:bounds[code + 1]]]
+            self.members[members[0]] = members
+            self.keys[members[0]] = keys[code]
+        self.representatives = list(self.members)
+        self.size = len(campaigns)
+
+    def __len__(self):
+        return len(self.representatives)
+
+    def members_of(self, representatives):
+        """
+        Every member of the given representatives' clusters.
+        """
+        return [member for rep in representatives for member in self.members.get(rep, [rep])]
+
+    def expand(self, pairs):
+        """
+        Fans (representative, franchise) pairs out to every cluster member.
+        """
+        return [(member, franchise) for rep, franchise in pairs for member in self.members.get(rep, [rep])]
+
+    def fan_out(self, mappings):
+        return dict(self.expand(mappings.items()))
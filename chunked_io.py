@@ -0,0 +1,271 @@
+"""
+Bounded-memory reading and mapping of large campaign exports.
+
+Only the header is read up front, the campaign column (plus any grouping
+columns) is scanned in chunks to collect unique campaigns, and the mapping is
+applied to the full file chunk by chunk while streaming the result to disk.
+"""
+import os
+
+import pandas as pd
+
+from data_io import HAS_PYARROW
+from franchise_mapping import apply_mappings
+from instrumentation import timed
+
+# Directory the app may read large campaign files from and write mapped files
+# to; the app's large file mode is off when it is not set
+DEFAULT_DATA_DIR = os.environ.get("MAPPING_DATA_DIR")
+
+# Rows per chunk for the pandas and Excel readers
+DEFAULT_CHUNK_ROWS = 200000
+# Bytes of CSV text per record batch for the pyarrow reader
+ARROW_BLOCK_BYTES = 32 * 1024 * 1024
+
+
+def resolve_data_path(path, data_dir):
+    """
+    Real absolute path of path (relative paths are taken from data_dir).
+    Raises ValueError when it resolves, symlinks included, outside data_dir.
+    """
+    root = os.path.realpath(data_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"{path} is outside the data directory {data_dir}")
+    return resolved
+
+
+def _same_file(source, output):
+    if not isinstance(source, (str, os.PathLike)):
+        return False
+    if os.path.realpath(source) == os.path.realpath(output):
+        return True
+    return os.path.exists(source) and os.path.exists(output) and os.path.samefile(source, output)
+
+
+def _source_name(source, name=None):
+    return name or getattr(source, "name", None) or str(source)
+
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+
+def read_header(source, name=None):
+    """
+    Column names of a CSV or Excel file, without reading its rows.
+    """
+    name = _source_name(source, name)
+    _rewind(source)
+    try:
+        if name.endswith(".csv"):
+            return pd.read_csv(source, nrows=0).columns.tolist()
+        import openpyxl
+        workbook = openpyxl.load_workbook(source, read_only=True)
+        try:
+            header = next(workbook.active.iter_rows(max_row=1, values_only=True), ())
+        finally:
+            workbook.close()
+        return [str(col) for col in header]
+    finally:
+        _rewind(source)
+
+
+def _iter_csv_arrow(source, columns, header):
+    from pyarrow import csv
+    import pyarrow as pa
+
+    # Everything is read as text, so values are written back exactly as they were
+    reader = csv.open_csv(
+        source,
+        read_options=csv.ReadOptions(block_size=ARROW_BLOCK_BYTES),
+        convert_options=csv.ConvertOptions(
+            include_columns=columns,
+            column_types={col: pa.string() for col in (columns or header)},
+            strings_can_be_null=True,
+        ),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+def _iter_csv_pandas(source, columns, chunk_rows):
+    yield from pd.read_csv(source, usecols=columns, dtype=str, chunksize=chunk_rows)
+
+
+def _iter_excel(source, columns, header, chunk_rows):
+    import openpyxl
+
+    positions = [header.index(col) for col in columns] if columns else list(range(len(header)))
+    names = [header[pos] for pos in positions]
+    workbook = openpyxl.load_workbook(source, read_only=True)
+    try:
+        rows = []
+        for row in workbook.active.iter_rows(min_row=2, values_only=True):
+            rows.append([row[pos] if pos < len(row) else None for pos in positions])
+            if len(rows) >= chunk_rows:
+                yield pd.DataFrame(rows, columns=names)
+                rows = []
+        if rows:
+            yield pd.DataFrame(rows, columns=names)
+    finally:
+        workbook.close()
+
+
+def iter_chunks(source, columns=None, name=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Yields a CSV or Excel file (path or file-like object) as DataFrame chunks
+    holding only the given columns (all columns when None).
+
+    CSV files are read with pyarrow's streaming reader when it is installed
+    (chunks of about ARROW_BLOCK_BYTES) and with pandas' chunksize otherwise;
+    CSV values are kept as text. Excel files are read row by row with
+    openpyxl's read-only mode.
+    """
+    name = _source_name(source, name)
+    header = read_header(source, name)
+    if columns is not None:
+        missing = [col for col in columns if col not in header]
+        if missing:
+            raise ValueError(f"Columns not found in {name}: {', '.join(map(str, missing))}")
+        columns = list(columns)
+
+    _rewind(source)
+    if name.endswith(".csv"):
+        if HAS_PYARROW:
+            yield from _iter_csv_arrow(source, columns, header)
+        else:
+            yield from _iter_csv_pandas(source, columns, chunk_rows)
+    else:
+        yield from _iter_excel(source, columns, header, chunk_rows)
+
+
+def unique_values(source, column, name=None, chunk_rows=DEFAULT_CHUNK_ROWS, metrics=None):
+    """
+    Unique non-null values of one column, in first-seen order, reading only
+    that column.
+    """
+    seen = {}
+    with timed(metrics, "scan_unique") as stage:
+        rows = 0
+        for chunk in iter_chunks(source, [column], name, chunk_rows):
+            rows += len(chunk)
+            seen.update(dict.fromkeys(pd.unique(chunk[column].dropna())))
+        stage["rows"] = rows
+    return list(seen)
+
+
+def unique_values_by_group(source, column, group_cols, name=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    {group values tuple: unique non-null values of column} in one pass over
+    column and group_cols.
+    """
+    groups = {}
+    for chunk in iter_chunks(source, [column] + list(group_cols), name, chunk_rows):
+        chunk = chunk.dropna(subset=[column]).drop_duplicates()
+        for key, rows in chunk.groupby(list(group_cols), sort=False, dropna=True):
+            key = key if isinstance(key, tuple) else (key,)
+            groups.setdefault(key, {}).update(dict.fromkeys(rows[column]))
+    return {key: list(values) for key, values in groups.items()}
+
+
+class _ChunkWriter:
+    """
+    Appends DataFrame chunks to a CSV or Parquet file.
+
+    Parquet columns are written as text, like the CSV reader returns them,
+    except the typed columns, whose type is taken from the first chunk. A
+    column that is empty in one chunk or holds numbers in one Excel chunk and
+    text in the next then has the same type in every chunk.
+    """
+
+    def __init__(self, path, typed_columns=("MAPPED_DATE",)):
+        self.path = str(path)
+        self.parquet = self.path.endswith(".parquet")
+        self.typed_columns = typed_columns
+        self._handle = None
+        self._writer = None
+        self._schema = None
+
+    def _table(self, df):
+        import pyarrow as pa
+
+        if self._schema is None:
+            self._schema = pa.schema([
+                (col, pa.Table.from_pandas(df[[col]], preserve_index=False).schema.field(0).type
+                 if col in self.typed_columns else pa.string())
+                for col in df.columns
+            ])
+        arrays = []
+        for field in self._schema:
+            values = df[field.name]
+            if pa.types.is_string(field.type):
+                values = values.astype("string")
+            arrays.append(pa.array(values, type=field.type, from_pandas=True))
+        return pa.Table.from_arrays(arrays, schema=self._schema)
+
+    def write(self, df):
+        if self.parquet:
+            import pyarrow.parquet as pq
+
+            table = self._table(df)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            self._writer.write_table(table)
+        else:
+            header = self._handle is None
+            if header:
+                self._handle = open(self.path, "w", encoding="utf-8", newline="")
+            df.to_csv(self._handle, header=header, index=False)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._handle is not None:
+            self._handle.close()
+
+
+def stream_apply_mappings(source, output, campaign_col, mappings, sources=None, division=None, brand=None,
+                          name=None, mapped_date=None, chunk_rows=DEFAULT_CHUNK_ROWS, metrics=None):
+    """
+    Adds the FRANCHISE (and MATCH_SOURCE, DIVISION, BRAND, MAPPED_DATE)
+    columns to every row of a large file, one chunk at a time, writing CSV or
+    Parquet (by output extension) to the output path.
+
+    Returns {"rows": rows written, "franchise_counts": {franchise: rows}}.
+    Raises ValueError when output is the source file, which would be
+    truncated while it is still being read. A partly written output file is
+    deleted when mapping fails.
+    """
+    if _same_file(source, output):
+        raise ValueError("The output file must be different from the source file")
+    mapped_date = mapped_date if mapped_date is not None else pd.Timestamp.now()
+    writer = _ChunkWriter(output)
+    rows = 0
+    counts = pd.Series(dtype="int64")
+    try:
+        with timed(metrics, "stream_apply") as stage:
+            chunks = iter_chunks(source, None, name, chunk_rows)
+            first = next(chunks, None)
+            if first is None:
+                first = pd.DataFrame(columns=read_header(source, name))
+            for chunk in _prepend(first, chunks):
+                mapped = apply_mappings(chunk, campaign_col, mappings, sources=sources, division=division,
+                                        brand=brand, mapped_date=mapped_date)
+                writer.write(mapped)
+                rows += len(mapped)
+                counts = counts.add(mapped["FRANCHISE"].value_counts(), fill_value=0)
+            stage["rows"] = rows
+    except BaseException:
+        writer.close()
+        if os.path.exists(output):
+            os.remove(output)
+        raise
+    writer.close()
+    return {"rows": rows, "franchise_counts": counts.astype("int64").sort_values(ascending=False).to_dict()}
+
+
+def _prepend(first, chunks):
+    yield first
+    yield from chunks
@@ -0,0 +1,62 @@
+import hashlib
+import importlib.util
+from io import BytesIO
+
+import pandas as pd
+
+# Only checked, not imported: pandas loads pyarrow itself when it is used
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+# Text columns with at most this share of unique values become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def content_hash(data):
+    """
+    SHA-256 of raw file bytes, used to key parsed uploads.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def compact_frame(df):
+    """
+    Shrinks a DataFrame in place for long-lived caching.
+
+    Repetitive text columns (Division, Brand, Franchise, Campaign, ...) become
+    categoricals; other text columns use Arrow-backed strings when pyarrow is
+    installed.
+    """
+    for col in df.columns:
+        series = df[col]
+        if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+            continue
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            continue
+        non_null = series.count()
+        if non_null and series.nunique(dropna=True) / non_null <= CATEGORY_MAX_UNIQUE_RATIO:
+            df[col] = series.astype("category")
+        elif HAS_PYARROW and pd.api.types.infer_dtype(series, skipna=True) == "string":
+            df[col] = series.astype("string[pyarrow]")
+    return df
+
+
+def read_table(source, name=None, compact=True):
+    """
+    Reads a CSV or Excel file (path or file-like object) into a DataFrame.
+
+    The format is taken from name, or from the path when source is a path.
+    """
+    name = name or getattr(source, "name", None) or str(source)
+    if name.endswith('.csv'):
+        kwargs = {"engine": "pyarrow"} if HAS_PYARROW else {}
+        df = pd.read_csv(source, **kwargs)
+    else:
+        df = pd.read_excel(source)
+    return compact_frame(df) if compact else df
+
+
+def read_upload(data, name):
+    """
+    Parses uploaded file bytes into a compact DataFrame.
+    """
+    return read_table(BytesIO(data), name)
@@ -0,0 +1,89 @@
+from io import BytesIO
+
+import pandas as pd
+
+# Excel's hard sheet limit, including the header row
+EXCEL_MAX_ROWS = 1048576
+
+# Rows converted to Python values at a time when streaming to Excel
+EXCEL_WRITE_CHUNK_ROWS = 50000
+
+EXCEL_DATE_FORMAT = "yyyy-mm-dd hh:mm:ss"
+
+
+def to_csv_bytes(df):
+    """
+    CSV export as UTF-8 bytes.
+    """
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def to_parquet_bytes(df):
+    """
+    Parquet export for downstream pipelines (requires pyarrow).
+    """
+    output = BytesIO()
+    df.to_parquet(output, index=False)
+    return output.getvalue()
+
+
+def _excel_rows(df):
+    """
+    Yields rows of plain Python values, converting one chunk at a time so
+    only a slice of the frame is ever duplicated.
+    """
+    for start in range(0, len(df), EXCEL_WRITE_CHUNK_ROWS):
+        chunk = df.iloc[start:start + EXCEL_WRITE_CHUNK_ROWS].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        yield from chunk.itertuples(index=False, name=None)
+
+
+def to_excel_bytes(df, sheet_name="Sheet1", constant_memory=True):
+    """
+    Excel export.
+
+    With constant_memory=True rows are streamed to the workbook one at a time
+    (xlsxwriter's constant_memory mode, or openpyxl's write-only mode when
+    xlsxwriter is not installed) instead of building the whole sheet in memory.
+    """
+    if len(df) + 1 > EXCEL_MAX_ROWS:
+        raise ValueError(
+            f"{len(df)} rows do not fit in one Excel sheet ({EXCEL_MAX_ROWS - 1} max); use CSV or Parquet"
+        )
+
+    output = BytesIO()
+    if not constant_memory:
+        with pd.ExcelWriter(output, engine="openpyxl") as writer:
+            df.to_excel(writer, index=False, sheet_name=sheet_name)
+        return output.getvalue()
+
+    header = [str(col) for col in df.columns]
+    try:
+        import xlsxwriter
+    except ImportError:
+        xlsxwriter = None
+
+    if xlsxwriter is not None:
+        workbook = xlsxwriter.Workbook(output, {
+            "constant_memory": True,
+            "default_date_format": EXCEL_DATE_FORMAT,
+            "remove_timezone": True,
+            "nan_inf_to_errors": True,
+        })
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, header)
+        for row_idx, row in enumerate(_excel_rows(df), 1):
+            worksheet.write_row(row_idx, 0, row)
+        workbook.close()
+    else:
+        import openpyxl
+        workbook = openpyxl.Workbook(write_only=True)
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(header)
+        for row in _excel_rows(df):
+            worksheet.append([
+                value.tz_localize(None) if isinstance(value, pd.Timestamp) and value.tz else value
+                for value in row
+            ])
+        workbook.save(output)
+    return output.getvalue()
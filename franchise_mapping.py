@@ -0,0 +1,724 @@
+import difflib
+import json
+import queue
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from canonicalize import CampaignClusters
+from instrumentation import timed
+from mapping_cache import normalize_campaign
+from neighbors import DEFAULT_HISTORY_THRESHOLD
+from prematch import DEFAULT_AUTO_ASSIGN_THRESHOLD
+
+try:
+    import anthropic
+    # APITimeoutError is a subclass of APIConnectionError
+    RETRYABLE_ERRORS = (anthropic.APIConnectionError,)
+except ImportError:
+    RETRYABLE_ERRORS = ()
+
+# Model settings used for every mapping call
+MODEL = "claude-sonnet-4-20250514"
+MAX_TOKENS = 8000
+
+# Rough characters-per-token ratio used for budgeting (no tokenizer needed)
+CHARS_PER_TOKEN = 4
+
+# Per-chunk budgets. The output budget is the binding one: every campaign is
+# echoed back as a JSON key together with its franchise.
+DEFAULT_INPUT_TOKEN_BUDGET = 60000
+DEFAULT_OUTPUT_TOKEN_BUDGET = 6000
+DEFAULT_MAX_CAMPAIGNS_PER_CHUNK = 250
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 60.0
+
+# Follow-up calls per chunk for campaigns missing from a truncated response
+DEFAULT_MAX_TOPUPS = 2
+
+# Shortest prompt prefix the API caches for MODEL; it ignores cache_control on
+# a shorter system prompt
+MIN_CACHEABLE_TOKENS = 1024
+
+UNKNOWN_FRANCHISE = "Unknown"
+# Similarity needed to correct a misspelled franchise name from the model
+FRANCHISE_MATCH_CUTOFF = 0.85
+
+CONFIDENCE_ORDER = ["low", "medium", "high"]
+
+# How often map_campaigns wakes up to forward streamed entries
+POLL_SECONDS = 0.2
+
+MAPPINGS_START_PATTERN = re.compile(r'"mappings"\s*:\s*\{')
+MAPPING_ENTRY_PATTERN = re.compile(r'\s*,?\s*"((?:[^"\\]|\\.)*)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+MAPPINGS_END_PATTERN = re.compile(r'\s*,?\s*\}')
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate for budgeting prompts and responses.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_campaigns(campaigns, franchises_list,
+                    input_token_budget=DEFAULT_INPUT_TOKEN_BUDGET,
+                    output_token_budget=DEFAULT_OUTPUT_TOKEN_BUDGET,
+                    max_campaigns=DEFAULT_MAX_CAMPAIGNS_PER_CHUNK):
+    """
+    Splits campaigns into chunks that fit the prompt and response token budgets.
+    """
+    longest_franchise = max((estimate_tokens(str(f)) for f in franchises_list), default=1)
+    base_tokens = (estimate_tokens(build_system_prompt("", "", franchises_list))
+                   + estimate_tokens(build_user_prompt([])))
+
+    chunks = []
+    current = []
+    input_used = base_tokens
+    output_used = 0
+
+    for campaign in campaigns:
+        campaign_tokens = estimate_tokens(compact_json(str(campaign)))
+        # Key, value and JSON punctuation for one mapping entry
+        entry_output = campaign_tokens + longest_franchise + 4
+
+        if current and (len(current) >= max_campaigns
+                        or input_used + campaign_tokens > input_token_budget
+                        or output_used + entry_output > output_token_budget):
+            chunks.append(current)
+            current = []
+            input_used = base_tokens
+            output_used = 0
+
+        current.append(campaign)
+        input_used += campaign_tokens
+        output_used += entry_output
+
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+def compact_json(value):
+    """
+    JSON without indentation or spaces after separators, to save prompt tokens.
+    """
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def build_system_prompt(division, brand, franchises_list):
+    """
+    Instructions and franchise list for a Division/Brand pair. Identical for
+    every chunk of a run, so it is sent as a cached prompt prefix when it is
+    long enough to be cached.
+    """
+    return f"""You are a data analysis expert specializing in franchise identification.
+
+**Context:**
+- Division: {division}
+- Brand: {brand}
+
+**Available Franchises (from master file):**
+{compact_json(list(franchises_list))}
+
+**Task:**
+The user message lists campaign names/descriptions as a JSON array. Read each one and intelligently determine which franchise it belongs to from the available franchises list above.
+
+Look for:
+- Brand names, abbreviations, or variations in the campaign text
+- Keywords that indicate a specific franchise
+- Context clues (franchises, products, brands within the LOreal umbrealla business, etc.)
+- Misspellings or informal references
+
+For campaigns that clearly match one of the available franchises, map them to that franchise name (use EXACT spelling from the available franchises list).
+
+If a campaign doesn't match any franchise or is ambiguous, you can:
+- Map to "Unknown" if truly unclear
+- Make your best educated guess with lower confidence
+
+Return ONLY compact, valid JSON (no indentation) in this exact format, with every campaign text copied exactly as a key:
+{{"mappings":{{"campaign_text_1":"Franchise Name","campaign_text_2":"Unknown"}},"summary":{{"confidence":"high/medium/low"}}}}
+
+IMPORTANT: Use the EXACT franchise names from the available franchises list above."""
+
+
+def build_user_prompt(campaigns):
+    """
+    The per-chunk part of the prompt: the campaigns to map.
+    """
+    return f"""**Campaign Data to Analyze:**
+{compact_json(list(campaigns))}"""
+
+
+def build_request(division, brand, franchises_list, campaigns):
+    """
+    messages.create/stream arguments for one chunk. The system prompt is
+    always marked for prompt caching; once it reaches MIN_CACHEABLE_TOKENS
+    chunks after the first only pay full price for the campaign list.
+    """
+    return {
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS,
+        "system": [{
+            "type": "text",
+            "text": build_system_prompt(division, brand, franchises_list),
+            "cache_control": {"type": "ephemeral"},
+        }],
+        "messages": [{"role": "user", "content": build_user_prompt(campaigns)}],
+    }
+
+
+def extract_json_text(response_text):
+    """
+    Strips markdown code fences from a model response.
+    """
+    if "```json" in response_text:
+        response_text = response_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in response_text:
+        response_text = response_text.split("```")[1].split("```")[0].strip()
+    return response_text
+
+
+def parse_response(response_text):
+    """
+    Parses the model response into a mapping result dict.
+    """
+    return json.loads(extract_json_text(response_text))
+
+
+def parse_response_tolerant(response_text):
+    """
+    Parses the model response, salvaging every complete mapping pair when the
+    JSON is truncated (max_tokens) or malformed. Salvaged results carry
+    "truncated": True and an empty summary.
+    """
+    try:
+        result = parse_response(response_text)
+        if isinstance(result, dict) and isinstance(result.get("mappings"), dict):
+            return result
+    except ValueError:
+        pass
+    parser = StreamingMappingParser()
+    parser.feed(response_text)
+    return {"mappings": parser.entries, "summary": {}, "truncated": True}
+
+
+def match_requested(mappings, campaigns):
+    """
+    Keeps only mappings for requested campaigns, recovering keys the model
+    echoed back with different case or whitespace.
+    """
+    exact = set(campaigns)
+    requested = {normalize_campaign(c): c for c in campaigns}
+    matched = {}
+    for campaign, franchise in mappings.items():
+        original = campaign if campaign in exact else requested.get(normalize_campaign(campaign))
+        if original is not None and isinstance(franchise, str):
+            matched[original] = franchise
+    return matched
+
+
+class FranchiseValidator:
+    """
+    Corrects franchise names returned by the model to the exact spelling in
+    franchises_list; anything that cannot be matched becomes "Unknown".
+    """
+
+    def __init__(self, franchises_list):
+        self.franchises = [str(f) for f in franchises_list]
+        self._exact = set(self.franchises) | {UNKNOWN_FRANCHISE}
+        self._normalized = {normalize_campaign(f): f for f in self.franchises}
+        self._normalized[normalize_campaign(UNKNOWN_FRANCHISE)] = UNKNOWN_FRANCHISE
+
+    def correct(self, franchise):
+        franchise = str(franchise)
+        if franchise in self._exact:
+            return franchise
+        normalized = normalize_campaign(franchise)
+        if normalized in self._normalized:
+            return self._normalized[normalized]
+        close = difflib.get_close_matches(normalized, list(self._normalized), n=1,
+                                          cutoff=FRANCHISE_MATCH_CUTOFF)
+        return self._normalized[close[0]] if close else UNKNOWN_FRANCHISE
+
+    def validate(self, mappings):
+        """
+        Returns (corrected mappings, number of franchise names changed).
+        """
+        corrected = {campaign: self.correct(franchise) for campaign, franchise in mappings.items()}
+        changed = sum(1 for campaign, franchise in mappings.items() if corrected[campaign] != franchise)
+        return corrected, changed
+
+
+class StreamingMappingParser:
+    """
+    Incrementally extracts complete "campaign": "franchise" pairs from the
+    "mappings" object of a response as text arrives.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.entries = {}
+        self.complete = False
+        self._pos = None
+
+    def feed(self, text):
+        """
+        Adds text and returns the (campaign, franchise) pairs completed by it.
+        """
+        self.text += text
+        new_entries = []
+        if self._pos is None:
+            start = MAPPINGS_START_PATTERN.search(self.text)
+            if not start:
+                return new_entries
+            self._pos = start.end()
+
+        while not self.complete:
+            entry = MAPPING_ENTRY_PATTERN.match(self.text, self._pos)
+            if not entry:
+                if MAPPINGS_END_PATTERN.match(self.text, self._pos):
+                    self.complete = True
+                break
+            campaign = json.loads(f'"{entry.group(1)}"')
+            franchise = json.loads(f'"{entry.group(2)}"')
+            self.entries[campaign] = franchise
+            new_entries.append((campaign, franchise))
+            self._pos = entry.end()
+        return new_entries
+
+
+def is_retryable(error):
+    """
+    Whether an API error is transient: connection errors and timeouts, rate
+    limits (HTTP 429) and server errors (HTTP 5xx).
+    """
+    if RETRYABLE_ERRORS and isinstance(error, RETRYABLE_ERRORS):
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+def call_with_retry(func, max_retries=DEFAULT_MAX_RETRIES, backoff_seconds=DEFAULT_BACKOFF_SECONDS,
+                    cancel_event=None):
+    """
+    Calls func, retrying transient API errors (see is_retryable) with
+    exponential backoff and jitter. Other errors are raised immediately, and
+    so is the last error once cancel_event is set, including while waiting.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            if not is_retryable(e) or attempt >= max_retries:
+                raise
+            delay = min(MAX_BACKOFF_SECONDS, backoff_seconds * (2 ** attempt))
+            delay *= 0.5 + random.random() / 2
+            if cancel_event is None:
+                time.sleep(delay)
+            elif cancel_event.wait(delay):
+                raise
+            attempt += 1
+
+
+def map_chunk(client, division, brand, franchises_list, campaigns,
+              max_retries=DEFAULT_MAX_RETRIES, backoff_seconds=DEFAULT_BACKOFF_SECONDS,
+              stream=False, on_entries=None, cancel_event=None, max_topups=DEFAULT_MAX_TOPUPS,
+              metrics=None):
+    """
+    Maps one chunk of campaigns.
+
+    Truncated or malformed responses are salvaged pair by pair, and campaigns
+    missing from a response are sent again in up to max_topups smaller
+    follow-up calls. Franchise names are validated against franchises_list.
+    Campaigns still missing at the end are listed under "unmapped".
+
+    With stream=True the response is streamed and on_entries(pairs) is called
+    with each batch of completed (campaign, franchise) pairs. If cancel_event
+    is set mid-stream, the pairs received so far are returned with
+    "cancelled": True.
+
+    If an Instrumentation is given, every call's latency and token usage is
+    recorded on it.
+    """
+    validator = FranchiseValidator(franchises_list)
+
+    def request(pending):
+        request_args = build_request(division, brand, franchises_list, pending)
+        start = time.perf_counter()
+        usage = None
+        error = None
+        try:
+            if not stream:
+                message = client.messages.create(**request_args)
+                usage = getattr(message, "usage", None)
+                return parse_response_tolerant(message.content[0].text)
+
+            parser = StreamingMappingParser()
+            with client.messages.stream(**request_args) as response:
+                for text in response.text_stream:
+                    entries = parser.feed(text)
+                    if entries and on_entries:
+                        on_entries([(c, validator.correct(f)) for c, f in entries])
+                    if cancel_event is not None and cancel_event.is_set():
+                        return {"mappings": dict(parser.entries), "summary": {}, "cancelled": True}
+                usage = getattr(response.get_final_message(), "usage", None)
+            return parse_response_tolerant(parser.text)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            if metrics is not None:
+                metrics.record_api_call(MODEL, time.perf_counter() - start, usage,
+                                        campaigns=len(pending), error=error)
+
+    mappings = {}
+    summary = {}
+    pending = list(campaigns)
+    cancelled = False
+    for _ in range(max_topups + 1):
+        if cancel_event is not None and cancel_event.is_set():
+            cancelled = True
+            break
+        try:
+            result = call_with_retry(lambda: request(pending), max_retries=max_retries,
+                                     backoff_seconds=backoff_seconds, cancel_event=cancel_event)
+        except Exception:
+            # A stopped run keeps what this chunk mapped so far
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+                break
+            raise
+        mappings.update(match_requested(result.get("mappings", {}), pending))
+        summary = summary or result.get("summary", {})
+        pending = [c for c in pending if c not in mappings]
+        if result.get("cancelled"):
+            cancelled = True
+            break
+        if not pending:
+            break
+
+    mappings, corrected = validator.validate(mappings)
+    return {
+        "mappings": mappings,
+        "summary": summary,
+        "unmapped": pending,
+        "corrected": corrected,
+        "cancelled": cancelled,
+    }
+
+
+def merge_results(results):
+    """
+    Merges per-chunk mapping results into one mapping result.
+    """
+    mappings = {}
+    confidences = []
+    for result in results:
+        mappings.update(result.get("mappings", {}))
+        confidence = str(result.get("summary", {}).get("confidence", "")).lower()
+        if confidence in CONFIDENCE_ORDER:
+            confidences.append(confidence)
+
+    franchises_identified = {}
+    for franchise in mappings.values():
+        franchises_identified[franchise] = franchises_identified.get(franchise, 0) + 1
+
+    return {
+        "mappings": mappings,
+        "summary": {
+            "total_campaigns": len(mappings),
+            "franchises_identified": franchises_identified,
+            # A merged run is only as confident as its weakest chunk
+            "confidence": min(confidences, key=CONFIDENCE_ORDER.index) if confidences else "N/A",
+        },
+    }
+
+
+def map_campaigns(client, division, brand, franchises_list, campaigns,
+                  max_workers=DEFAULT_MAX_WORKERS, progress_callback=None, cache=None,
+                  matcher=None, match_threshold=DEFAULT_AUTO_ASSIGN_THRESHOLD,
+                  stream=False, on_entries=None, cancel_event=None, metrics=None, canonicalize=True,
+                  history=None, history_threshold=DEFAULT_HISTORY_THRESHOLD, **chunk_options):
+    """
+    Maps every campaign to a franchise, chunking the campaigns and sending the
+    chunks through a bounded thread pool.
+
+    If a MappingCache is given, cached campaigns are resolved first and only
+    cache misses are sent to the model; new results are written back, except
+    Unknown ones, so campaigns the model could not place are retried next run
+    (as MappingHistory does not learn them either).
+    If a FranchiseMatcher is given, campaigns it matches with a score of at
+    least match_threshold are assigned locally and never sent to the model.
+    If a MappingHistory is given, campaigns whose nearest previously accepted
+    mappings predict a franchise with at least history_threshold confidence
+    are assigned the same way.
+    The stage that resolved each campaign is recorded under "sources".
+    With canonicalize=True the remaining campaigns are grouped by canonical
+    form (see CampaignClusters): only one representative per group is sent
+    to the model and its franchise is copied to the other members.
+
+    progress_callback(done_chunks, total_chunks, chunk_campaigns) is called from
+    the calling thread after each chunk finishes, so it can safely update UI.
+    on_entries(pairs, source) is also called from the calling thread, first
+    with the cached and pre-matched pairs and then, when stream=True, with
+    model pairs as they arrive.
+
+    Setting cancel_event stops the run early and keeps what was mapped so far;
+    an exception raised in the calling thread (such as a Streamlit rerun) does
+    the same before propagating. Campaigns left unmapped because their chunk
+    failed after all retries or was cancelled are listed under
+    "failed_campaigns".
+
+    If an Instrumentation is given as metrics, stage timings, cache and
+    pre-match hit rates and every model call are recorded on it.
+    """
+    campaigns = [str(c) for c in campaigns]
+
+    sources = {}
+
+    cached = {}
+    if cache is not None:
+        with timed(metrics, "cache_lookup", rows=len(campaigns)):
+            cached = cache.get_many(division, brand, franchises_list, campaigns)
+        if metrics is not None:
+            metrics.record_cache("mapping_cache", len(cached), len(campaigns) - len(cached))
+        campaigns = [c for c in campaigns if c not in cached]
+        sources.update(dict.fromkeys(cached, "cache"))
+
+    matched = {}
+    if matcher is not None and campaigns:
+        with timed(metrics, "prematch", rows=len(campaigns)):
+            matched, match_sources = matcher.resolve(campaigns, threshold=match_threshold)
+        if metrics is not None:
+            metrics.record_cache("prematch", len(matched), len(campaigns) - len(matched))
+        campaigns = [c for c in campaigns if c not in matched]
+        sources.update(match_sources)
+
+    learned = {}
+    if history is not None and campaigns:
+        with timed(metrics, "history", rows=len(campaigns)):
+            learned, learned_sources = history.resolve(division, brand, franchises_list, campaigns,
+                                                       threshold=history_threshold)
+        if metrics is not None:
+            metrics.record_cache("history", len(learned), len(campaigns) - len(learned))
+        campaigns = [c for c in campaigns if c not in learned]
+        sources.update(learned_sources)
+
+    if on_entries:
+        if cached:
+            on_entries(list(cached.items()), "cache")
+        if matched:
+            on_entries(list(matched.items()), "prematch")
+        if learned:
+            on_entries(list(learned.items()), "history")
+
+    clusters = None
+    model_campaigns = campaigns
+    if canonicalize and campaigns:
+        with timed(metrics, "canonicalize", rows=len(campaigns)):
+            clusters = CampaignClusters(campaigns, franchises_list)
+        model_campaigns = clusters.representatives
+
+    chunks = chunk_campaigns(model_campaigns, franchises_list, **chunk_options)
+
+    results = []
+    failed = []
+    errors = []
+    cancel_event = cancel_event or threading.Event()
+    entry_queue = queue.Queue()
+
+    def forward_entries():
+        entries = []
+        while not entry_queue.empty():
+            entries.extend(entry_queue.get_nowait())
+        if entries:
+            on_entries(clusters.expand(entries) if clusters else entries, "llm")
+
+    if progress_callback:
+        progress_callback(0, len(chunks), [])
+
+    model_start = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        futures = {
+            executor.submit(map_chunk, client, division, brand, franchises_list, chunk,
+                            stream=stream, on_entries=entry_queue.put if on_entries else None,
+                            cancel_event=cancel_event, metrics=metrics): chunk
+            for chunk in chunks
+        }
+        pending = set(futures)
+        done = 0
+        while pending:
+            finished, pending = wait(pending, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+            if on_entries:
+                forward_entries()
+            for future in finished:
+                done += 1
+                chunk = futures[future]
+                try:
+                    result = future.result()
+                    results.append(result)
+                    if result.get("unmapped") and not result.get("cancelled"):
+                        errors.append(f"{len(result['unmapped'])} campaigns missing from the model response")
+                    failed.extend(result.get("unmapped", []))
+                except Exception as e:
+                    failed.extend(chunk)
+                    errors.append(str(e))
+                if progress_callback:
+                    progress_callback(done, len(chunks), chunk)
+    except BaseException:
+        # Interrupted from the calling thread: stop workers without waiting
+        cancel_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    if metrics is not None and chunks:
+        metrics.record_stage("model", time.perf_counter() - model_start, rows=len(campaigns))
+
+    if clusters:
+        for result in results:
+            result["mappings"] = clusters.fan_out(result.get("mappings", {}))
+        failed = clusters.members_of(failed)
+
+    for result in results:
+        sources.update(dict.fromkeys(result.get("mappings", {}), "llm"))
+        if cache is not None:
+            cache.put_many(division, brand, franchises_list,
+                           {c: f for c, f in result.get("mappings", {}).items() if f != UNKNOWN_FRANCHISE})
+
+    mapping_result = merge_results([{"mappings": cached}, {"mappings": matched}, {"mappings": learned}] + results)
+    mapping_result["sources"] = sources
+    mapping_result["cached_campaigns"] = len(cached)
+    mapping_result["prematched_campaigns"] = len(matched)
+    mapping_result["history_campaigns"] = len(learned)
+    mapping_result["model_campaigns"] = len(campaigns)
+    # Campaigns mapped through their cluster's representative
+    mapping_result["clustered_campaigns"] = len(campaigns) - len(model_campaigns)
+    mapping_result["corrected_franchises"] = sum(result.get("corrected", 0) for result in results)
+    mapping_result["failed_campaigns"] = failed
+    mapping_result["errors"] = errors
+    mapping_result["cancelled"] = cancel_event.is_set()
+    return mapping_result
+
+
+def combine_results(previous, topup):
+    """
+    Folds a follow-up map_campaigns run over previously failed campaigns into
+    the earlier mapping result.
+    """
+    combined = merge_results([previous, topup])
+    combined["sources"] = {**previous.get("sources", {}), **topup.get("sources", {})}
+    combined["failed_campaigns"] = topup.get("failed_campaigns", [])
+    combined["errors"] = topup.get("errors", [])
+    combined["cancelled"] = topup.get("cancelled", False)
+    return combined
+
+
+def apply_mappings(df, campaign_col, mappings, sources=None, division=None, brand=None,
+                   mapped_date=None):
+    """
+    Returns a copy of df with FRANCHISE (and MATCH_SOURCE, DIVISION, BRAND,
+    MAPPED_DATE) columns added. Unmapped campaigns are marked Unknown.
+    """
+    df_cleaned = df.copy()
+    campaigns = df_cleaned[campaign_col].astype(str)
+
+    df_cleaned['FRANCHISE'] = campaigns.map(mappings).fillna('Unknown')
+    if sources is not None:
+        df_cleaned['MATCH_SOURCE'] = campaigns.map(sources).fillna('unmapped')
+    if division is not None:
+        df_cleaned['DIVISION'] = division
+    if brand is not None:
+        df_cleaned['BRAND'] = brand
+    df_cleaned['MAPPED_DATE'] = mapped_date if mapped_date is not None else pd.Timestamp.now()
+    return df_cleaned
+
+
+class AppliedMapping:
+    """
+    A campaign -> franchise mapping applied to a campaign frame without
+    copying it.
+
+    The mapping is kept once as dictionaries and DIVISION, BRAND and
+    MAPPED_DATE as scalars. Per-row columns are only built, as categoricals
+    expanded from the campaign column's category codes, for the rows that are
+    previewed or exported.
+    """
+
+    def __init__(self, campaign_col, mappings, sources=None, division=None, brand=None, mapped_date=None):
+        self.campaign_col = campaign_col
+        self.mappings = mappings
+        self.sources = sources
+        self.division = division
+        self.brand = brand
+        self.mapped_date = mapped_date if mapped_date is not None else pd.Timestamp.now()
+
+    @staticmethod
+    def _lookup_column(campaigns, lookup, default):
+        # Each distinct campaign is looked up once; the extra last key is
+        # picked by the -1 code of missing campaigns. Keys go through the
+        # same astype(str) as in apply_mappings, which depending on the
+        # pandas version turns a missing campaign into "nan" or keeps it NaN
+        if not isinstance(campaigns.dtype, pd.CategoricalDtype):
+            campaigns = campaigns.astype("category")
+        keys = pd.Series(list(campaigns.cat.categories) + [None], dtype=object).astype(str)
+        values = keys.map(lookup).fillna(default)
+        categories = pd.Index(values.unique())
+        codes = categories.get_indexer(values)[campaigns.cat.codes.to_numpy()]
+        return pd.Series(pd.Categorical.from_codes(codes, categories), index=campaigns.index)
+
+    @staticmethod
+    def _constant_column(value, index):
+        return pd.Series(pd.Categorical.from_codes(np.zeros(len(index), dtype="int8"), [value]), index=index)
+
+    def franchise_column(self, df):
+        """
+        FRANCHISE of every row of df as a categorical (Unknown when unmapped).
+        """
+        return self._lookup_column(df[self.campaign_col], self.mappings, "Unknown")
+
+    def franchise_counts(self, df):
+        """
+        Rows of df per franchise, most frequent first.
+        """
+        counts = self.franchise_column(df).value_counts()
+        return counts[counts > 0].rename_axis("FRANCHISE").rename("count")
+
+    def apply(self, df):
+        """
+        The columns apply_mappings would add, for the rows of df only, with
+        the text columns as categoricals.
+        """
+        columns = {"FRANCHISE": self.franchise_column(df)}
+        if self.sources is not None:
+            columns["MATCH_SOURCE"] = self._lookup_column(df[self.campaign_col], self.sources, "unmapped")
+        if self.division is not None:
+            columns["DIVISION"] = self._constant_column(self.division, df.index)
+        if self.brand is not None:
+            columns["BRAND"] = self._constant_column(self.brand, df.index)
+        columns["MAPPED_DATE"] = self.mapped_date
+        return df.assign(**columns)
+
+
+def mappings_table(mappings, sources, division, brand):
+    """
+    Campaign -> franchise reference table in the "Download Mappings" layout.
+    """
+    return pd.DataFrame({
+        "Campaign": list(mappings.keys()),
+        "Franchise": list(mappings.values()),
+        "Source": [sources.get(k, "llm") for k in mappings],
+        "Division": division,
+        "Brand": brand,
+    }, columns=["Campaign", "Franchise", "Source", "Division", "Brand"])
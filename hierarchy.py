@@ -0,0 +1,65 @@
+import pandas as pd
+
+
+class MasterHierarchy:
+    """
+    Division -> Brand -> Franchise index over a master file, built once.
+
+    Lookups for the dropdowns and the franchise list are dict reads, and the
+    master rows of a Division/Brand pair are taken by precomputed positions
+    instead of boolean-mask scans. Only the positions are kept, not the frame,
+    so a cached index does not hold the master file in memory.
+    """
+
+    def __init__(self, master_df, division_col, brand_col, franchise_col):
+        self.division_col = division_col
+        self.brand_col = brand_col
+        self.franchise_col = franchise_col
+
+        # Row positions of every (division, brand) pair, in file order. Grouping
+        # by the Series themselves also works when both columns are the same.
+        keys = [master_df[division_col], master_df[brand_col]]
+        self._positions = dict(
+            master_df.groupby(keys, sort=False, observed=True, dropna=True).indices
+        )
+
+        franchise_values = master_df[franchise_col].to_numpy()
+        self._franchises = {}
+        brands = {}
+        for (division, brand), positions in self._positions.items():
+            values = pd.Series(franchise_values[positions]).dropna()
+            self._franchises[(division, brand)] = pd.unique(values).tolist()
+            brands.setdefault(division, []).append(brand)
+
+        self.divisions = sorted(master_df[division_col].dropna().unique().tolist())
+        self._brands = {division: sorted(values) for division, values in brands.items()}
+
+    def brands_for(self, division):
+        """
+        Sorted brands of a division.
+        """
+        return self._brands.get(division, [])
+
+    def franchises_for(self, division, brand):
+        """
+        Franchises of a Division/Brand pair, in master file order.
+        """
+        return self._franchises.get((division, brand), [])
+
+    def rows_for(self, master_df, division, brand):
+        """
+        Rows of master_df (the frame the index was built from) for a
+        Division/Brand pair.
+        """
+        positions = self._positions.get((division, brand), [])
+        return master_df.iloc[positions]
+
+    def pairs(self):
+        """
+        Yields (division, brand, franchises_list) for every pair with franchises.
+        """
+        for division in self.divisions:
+            for brand in self.brands_for(division):
+                franchises_list = self.franchises_for(division, brand)
+                if franchises_list:
+                    yield division, brand, franchises_list
@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Structured metrics log (one JSON object per line), shared by every session
+DEFAULT_METRICS_LOG_PATH = os.environ.get(
+    "MAPPING_METRICS_LOG", os.path.join(os.path.expanduser("~"), ".franchise_mapping_metrics.jsonl")
+)
+METRICS_LOGGER_NAME = "franchise_mapping.metrics"
+
+# USD per million input/output tokens, for cost estimates
+MODEL_PRICES = {
+    "claude-sonnet-4-20250514": (3.0, 15.0),
+}
+# Cache reads and writes are billed relative to the input price
+CACHE_READ_PRICE_RATIO = 0.1
+CACHE_WRITE_PRICE_RATIO = 1.25
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records whose message is a dict as a single JSON line.
+    """
+
+    def format(self, record):
+        if isinstance(record.msg, dict):
+            return json.dumps(record.msg, default=str)
+        return json.dumps({"ts": _now(), "message": record.getMessage()})
+
+
+_log_lock = threading.Lock()
+
+
+def configure_json_log(path=DEFAULT_METRICS_LOG_PATH):
+    """
+    Returns the metrics logger, attaching a JSON Lines file handler for path
+    the first time it is requested.
+    """
+    logger = logging.getLogger(METRICS_LOGGER_NAME)
+    path = os.path.abspath(path)
+    with _log_lock:
+        if not any(getattr(handler, "baseFilename", None) == path for handler in logger.handlers):
+            handler = logging.FileHandler(path, encoding="utf-8")
+            handler.setFormatter(JsonFormatter())
+            logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+
+
+def estimate_cost(model, input_tokens, output_tokens, cache_read_tokens=0, cache_write_tokens=0):
+    """
+    Estimated USD cost of a call, or None for a model without a known price.
+    """
+    if model not in MODEL_PRICES:
+        return None
+    input_price, output_price = MODEL_PRICES[model]
+    return (
+        input_tokens * input_price
+        + cache_read_tokens * input_price * CACHE_READ_PRICE_RATIO
+        + cache_write_tokens * input_price * CACHE_WRITE_PRICE_RATIO
+        + output_tokens * output_price
+    ) / 1_000_000
+
+
+class Instrumentation:
+    """
+    Thread-safe recorder for stage timings, model calls, cache lookups and
+    queries.
+
+    Every event is kept in memory for summary() and, when a logger is given,
+    written to it as one structured record tagged with the session id.
+    """
+
+    def __init__(self, session_id=None, logger=None, context=None):
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.logger = logger
+        self.context = dict(context or {})
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.api_calls = []
+            self.caches = {}
+            self.queries = []
+
+    def _emit(self, event, **fields):
+        if self.logger is None:
+            return
+        record = {"ts": _now(), "session": self.session_id, "event": event, **self.context, **fields}
+        self.logger.info(record)
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Times a block. rows (or a count set on the yielded dict as
+        info["rows"]) is used for rows per second.
+        """
+        info = {"rows": rows}
+        start = time.perf_counter()
+        error = None
+        try:
+            yield info
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record_stage(name, time.perf_counter() - start, rows=info["rows"], error=error)
+
+    def record_stage(self, name, seconds, rows=None, error=None):
+        with self._lock:
+            stage = self.stages.setdefault(name, {"count": 0, "seconds": 0.0, "rows": 0})
+            stage["count"] += 1
+            stage["seconds"] += seconds
+            stage["rows"] += rows or 0
+            stage["last_seconds"] = seconds
+        rows_per_second = rows / seconds if rows and seconds > 0 else None
+        self._emit("stage", stage=name, seconds=round(seconds, 6), rows=rows,
+                   rows_per_second=rows_per_second, error=error)
+
+    def record_api_call(self, model, seconds, usage=None, campaigns=None, error=None):
+        """
+        Records one model call from its latency and message.usage.
+        """
+        call = {
+            "model": model,
+            "seconds": seconds,
+            "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+            "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+            "cache_read_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+            "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+            "campaigns": campaigns,
+            "error": error,
+        }
+        call["cost"] = estimate_cost(model, call["input_tokens"], call["output_tokens"],
+                                     call["cache_read_tokens"], call["cache_write_tokens"])
+        with self._lock:
+            self.api_calls.append(call)
+        self._emit("api_call", **{**call, "seconds": round(seconds, 6)})
+
+    def record_cache(self, name, hits, misses):
+        with self._lock:
+            cache = self.caches.setdefault(name, {"hits": 0, "misses": 0})
+            cache["hits"] += hits
+            cache["misses"] += misses
+        self._emit("cache", cache=name, hits=hits, misses=misses)
+
+    def record_query(self, seconds, rows=None, bytes_processed=None, cache_hit=None, backend=None):
+        query = {
+            "seconds": seconds,
+            "rows": rows,
+            "bytes_processed": bytes_processed,
+            "cache_hit": cache_hit,
+            "backend": backend,
+        }
+        with self._lock:
+            self.queries.append(query)
+        self._emit("query", **{**query, "seconds": round(seconds, 6)})
+
+    def summary(self):
+        """
+        Aggregated view for display: per-stage totals, model call latency,
+        tokens and cost, cache hit rates and query totals.
+        """
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+            calls = list(self.api_calls)
+            caches = {name: dict(cache) for name, cache in self.caches.items()}
+            queries = list(self.queries)
+
+        for stage in stages.values():
+            stage["rows_per_second"] = stage["rows"] / stage["seconds"] if stage["rows"] and stage["seconds"] else None
+        for cache in caches.values():
+            lookups = cache["hits"] + cache["misses"]
+            cache["hit_rate"] = cache["hits"] / lookups if lookups else 0.0
+
+        latencies = sorted(call["seconds"] for call in calls)
+        costs = [call["cost"] for call in calls if call["cost"] is not None]
+        return {
+            "session": self.session_id,
+            "stages": stages,
+            "api": {
+                "calls": len(calls),
+                "errors": sum(1 for call in calls if call["error"]),
+                "mean_seconds": sum(latencies) / len(latencies) if latencies else None,
+                "p95_seconds": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+                "max_seconds": latencies[-1] if latencies else None,
+                "input_tokens": sum(call["input_tokens"] for call in calls),
+                "output_tokens": sum(call["output_tokens"] for call in calls),
+                "cache_read_tokens": sum(call["cache_read_tokens"] for call in calls),
+                "cache_write_tokens": sum(call["cache_write_tokens"] for call in calls),
+                "cost": sum(costs) if costs else None,
+            },
+            "caches": caches,
+            "queries": {
+                "count": len(queries),
+                "seconds": sum(query["seconds"] for query in queries),
+                "rows": sum(query["rows"] or 0 for query in queries),
+                "bytes_processed": sum(query["bytes_processed"] or 0 for query in queries),
+            },
+        }
+
+
+@contextmanager
+def timed(metrics, name, rows=None):
+    """
+    metrics.stage(name, rows) when metrics is given, otherwise a no-op, so
+    callers can accept metrics=None.
+    """
+    if metrics is None:
+        yield {"rows": rows}
+    else:
+        with metrics.stage(name, rows) as info:
+            yield info
@@ -1,20 +1,290 @@
 import streamlit as st
 import pandas as pd
 import anthropic
-import json
-from io import BytesIO
-# For Excel export.
-import openpyxl
+import os
+import time
+
+from chunked_io import DEFAULT_DATA_DIR, read_header, resolve_data_path, stream_apply_mappings, unique_values
+from data_io import HAS_PYARROW, content_hash, read_upload
+from exports import to_csv_bytes, to_excel_bytes, to_parquet_bytes
+from franchise_mapping import AppliedMapping, combine_results, map_campaigns, mappings_table, merge_results
+from hierarchy import MasterHierarchy
+from instrumentation import DEFAULT_METRICS_LOG_PATH, Instrumentation, configure_json_log, timed
+from mapping_cache import MappingCache
+from neighbors import MappingHistory
+from prematch import FranchiseMatcher
+from session_store import SessionSpill
 # Page config
 st.set_page_config(page_title="AI Franchise Identifier", page_icon="🎯", layout="wide")
 
 st.title("🎯 AI-Powered Franchise Identifier")
 st.markdown("Analyze campaign text to automatically identify franchises using your master reference file.")
 
+# Minimum seconds between redraws of the live mappings table
+LIVE_REFRESH_SECONDS = 0.5
+# Rows of each upload kept in memory for the previews
+PREVIEW_ROWS = 30
+
+
+def load_upload(file_name, data, metrics=None):
+    # Not cached server-wide: the parsed frame lives only in its session's
+    # SpillSlot, so spilling an idle session really frees it
+    with st.spinner("Parsing file..."), timed(metrics, "parse_upload") as stage:
+        df = read_upload(data, file_name)
+        stage["rows"] = len(df)
+    return df
+
+
+@st.cache_resource
+def get_session_spill():
+    # One registry for every session on this server; large values of idle
+    # sessions are spilled to disk by its background thread
+    session_spill = SessionSpill()
+    session_spill.start()
+    return session_spill
+
+
+def keep(value):
+    """
+    Wraps a large session value in a SpillSlot (None stays None).
+    """
+    return None if value is None else get_session_spill().slot(st.session_state.metrics.session_id, value)
+
+
+def session_value(key):
+    """
+    Value of a SpillSlot kept in session state, read back from disk if needed.
+    """
+    slot = st.session_state.get(key)
+    return None if slot is None else slot.get()
+
+
+def upload_to_session(uploaded_file, name):
+    """
+    Keeps the parsed (compact) upload in session state as <name>_df, in a
+    SpillSlot, and its content hash as <name>_hash. The bytes are hashed only
+    the first time this session sees the upload and parsed only when the
+    content changes. Its row count, columns and first rows are kept alongside
+    as <name>_rows, <name>_columns and <name>_preview, so reruns can show the
+    upload without reading it back from the spill.
+    """
+    hashes = st.session_state.setdefault('upload_hashes', {})
+    upload_id = getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size)
+    if upload_id not in hashes:
+        hashes[upload_id] = content_hash(uploaded_file.getvalue())
+    file_hash = hashes[upload_id]
+    if st.session_state.get(f'{name}_df') is None or st.session_state.get(f'{name}_hash') != file_hash:
+        df = load_upload(uploaded_file.name, uploaded_file.getvalue(), st.session_state.metrics)
+        st.session_state[f'{name}_df'] = keep(df)
+        st.session_state[f'{name}_hash'] = file_hash
+        st.session_state[f'{name}_rows'] = len(df)
+        st.session_state[f'{name}_columns'] = df.columns.tolist()
+        st.session_state[f'{name}_preview'] = df.head(PREVIEW_ROWS)
+
+
+@st.cache_data(show_spinner="Scanning campaign column...", max_entries=16)
+def scan_unique_campaigns(path, mtime, campaign_col, _metrics=None):
+    # Keyed by path and modification time, so a large file is rescanned only
+    # when it changes; only the campaign column is read
+    return unique_values(path, campaign_col, metrics=_metrics)
+
+
+def campaign_columns():
+    if st.session_state.campaign_path:
+        return read_header(st.session_state.campaign_path)
+    return st.session_state.campaign_columns
+
+
+@st.cache_data(show_spinner="Finding unique campaigns...", max_entries=16)
+def frame_unique_campaigns(campaign_hash, campaign_col, _campaign_slot, _metrics=None):
+    # Keyed by content hash, so the uploaded frame is read back from the
+    # spill only when its campaigns are first needed
+    campaign_df = _campaign_slot.get()
+    with timed(_metrics, "unique_campaigns") as stage:
+        stage["rows"] = len(campaign_df)
+        return campaign_df[campaign_col].dropna().unique().tolist()
+
+
+def unique_campaigns_for(campaign_col):
+    """
+    Unique campaigns of the uploaded frame or, in large file mode, of the
+    file on disk.
+    """
+    path = st.session_state.campaign_path
+    if path:
+        return scan_unique_campaigns(path, os.path.getmtime(path), campaign_col, _metrics=st.session_state.metrics)
+    return frame_unique_campaigns(st.session_state.campaign_hash, campaign_col, st.session_state.campaign_df,
+                                  _metrics=st.session_state.metrics)
+
+
+@st.cache_resource(max_entries=16)
+def get_hierarchy(master_hash, division_col, brand_col, franchise_col, _master_slot):
+    # Built once per master file and column choice, shared across reruns; the
+    # master frame is read back from the spill only to build it
+    return MasterHierarchy(_master_slot.get(), division_col, brand_col, franchise_col)
+
+
+def export_button(kind, build, file_name, mime, rows=None):
+    """
+    Shows a "Prepare" button that builds an export file on demand, then a
+    download button for the next run only. Built files are kept (spillable)
+    until the applied mapping changes, and the build time is recorded as an
+    export_<kind> stage. The bytes are handed to Streamlit's media store only
+    in the run that shows the download button, so later reruns neither read
+    them back from the spill nor keep a second copy in memory.
+    """
+    exports = st.session_state.setdefault('exports', {})
+    version = st.session_state.get('applied_version', 0)
+    if exports.get('version') != version:
+        exports.clear()
+        exports['version'] = version
+    
+    ready = exports.setdefault('ready', set())
+    if kind in ready:
+        ready.discard(kind)
+        # Clicking does not rerun the app, so the button stays until the next
+        # interaction, which drops it (and its bytes) again
+        st.download_button(
+            label=f"📥 Download {kind}",
+            data=exports[kind].get(),
+            file_name=file_name,
+            mime=mime,
+            on_click="ignore",
+            use_container_width=True
+        )
+    elif st.button(f"⚙️ Prepare {kind}", key=f"prepare_{kind}", use_container_width=True):
+        if kind not in exports:
+            with st.spinner(f"Building {kind} file..."):
+                try:
+                    with st.session_state.metrics.stage(f"export_{kind.lower()}", rows=rows):
+                        exports[kind] = keep(build())
+                except Exception as e:
+                    st.error(f"Error building {kind} file: {str(e)}")
+                    return
+        ready.add(kind)
+        st.rerun()
+
+
+@st.cache_resource
+def get_mapping_cache():
+    # One on-disk cache shared by every session on this server
+    return MappingCache()
+
+
+@st.cache_resource
+def get_mapping_history():
+    # Accepted mappings shared by every session on this server, grown as
+    # mapping files are uploaded and new mappings are applied
+    return MappingHistory()
+
+
+@st.cache_resource
+def get_metrics_logger():
+    # One JSON Lines metrics log shared by every session on this server
+    return configure_json_log(DEFAULT_METRICS_LOG_PATH)
+
+
+def show_diagnostics(metrics):
+    """
+    Sidebar panel with this session's stage timings, model calls, token
+    usage and cache hit rates.
+    """
+    summary = metrics.summary()
+    with st.expander("🩺 Diagnostics"):
+        if summary['stages']:
+            st.dataframe(
+                pd.DataFrame([
+                    {
+                        "Stage": name,
+                        "Runs": stage['count'],
+                        "Last (s)": round(stage['last_seconds'], 3),
+                        "Total (s)": round(stage['seconds'], 3),
+                        "Rows/s": round(stage['rows_per_second']) if stage['rows_per_second'] else None
+                    }
+                    for name, stage in summary['stages'].items()
+                ]),
+                hide_index=True,
+                use_container_width=True
+            )
+        else:
+            st.caption("No timings recorded yet")
+        
+        api = summary['api']
+        if api['calls']:
+            st.markdown(
+                f"**API:** {api['calls']} calls ({api['errors']} failed) · "
+                f"mean {api['mean_seconds']:.1f}s · p95 {api['p95_seconds']:.1f}s · max {api['max_seconds']:.1f}s"
+            )
+            cost = f" · ≈ ${api['cost']:.4f}" if api['cost'] is not None else ""
+            st.markdown(f"**Tokens:** {api['input_tokens']:,} in / {api['output_tokens']:,} out{cost}")
+        
+        for name, cache in summary['caches'].items():
+            st.caption(
+                f"{name}: {cache['hits']} of {cache['hits'] + cache['misses']} hits ({cache['hit_rate']:.0%})"
+            )
+        
+        queries = summary['queries']
+        if queries['count']:
+            st.caption(
+                f"BigQuery: {queries['count']} queries · {queries['rows']:,} rows · "
+                f"{queries['bytes_processed'] / 1e9:.2f} GB processed"
+            )
+        
+        spill_stats = get_session_spill().stats()
+        st.caption(
+            f"Server: {spill_stats['sessions']} sessions · {spill_stats['spilled']} of "
+            f"{spill_stats['slots']} large values spilled to disk"
+        )
+        st.caption(f"Session {summary['session']} · logged to {DEFAULT_METRICS_LOG_PATH}")
+        if st.button("Reset diagnostics"):
+            metrics.reset()
+            st.rerun()
+
+
 # Sidebar for API key
 with st.sidebar:
     st.header("Configuration")
     api_key = st.text_input("Anthropic API Key", type="password", help="Enter your Claude API key")
+    use_cache = st.checkbox("Reuse cached mappings", value=True,
+                            help="Campaigns mapped before for the same brand and franchise list skip the API call")
+    if use_cache:
+        cache_stats = get_mapping_cache().stats()
+        st.caption(
+            f"Cache: {cache_stats['entries']} entries · {cache_stats['hits']} hits / "
+            f"{cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%})"
+        )
+        if st.button("Clear mapping cache"):
+            get_mapping_cache().invalidate()
+            st.rerun()
+    use_prematch = st.checkbox("Pre-match obvious campaigns locally", value=True,
+                               help="Campaigns that clearly contain a franchise name or alias are mapped without the API")
+    use_history = st.checkbox("Learn from past mappings", value=True,
+                              help="Campaigns close to previously accepted mappings reuse their franchise "
+                                   "without the API")
+    if use_history:
+        history_files = st.file_uploader("Past mapping files (Download Mappings CSVs)", type=['csv', 'xlsx', 'xls'],
+                                         accept_multiple_files=True, key="history_files")
+        # Each upload is hashed and parsed once per session (and not at all when
+        # another session already loaded the same content); errors are kept
+        history_uploads = st.session_state.setdefault('history_uploads', {})
+        for history_file in history_files or []:
+            upload_id = getattr(history_file, 'file_id', None) or (history_file.name, history_file.size)
+            if upload_id not in history_uploads:
+                history_uploads[upload_id] = None
+                data = history_file.getvalue()
+                file_hash = content_hash(data)
+                try:
+                    if not get_mapping_history().has_table(file_hash):
+                        get_mapping_history().add_table(read_upload(data, history_file.name), key=file_hash)
+                except Exception as e:
+                    history_uploads[upload_id] = str(e)
+            if history_uploads[upload_id]:
+                st.error(f"Error reading {history_file.name}: {history_uploads[upload_id]}")
+        history_stats = get_mapping_history().stats()
+        st.caption(f"History: {history_stats['campaigns']} campaigns across {history_stats['pairs']} brands")
+    use_canonicalize = st.checkbox("Group campaign variants", value=True,
+                                   help="Campaigns that differ only by dates, flights, versions or platform codes "
+                                        "are sent to the API once")
     st.markdown("---")
     st.markdown("### How it works:")
     st.markdown("""
@@ -30,6 +300,15 @@ if 'master_df' not in st.session_state:
     st.session_state.master_df = None
 if 'campaign_df' not in st.session_state:
     st.session_state.campaign_df = None
+if 'campaign_path' not in st.session_state:
+    st.session_state.campaign_path = None
+if 'metrics' not in st.session_state:
+    st.session_state.metrics = Instrumentation(logger=get_metrics_logger())
+metrics = st.session_state.metrics
+
+# This session is active; frames and export files of idle ones are spilled
+# to disk in the background
+get_session_spill().touch(metrics.session_id)
 
 # File uploads
 st.header("Step 1: Upload Files")
@@ -43,15 +322,12 @@ with col1:
     
     if master_file is not None:
         try:
-            if master_file.name.endswith('.csv'):
-                st.session_state.master_df = pd.read_csv(master_file)
-            else:
-                st.session_state.master_df = pd.read_excel(master_file)
+            upload_to_session(master_file, 'master')
             
-            st.success(f"✅ Loaded: {len(st.session_state.master_df)} rows")
+            st.success(f"✅ Loaded: {st.session_state.master_rows} rows")
             
             with st.expander("Preview Master File"):
-                st.dataframe(st.session_state.master_df.head(10))
+                st.dataframe(st.session_state.master_preview.head(10))
         
         except Exception as e:
             st.error(f"Error reading file: {str(e)}")
@@ -59,25 +335,51 @@ with col1:
 with col2:
     st.subheader("📊 Campaign Data")
     st.caption("Contains campaigns to identify franchises for")
-    campaign_file = st.file_uploader("Upload campaign data", type=['csv', 'xlsx', 'xls'], key="campaign")
+    # Server files can only be read from and written to MAPPING_DATA_DIR
+    large_file = st.checkbox("Large file on the server", disabled=not DEFAULT_DATA_DIR,
+                             help="Multi-GB exports are read from disk in chunks, only the campaign column is "
+                                  "scanned, and the mapped file is streamed to disk instead of held in memory"
+                                  + ("" if DEFAULT_DATA_DIR else " (set MAPPING_DATA_DIR on the server to enable)"))
+    campaign_file = None
+    if large_file and DEFAULT_DATA_DIR:
+        campaign_path = st.text_input("Campaign file path (CSV or Excel)", key="campaign_path_input",
+                                      help=f"Relative to the data directory {DEFAULT_DATA_DIR}").strip()
+        st.session_state.campaign_df = None
+        st.session_state.campaign_path = None
+        if campaign_path:
+            try:
+                resolved_path = resolve_data_path(campaign_path, DEFAULT_DATA_DIR)
+                if not os.path.isfile(resolved_path):
+                    raise FileNotFoundError(f"File not found: {campaign_path}")
+                header = read_header(resolved_path)
+                st.session_state.campaign_path = resolved_path
+                st.success(
+                    f"✅ Found: {len(header)} columns, {os.path.getsize(resolved_path) / 1e9:.2f} GB "
+                    f"(rows are read in chunks)"
+                )
+            except Exception as e:
+                st.error(f"Error reading file: {str(e)}")
+    else:
+        st.session_state.campaign_path = None
+        campaign_file = st.file_uploader("Upload campaign data", type=['csv', 'xlsx', 'xls'], key="campaign")
     
     if campaign_file is not None:
         try:
-            if campaign_file.name.endswith('.csv'):
-                st.session_state.campaign_df = pd.read_csv(campaign_file)
-            else:
-                st.session_state.campaign_df = pd.read_excel(campaign_file)
+            upload_to_session(campaign_file, 'campaign')
             
-            st.success(f"✅ Loaded: {len(st.session_state.campaign_df)} rows")
+            st.success(f"✅ Loaded: {st.session_state.campaign_rows} rows")
             
             with st.expander("Preview Campaign Data"):
-                st.dataframe(st.session_state.campaign_df.head(10))
+                st.dataframe(st.session_state.campaign_preview.head(10))
         
         except Exception as e:
             st.error(f"Error reading file: {str(e)}")
 
-# Only proceed if both files are uploaded
-if st.session_state.master_df is not None and st.session_state.campaign_df is not None:
+# Only proceed if both files are uploaded; the frames themselves stay in their
+# SpillSlots and are read back only by the steps that need every row
+if st.session_state.master_df is not None and (st.session_state.campaign_df is not None
+                                               or st.session_state.campaign_path):
+    master_columns = st.session_state.master_columns
     
     st.markdown("---")
     st.header("Step 2: Map Columns")
@@ -87,19 +389,19 @@ if st.session_state.master_df is not None and st.session_state.campaign_df is no
     with col1:
         st.subheader("Master File Columns")
         division_col = st.selectbox("Division Column", 
-                                    st.session_state.master_df.columns.tolist(),
+                                    master_columns,
                                     key="div_col_select")
         brand_col = st.selectbox("Brand Column", 
-                                st.session_state.master_df.columns.tolist(),
+                                master_columns,
                                 key="brand_col_select")
         franchise_col = st.selectbox("Franchise Column", 
-                                     st.session_state.master_df.columns.tolist(),
+                                     master_columns,
                                      key="franchise_col_select")
     
     with col2:
         st.subheader("Campaign Data Column")
         campaign_col = st.selectbox("Campaign Column (text to analyze)", 
-                                   st.session_state.campaign_df.columns.tolist(),
+                                   campaign_columns(),
                                    key="campaign_col_select")
         
         st.info("💡 AI will read this column to identify which franchise each campaign belongs to")
@@ -108,20 +410,21 @@ if st.session_state.master_df is not None and st.session_state.campaign_df is no
     st.markdown("---")
     st.header("Step 3: Filter by Division & Brand")
     
+    hierarchy = get_hierarchy(
+        st.session_state.master_hash, division_col, brand_col, franchise_col, st.session_state.master_df
+    )
+    
     col1, col2 = st.columns(2)
     
     with col1:
         # Get unique divisions
-        divisions = sorted(st.session_state.master_df[division_col].dropna().unique().tolist())
+        divisions = hierarchy.divisions
         selected_division = st.selectbox("Select Division", divisions)
     
     with col2:
         # Filter brands by division
         if selected_division:
-            filtered_brands = st.session_state.master_df[
-                st.session_state.master_df[division_col] == selected_division
-            ][brand_col].dropna().unique().tolist()
-            filtered_brands = sorted(filtered_brands)
+            filtered_brands = hierarchy.brands_for(selected_division)
             
             selected_brand = st.selectbox("Select Brand", filtered_brands)
     
@@ -137,30 +440,28 @@ if st.session_state.master_df is not None and st.session_state.campaign_df is no
             st.info(f"**Division:** {selected_division}  \n**Brand:** {selected_brand}")
             
             # Show franchises for this division/brand
-            master_filtered = st.session_state.master_df[
-                (st.session_state.master_df[division_col] == selected_division) &
-                (st.session_state.master_df[brand_col] == selected_brand)
-            ]
-            
-            franchises_list = master_filtered[franchise_col].dropna().unique().tolist()
+            franchises_list = hierarchy.franchises_for(selected_division, selected_brand)
             
             st.markdown(f"**{len(franchises_list)} Franchises found:**")
             for franchise in franchises_list:
                 st.markdown(f"- {franchise}")
             
-            with st.expander("View Full Master Data"):
+            # A checkbox rather than an expander, whose body runs on every rerun,
+            # so the master frame is read back only while it is shown
+            if st.checkbox("View Full Master Data"):
+                master_filtered = hierarchy.rows_for(session_value('master_df'), selected_division, selected_brand)
                 st.dataframe(master_filtered, use_container_width=True)
         
         with col2:
             st.subheader("📊 Campaigns to Analyze")
             
             # Get unique campaign values
-            unique_campaigns = st.session_state.campaign_df[campaign_col].dropna().unique().tolist()
+            unique_campaigns = unique_campaigns_for(campaign_col)
             st.info(f"Found **{len(unique_campaigns)}** unique campaigns")
             
             with st.expander("View Sample Campaigns"):
                 st.dataframe(
-                    st.session_state.campaign_df[[campaign_col]].head(20),
+                    pd.DataFrame({campaign_col: unique_campaigns[:20]}),
                     use_container_width=True
                 )
         
@@ -169,6 +470,8 @@ if st.session_state.master_df is not None and st.session_state.campaign_df is no
         st.header("Step 5: AI Franchise Identification")
         
         col1, col2 = st.columns([2, 1])
+        # Full-width area below the columns for live results while mapping runs
+        live_area = st.container()
         
         with col1:
             st.markdown(f"""
@@ -187,74 +490,73 @@ if st.session_state.master_df is not None and st.session_state.campaign_df is no
                             client = anthropic.Anthropic(api_key=api_key)
                             
                             # Prepare unique campaigns for analysis
-                            campaigns_to_analyze = st.session_state.campaign_df[campaign_col].dropna().unique().tolist()
+                            campaigns_to_analyze = unique_campaigns_for(campaign_col)
                             
-                            # Create prompt
-                            prompt = f"""You are a data analysis expert specializing in franchise identification.
-
-**Context:**
-- Division: {selected_division}
-- Brand: {selected_brand}
-
-**Available Franchises (from master file):**
-{json.dumps(franchises_list, indent=2)}
-
-**Campaign Data to Analyze:**
-{json.dumps(campaigns_to_analyze[:100], indent=2)}  
-{"... (showing first 100 campaigns)" if len(campaigns_to_analyze) > 100 else ""}
-
-**Task:**
-Read each campaign name/description and intelligently determine which franchise it belongs to from the available franchises list above.
-
-Look for:
-- Brand names, abbreviations, or variations in the campaign text
-- Keywords that indicate a specific franchise
-- Context clues (franchises, products, brands within the LOreal umbrealla business, etc.)
-- Misspellings or informal references
-
-For campaigns that clearly match one of the available franchises, map them to that franchise name (use EXACT spelling from the available franchises list).
-
-If a campaign doesn't match any franchise or is ambiguous, you can:
-- Map to "Unknown" if truly unclear
-- Make your best educated guess with lower confidence
-
-Return ONLY valid JSON in this exact format:
-{{
-  "mappings": {{
-    "campaign_text_1": "Franchise Name",
-    "campaign_text_2": "Franchise Name",
-    "campaign_text_3": "Unknown"
-  }},
-  "summary": {{
-    "total_campaigns": number,
-    "franchises_identified": {{
-      "Franchise Name 1": count,
-      "Franchise Name 2": count,
-      "Unknown": count
-    }},
-    "confidence": "high/medium/low"
-  }}
-}}
-
-IMPORTANT: Use the EXACT franchise names from the available franchises list above."""
-
-                            # Call Claude API
-                            message = client.messages.create(
-                                model="claude-sonnet-4-20250514",
-                                max_tokens=8000,
-                                messages=[{"role": "user", "content": prompt}]
-                            )
+                            # Map every campaign in token-budgeted chunks
+                            progress_bar = st.progress(0.0, text="Preparing campaign chunks...")
+                            st.button("⏹ Stop", use_container_width=True,
+                                      help="Stop mapping and keep the campaigns mapped so far")
+                            
+                            def show_progress(done, total, chunk):
+                                progress_bar.progress(
+                                    done / total if total else 1.0,
+                                    text=f"Mapped chunk {done} of {total}"
+                                )
                             
-                            # Parse response
-                            response_text = message.content[0].text
+                            # Streamed mappings are kept here, so a stopped run can still be reviewed
+                            st.session_state.pop('mapping_result', None)
+                            st.session_state.pop('streamed_output', None)
+                            partial = {
+                                'mappings': {},
+                                'sources': {},
+                                'division': str(selected_division),
+                                'brand': str(selected_brand),
+                                'campaign_col': str(campaign_col),
+                                'franchises_list': franchises_list
+                            }
+                            st.session_state.partial_mapping = partial
                             
-                            # Try to extract JSON if wrapped in markdown
-                            if "```json" in response_text:
-                                response_text = response_text.split("```json")[1].split("```")[0].strip()
-                            elif "```" in response_text:
-                                response_text = response_text.split("```")[1].split("```")[0].strip()
+                            with live_area:
+                                live_counts = st.empty()
+                                live_table = st.empty()
+                            last_render = [0.0]
                             
-                            mapping_result = json.loads(response_text)
+                            def show_entries(entries, source):
+                                for campaign, franchise in entries:
+                                    partial['mappings'][campaign] = franchise
+                                    partial['sources'][campaign] = source
+                                if time.time() - last_render[0] < LIVE_REFRESH_SECONDS:
+                                    return
+                                last_render[0] = time.time()
+                                live_counts.markdown(
+                                    f"**{len(partial['mappings'])} of {len(campaigns_to_analyze)} campaigns mapped so far**"
+                                )
+                                live_table.dataframe(
+                                    pd.DataFrame({
+                                        "Campaign": list(partial['mappings'].keys()),
+                                        "Identified Franchise": list(partial['mappings'].values()),
+                                        "Source": list(partial['sources'].values())
+                                    }),
+                                    use_container_width=True,
+                                    height=300
+                                )
+                            
+                            mapping_result = map_campaigns(
+                                client,
+                                selected_division,
+                                selected_brand,
+                                franchises_list,
+                                campaigns_to_analyze,
+                                progress_callback=show_progress,
+                                cache=get_mapping_cache() if use_cache else None,
+                                matcher=FranchiseMatcher(franchises_list) if use_prematch else None,
+                                stream=True,
+                                on_entries=show_entries,
+                                metrics=metrics,
+                                canonicalize=use_canonicalize,
+                                history=get_mapping_history() if use_history else None
+                            )
+                            del st.session_state.partial_mapping
                             
                             # Store in session state (use strings, not Timestamp objects)
                             st.session_state.mapping_result = mapping_result
@@ -268,9 +570,37 @@ IMPORTANT: Use the EXACT franchise names from the available franchises list abov
                             
                         except Exception as e:
                             st.error(f"Error: {str(e)}")
-                            if 'response_text' in locals():
-                                with st.expander("Debug: Raw Response"):
-                                    st.code(response_text)
+        
+        # A stopped run leaves its streamed mappings behind for review
+        if 'partial_mapping' in st.session_state and 'mapping_result' not in st.session_state:
+            partial = st.session_state.partial_mapping
+            st.warning(
+                f"⏹ Mapping was stopped after {len(partial['mappings'])} campaigns "
+                f"({partial['division']} / {partial['brand']})."
+            )
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("📋 Review partial results", use_container_width=True):
+                    mapping_result = merge_results([{"mappings": partial['mappings']}])
+                    mapping_result['sources'] = partial['sources']
+                    mapping_result['cancelled'] = True
+                    mapping_result['failed_campaigns'] = [
+                        c for c in map(str, unique_campaigns_for(partial['campaign_col']))
+                        if c not in partial['mappings']
+                    ]
+                    mapping_result['errors'] = ["mapping was stopped"]
+                    
+                    st.session_state.mapping_result = mapping_result
+                    st.session_state.selected_brand = partial['brand']
+                    st.session_state.selected_division = partial['division']
+                    st.session_state.campaign_col_stored = partial['campaign_col']
+                    st.session_state.franchises_list = partial['franchises_list']
+                    del st.session_state.partial_mapping
+                    st.rerun()
+            with col2:
+                if st.button("🗑️ Discard", use_container_width=True):
+                    del st.session_state.partial_mapping
+                    st.rerun()
         
         # Display results if available
         if 'mapping_result' in st.session_state:
@@ -278,6 +608,7 @@ IMPORTANT: Use the EXACT franchise names from the available franchises list abov
             st.header("Step 6: Review Identified Franchises")
             
             mappings = st.session_state.mapping_result['mappings']
+            sources = st.session_state.mapping_result.get('sources', {})
             summary = st.session_state.mapping_result.get('summary', {})
             franchises_identified = summary.get('franchises_identified', {})
             
@@ -295,12 +626,46 @@ IMPORTANT: Use the EXACT franchise names from the available franchises list abov
             confidence = summary.get('confidence', 'N/A')
             st.info(f"🎯 **AI Confidence:** {confidence.upper()}")
             
+            failed_campaigns = st.session_state.mapping_result.get('failed_campaigns', [])
+            if failed_campaigns:
+                errors = st.session_state.mapping_result.get('errors') or ["unknown error"]
+                st.warning(
+                    f"⚠️ {len(failed_campaigns)} campaigns could not be mapped "
+                    f"and will be marked Unknown: {errors[0]}"
+                )
+                # Top-up run over only the missing campaigns
+                if st.button(f"🔁 Map {len(failed_campaigns)} remaining campaigns"):
+                    if not api_key:
+                        st.error("⚠️ Please enter your Anthropic API key in the sidebar")
+                    else:
+                        with st.spinner("AI is analyzing the remaining campaigns..."):
+                            try:
+                                topup = map_campaigns(
+                                    anthropic.Anthropic(api_key=api_key),
+                                    st.session_state.selected_division,
+                                    st.session_state.selected_brand,
+                                    st.session_state.franchises_list,
+                                    failed_campaigns,
+                                    cache=get_mapping_cache() if use_cache else None,
+                                    matcher=FranchiseMatcher(st.session_state.franchises_list) if use_prematch else None,
+                                    metrics=metrics,
+                                    canonicalize=use_canonicalize,
+                                    history=get_mapping_history() if use_history else None
+                                )
+                                st.session_state.mapping_result = combine_results(
+                                    st.session_state.mapping_result, topup
+                                )
+                                st.rerun()
+                            except Exception as e:
+                                st.error(f"Error: {str(e)}")
+            
             # Show mappings table
             with st.expander("📋 View All Mappings", expanded=True):
                 mapping_df = pd.DataFrame([
                     {
                         "Campaign": k, 
                         "Identified Franchise": v,
+                        "Source": sources.get(k, "llm"),
                         "Status": "✅" if v != "Unknown" else "❓"
                     } 
                     for k, v in mappings.items()
@@ -316,101 +681,178 @@ IMPORTANT: Use the EXACT franchise names from the available franchises list abov
             with col1:
                 st.markdown("This will create a new **FRANCHISE** column in your campaign data based on the AI's analysis.")
             
+            if st.session_state.campaign_path:
+                # Large files are mapped chunk by chunk straight to disk
+                stem, _ = os.path.splitext(os.path.relpath(st.session_state.campaign_path,
+                                                           os.path.realpath(DEFAULT_DATA_DIR)))
+                output_path = col1.text_input(
+                    "Output file (.csv or .parquet)",
+                    value=f"{stem}_franchises.{'parquet' if HAS_PYARROW else 'csv'}",
+                    key="stream_output_path",
+                    help=f"Relative to the data directory {DEFAULT_DATA_DIR}"
+                ).strip()
+            
             with col2:
-                if st.button("✨ Apply Mappings", type="primary", use_container_width=True):
-                    df_cleaned = st.session_state.campaign_df.copy()
-                    
-                    # Create new franchise column
-                    df_cleaned['FRANCHISE'] = df_cleaned[campaign_col].map(mappings)
-                    
-                    # For campaigns not in mapping, mark as Unknown
-                    df_cleaned['FRANCHISE'].fillna('Unknown', inplace=True)
-                    
-                    # Add metadata columns
-                    df_cleaned['DIVISION'] = selected_division
-                    df_cleaned['BRAND'] = selected_brand
-                    df_cleaned['MAPPED_DATE'] = pd.Timestamp.now()
-                    
-                    st.session_state.df_cleaned = df_cleaned
+                if st.session_state.campaign_path and st.button("✨ Apply Mappings", type="primary",
+                                                                use_container_width=True):
+                    if not output_path.endswith(('.csv', '.parquet')):
+                        st.error("⚠️ The output file must end in .csv or .parquet")
+                    else:
+                        with st.spinner("Writing mapped file..."):
+                            try:
+                                streamed = stream_apply_mappings(
+                                    st.session_state.campaign_path,
+                                    resolve_data_path(output_path, DEFAULT_DATA_DIR),
+                                    campaign_col,
+                                    mappings,
+                                    sources=sources,
+                                    division=selected_division,
+                                    brand=selected_brand,
+                                    metrics=metrics
+                                )
+                            except Exception as e:
+                                st.error(f"Error: {str(e)}")
+                            else:
+                                streamed['path'] = output_path
+                                st.session_state.streamed_output = streamed
+                                st.session_state.applied_version = st.session_state.get('applied_version', 0) + 1
+                                get_mapping_history().add_mappings(selected_division, selected_brand, mappings)
+                                st.rerun()
+                elif not st.session_state.campaign_path and st.button("✨ Apply Mappings", type="primary",
+                                                                      use_container_width=True):
+                    # The FRANCHISE (Unknown when unmapped), MATCH_SOURCE and metadata
+                    # columns are kept as the mapping itself and only built for the rows
+                    # that are previewed or exported
+                    st.session_state.applied = AppliedMapping(
+                        campaign_col,
+                        mappings,
+                        sources=sources,
+                        division=selected_division,
+                        brand=selected_brand
+                    )
+                    st.session_state.applied_hash = st.session_state.campaign_hash
+                    # Applied mappings count as accepted: later runs can reuse them
+                    get_mapping_history().add_mappings(selected_division, selected_brand, mappings)
+                    # Invalidates any export files built from the previous result
+                    st.session_state.applied_version = st.session_state.get('applied_version', 0) + 1
                     st.success(f"✅ Mappings applied! New FRANCHISE column created.")
                     st.rerun()
             
+            # Large file mode: the mapped file is already on disk
+            streamed = st.session_state.get('streamed_output')
+            if st.session_state.campaign_path and streamed:
+                st.markdown("---")
+                st.header("Step 8: Results")
+                st.success(f"✅ Wrote {streamed['rows']:,} rows to `{streamed['path']}`")
+                
+                file_suffix = f"{selected_brand.replace(' ', '_')}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M')}"
+                export_button(
+                    "Mappings",
+                    lambda: to_csv_bytes(mappings_table(mappings, sources, selected_division, selected_brand)),
+                    f"mappings_{file_suffix}.csv",
+                    "text/csv",
+                    rows=len(mappings)
+                )
+                
+                franchise_counts = pd.Series(streamed['franchise_counts'], dtype="int64")
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.markdown("**Franchise Distribution:**")
+                    st.dataframe(franchise_counts.rename_axis('Franchise').reset_index(name='Count'))
+                with col2:
+                    st.markdown("**Coverage:**")
+                    total = streamed['rows']
+                    identified = total - int(franchise_counts.get('Unknown', 0))
+                    coverage = (identified / total * 100) if total > 0 else 0
+                    st.metric("Identified", f"{identified} / {total}")
+                    st.metric("Coverage", f"{coverage:.1f}%")
+            
             # Download section
-            if 'df_cleaned' in st.session_state:
+            elif (not st.session_state.campaign_path and 'applied' in st.session_state
+                  and st.session_state.applied_hash == st.session_state.campaign_hash):
+                applied = st.session_state.applied
                 st.markdown("---")
                 st.header("Step 8: Download Results")
                 
                 with st.expander("📊 Preview Cleaned Data", expanded=True):
-                    preview_cols = [campaign_col, 'FRANCHISE', 'DIVISION', 'BRAND']
-                    available_cols = [col for col in preview_cols if col in st.session_state.df_cleaned.columns]
-                    st.dataframe(st.session_state.df_cleaned[available_cols].head(30))
+                    preview_df = applied.apply(st.session_state.campaign_preview)
+                    preview_cols = [applied.campaign_col, 'FRANCHISE', 'DIVISION', 'BRAND']
+                    available_cols = [col for col in preview_cols if col in preview_df.columns]
+                    st.dataframe(preview_df[available_cols])
                 
-                # Export options
-                col1, col2, col3 = st.columns(3)
+                # Export options (each file is built only when requested, the
+                # campaign frame being read back from the spill only then)
+                campaign_rows = st.session_state.campaign_rows
+                file_suffix = f"{selected_brand.replace(' ', '_')}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M')}"
+                col1, col2, col3, col4 = st.columns(4)
                 
                 with col1:
                     # CSV download
-                    csv = st.session_state.df_cleaned.to_csv(index=False)
-                    st.download_button(
-                        label="📥 Download CSV",
-                        data=csv,
-                        file_name=f"franchises_identified_{selected_brand.replace(' ', '_')}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M')}.csv",
-                        mime="text/csv",
-                        use_container_width=True
+                    export_button(
+                        "CSV",
+                        lambda: to_csv_bytes(applied.apply(session_value('campaign_df'))),
+                        f"franchises_identified_{file_suffix}.csv",
+                        "text/csv",
+                        rows=campaign_rows
                     )
                 
                 with col2:
-                    # Excel download
-                    output = BytesIO()
-                    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                        st.session_state.df_cleaned.to_excel(writer, index=False, sheet_name='Identified Franchises')
-                    excel_data = output.getvalue()
-                    
-                    st.download_button(
-                        label="📥 Download Excel",
-                        data=excel_data,
-                        file_name=f"franchises_identified_{selected_brand.replace(' ', '_')}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        use_container_width=True
+                    # Excel download, streamed row by row to keep memory flat
+                    export_button(
+                        "Excel",
+                        lambda: to_excel_bytes(applied.apply(session_value('campaign_df')),
+                                               sheet_name='Identified Franchises'),
+                        f"franchises_identified_{file_suffix}.xlsx",
+                        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        rows=campaign_rows
                     )
                 
                 with col3:
+                    # Parquet download for downstream pipelines
+                    if HAS_PYARROW:
+                        export_button(
+                            "Parquet",
+                            lambda: to_parquet_bytes(applied.apply(session_value('campaign_df'))),
+                            f"franchises_identified_{file_suffix}.parquet",
+                            "application/octet-stream",
+                            rows=campaign_rows
+                        )
+                    else:
+                        st.caption("Install pyarrow to enable Parquet export")
+                
+                with col4:
                     # Mapping reference download
-                    mapping_export = pd.DataFrame([
-                        {
-                            "Campaign": k, 
-                            "Franchise": v, 
-                            "Division": selected_division, 
-                            "Brand": selected_brand
-                        }
-                        for k, v in mappings.items()
-                    ])
-                    mapping_csv = mapping_export.to_csv(index=False)
-                    
-                    st.download_button(
-                        label="📥 Download Mappings",
-                        data=mapping_csv,
-                        file_name=f"mappings_{selected_brand.replace(' ', '_')}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M')}.csv",
-                        mime="text/csv",
-                        use_container_width=True
+                    export_button(
+                        "Mappings",
+                        lambda: to_csv_bytes(mappings_table(mappings, sources, selected_division, selected_brand)),
+                        f"mappings_{file_suffix}.csv",
+                        "text/csv",
+                        rows=len(mappings)
                     )
                 
                 # Statistics
                 st.markdown("---")
                 st.subheader("📈 Statistics")
                 
-                franchise_counts = st.session_state.df_cleaned['FRANCHISE'].value_counts()
+                # Counted once per applied mapping, not on every rerun
+                counts = st.session_state.get('applied_counts')
+                if counts is None or counts[0] != st.session_state.applied_version:
+                    with metrics.stage("apply", rows=campaign_rows):
+                        counts = (st.session_state.applied_version,
+                                  applied.franchise_counts(session_value('campaign_df')))
+                    st.session_state.applied_counts = counts
+                franchise_counts = counts[1]
                 
                 col1, col2 = st.columns(2)
                 
                 with col1:
                     st.markdown("**Franchise Distribution:**")
-                    st.dataframe(franchise_counts.reset_index().rename(columns={'index': 'Franchise', 'FRANCHISE': 'Count'}))
+                    st.dataframe(franchise_counts.rename_axis('Franchise').reset_index(name='Count'))
                 
                 with col2:
                     st.markdown("**Coverage:**")
-                    identified = (st.session_state.df_cleaned['FRANCHISE'] != 'Unknown').sum()
-                    total = len(st.session_state.df_cleaned)
+                    total = campaign_rows
+                    identified = total - int(franchise_counts.get('Unknown', 0))
                     coverage = (identified / total * 100) if total > 0 else 0
                     
                     st.metric("Identified", f"{identified} / {total}")
@@ -419,6 +861,10 @@ IMPORTANT: Use the EXACT franchise names from the available franchises list abov
 else:
     st.info("👆 Please upload both the Master File and Campaign Data to continue")
 
+# Rendered last so it includes the timings of this run
+with st.sidebar:
+    show_diagnostics(metrics)
+
 # Footer
 st.markdown("---")
 st.markdown("Built with Streamlit & Claude AI | 🎯 AI-powered franchise identification from campaign text")
\ No newline at end of file
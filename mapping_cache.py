@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".franchise_mapping_cache.sqlite")
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 500000
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+
+def normalize_campaign(campaign):
+    """
+    Normalizes campaign text for cache keys (case and whitespace insensitive).
+    """
+    return re.sub(r"\s+", " ", str(campaign)).strip().lower()
+
+
+def franchises_hash(franchises_list):
+    """
+    Stable hash of a brand's franchise list, independent of order.
+    """
+    payload = json.dumps(sorted(str(f) for f in franchises_list))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MappingCache:
+    """
+    SQLite-backed cache of campaign -> franchise results.
+
+    Entries are keyed by (division, brand, normalized campaign, franchise list
+    hash). When a brand's franchise list changes, its older entries are dropped.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS mappings (
+                division TEXT NOT NULL,
+                brand TEXT NOT NULL,
+                campaign TEXT NOT NULL,
+                franchises_hash TEXT NOT NULL,
+                franchise TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (division, brand, campaign, franchises_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_mappings_accessed ON mappings (accessed_at)")
+        self._conn.commit()
+
+    def get_many(self, division, brand, franchises_list, campaigns):
+        """
+        Returns {campaign: franchise} for the cached campaigns and counts hits/misses.
+        """
+        division, brand = str(division), str(brand)
+        key_hash = franchises_hash(franchises_list)
+        by_norm = {}
+        for campaign in campaigns:
+            by_norm.setdefault(normalize_campaign(campaign), []).append(campaign)
+
+        now = time.time()
+        found = {}
+        norms = list(by_norm)
+        with self._lock:
+            self._invalidate_stale(division, brand, key_hash)
+            for i in range(0, len(norms), LOOKUP_BATCH_SIZE):
+                batch = norms[i:i + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"""SELECT campaign, franchise FROM mappings
+                        WHERE division = ? AND brand = ? AND franchises_hash = ?
+                        AND created_at >= ? AND campaign IN ({placeholders})""",
+                    [division, brand, key_hash, now - self.ttl_seconds] + batch
+                ).fetchall()
+                for norm, franchise in rows:
+                    found[norm] = franchise
+                if rows:
+                    self._conn.executemany(
+                        """UPDATE mappings SET accessed_at = ?
+                           WHERE division = ? AND brand = ? AND campaign = ? AND franchises_hash = ?""",
+                        [(now, division, brand, norm, key_hash) for norm, _ in rows]
+                    )
+            self._conn.commit()
+
+        result = {}
+        for norm, originals in by_norm.items():
+            if norm in found:
+                for campaign in originals:
+                    result[campaign] = found[norm]
+        self.hits += len(result)
+        self.misses += len(campaigns) - len(result)
+        return result
+
+    def put_many(self, division, brand, franchises_list, mappings):
+        """
+        Stores {campaign: franchise} results and evicts old entries if needed.
+        """
+        if not mappings:
+            return
+        division, brand = str(division), str(brand)
+        key_hash = franchises_hash(franchises_list)
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                """INSERT OR REPLACE INTO mappings
+                   (division, brand, campaign, franchises_hash, franchise, created_at, accessed_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                [(division, brand, normalize_campaign(c), key_hash, str(f), now, now)
+                 for c, f in mappings.items()]
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def invalidate(self, division=None, brand=None):
+        """
+        Removes cached entries for a brand, a division, or everything.
+        """
+        clauses, params = [], []
+        if division is not None:
+            clauses.append("division = ?")
+            params.append(str(division))
+        if brand is not None:
+            clauses.append("brand = ?")
+            params.append(str(brand))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            self._conn.execute(f"DELETE FROM mappings {where}", params)
+            self._conn.commit()
+
+    def stats(self):
+        """
+        Returns hit/miss counters and the current number of entries.
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM mappings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self):
+        self._conn.close()
+
+    def _invalidate_stale(self, division, brand, key_hash):
+        # The master file's franchise list for this brand changed
+        self._conn.execute(
+            "DELETE FROM mappings WHERE division = ? AND brand = ? AND franchises_hash != ?",
+            (division, brand, key_hash)
+        )
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM mappings WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM mappings").fetchone()[0]
+        if count > self.max_entries:
+            # Least recently used entries go first
+            self._conn.execute(
+                """DELETE FROM mappings WHERE rowid IN (
+                       SELECT rowid FROM mappings ORDER BY accessed_at LIMIT ?
+                   )""",
+                (count - self.max_entries,)
+            )
@@ -0,0 +1,465 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from canonicalize import canonicalize_series
+from data_io import read_table
+
+# Character n-gram sizes of the TF-IDF vectors (over padded canonical text)
+NGRAM_SIZES = (3, 4)
+DEFAULT_NEIGHBORS = 5
+# Predictions at or above this confidence skip the model
+DEFAULT_HISTORY_THRESHOLD = 0.75
+# Neighbour votes are weighted by similarity ** VOTE_POWER, so an exact match
+# is not outvoted by several loosely similar campaigns
+VOTE_POWER = 6
+# Grams in more than this many documents (e.g. a brand prefix) never generate
+# candidates, and each campaign's candidates come from its rarest grams until
+# their postings reach CANDIDATE_POSTINGS, so the work per campaign does not
+# grow with the index
+COMMON_GRAM_DOC_FREQ = 400
+CANDIDATE_POSTINGS = 1000
+# Candidates per campaign rescored exactly, and unique campaigns per batch
+CANDIDATES_PER_QUERY = 20
+QUERY_BATCH_SIZE = 1024
+
+UNKNOWN_FRANCHISE = "Unknown"
+MAPPING_COLUMNS = ["Campaign", "Franchise", "Division", "Brand"]
+
+
+def ngram_counts(text, sizes=NGRAM_SIZES):
+    """
+    Term frequencies of the character n-grams of text.
+    """
+    padded = f" {text} "
+    counts = {}
+    for n in sizes:
+        for i in range(len(padded) - n + 1):
+            gram = padded[i:i + n]
+            counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+def _group_rank(keys):
+    """
+    Position of each element within its run of equal sorted keys.
+    """
+    if not len(keys):
+        return np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return np.arange(len(keys)) - np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+
+
+def _rarest_entries(queries, doc_freq):
+    """
+    Mask of the query entries (sorted by query) whose grams, taken rarest
+    first, start before the query's postings reach CANDIDATE_POSTINGS.
+    """
+    if not len(queries):
+        return np.zeros(0, dtype=bool)
+    order = np.lexsort((doc_freq, queries))
+    sorted_queries, sorted_freq = queries[order], doc_freq[order]
+    starts = np.flatnonzero(np.r_[True, sorted_queries[1:] != sorted_queries[:-1]])
+    before = np.cumsum(sorted_freq) - sorted_freq
+    before -= np.repeat(before[starts], np.diff(np.r_[starts, len(order)]))
+    mask = np.zeros(len(queries), dtype=bool)
+    mask[order] = before < CANDIDATE_POSTINGS
+    return mask
+
+
+def _range_positions(starts, lengths):
+    """
+    Concatenated arange(start, start + length) for every start and length.
+    """
+    return np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+
+
+def _expand_postings(grams, weights, gram_ptr, posting_docs, posting_tfs):
+    """
+    (entry, document, weight * posting tf) for every posting of every gram
+    entry.
+    """
+    starts = gram_ptr[grams]
+    lengths = gram_ptr[grams + 1] - starts
+    owner = np.repeat(np.arange(len(grams)), lengths)
+    positions = _range_positions(starts, lengths)
+    return owner, posting_docs[positions], weights[owner] * posting_tfs[positions]
+
+
+class NeighborIndex:
+    """
+    Character n-gram TF-IDF index over one brand's accepted campaign ->
+    franchise mappings, with nearest-neighbour prediction.
+
+    Documents are campaigns in canonical form (see canonicalize), so variants
+    that differ only by dates, flights or platform codes are one document and
+    the most recently added franchise wins. The inverted index is built
+    without scipy, as numpy arrays of postings grouped by n-gram.
+
+    The index stores raw term frequencies only, so add() never revisits
+    existing documents: their (document, gram, tf) triplets are appended, the
+    new postings are inserted into the gram-sorted postings and document
+    frequencies are incremented. IDF weights depend on the document count, so
+    they, and the norms of the candidate documents, are computed per
+    prediction.
+    """
+
+    # Triplets are looked up by document * KEY_STRIDE + gram
+    KEY_STRIDE = 2 ** 31
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.texts = []
+        self.labels = []
+        self._doc_ids = {}
+        self._gram_ids = {}
+        self._label_ids = {}
+        self._label_names = []
+        self._label_codes = np.zeros(0, dtype=np.int64)
+        # (document, gram, tf) triplets sorted by document then gram, as
+        # lookup keys; the triplets of document d start at _doc_ptr[d]
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._tfs = np.zeros(0)
+        self._doc_ptr = np.zeros(1, dtype=np.int64)
+        # Documents (and tfs) of gram g are _posting_docs[_gram_ptr[g]:_gram_ptr[g + 1]]
+        self._doc_freq = np.zeros(0, dtype=np.int64)
+        self._gram_ptr = np.zeros(1, dtype=np.int64)
+        self._posting_grams = np.zeros(0, dtype=np.int64)
+        self._posting_docs = np.zeros(0, dtype=np.int64)
+        self._posting_tfs = np.zeros(0)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _label_code(self, franchise):
+        code = self._label_ids.get(franchise)
+        if code is None:
+            code = self._label_ids[franchise] = len(self._label_names)
+            self._label_names.append(franchise)
+        return code
+
+    def add(self, campaigns, franchises):
+        """
+        Adds (or relabels) campaigns with their accepted franchises. Returns
+        the number of new documents.
+        """
+        franchises = [str(f) for f in franchises]
+        with self._lock:
+            texts = canonicalize_series(list(campaigns), set(self.labels) | set(franchises))
+            docs, grams, tfs, codes = [], [], [], []
+            for text, franchise in zip(texts, franchises):
+                doc = self._doc_ids.get(text)
+                if doc is not None:
+                    self.labels[doc] = franchise
+                    if doc < len(self._label_codes):
+                        self._label_codes[doc] = self._label_code(franchise)
+                    else:
+                        codes[doc - len(self._label_codes)] = self._label_code(franchise)
+                    continue
+                doc = len(self.texts)
+                self._doc_ids[text] = doc
+                self.texts.append(text)
+                self.labels.append(franchise)
+                codes.append(self._label_code(franchise))
+                for gram, tf in ngram_counts(text).items():
+                    docs.append(doc)
+                    grams.append(self._gram_ids.setdefault(gram, len(self._gram_ids)))
+                    tfs.append(tf)
+
+            if codes:
+                self._append(np.asarray(docs, dtype=np.int64), np.asarray(grams, dtype=np.int64),
+                             np.asarray(tfs, dtype=float), len(codes))
+                self._label_codes = np.concatenate([self._label_codes, np.asarray(codes, dtype=np.int64)])
+            return len(codes)
+
+    def _append(self, docs, grams, tfs, added):
+        # New documents have the highest ids, so their sorted triplets go last
+        order = np.lexsort((grams, docs))
+        docs, grams, tfs = docs[order], grams[order], tfs[order]
+        self._keys = np.concatenate([self._keys, docs * self.KEY_STRIDE + grams])
+        self._tfs = np.concatenate([self._tfs, tfs])
+        first_doc = len(self._doc_ptr) - 1
+        counts = np.bincount(docs - first_doc, minlength=added)
+        self._doc_ptr = np.concatenate([self._doc_ptr, self._doc_ptr[-1] + np.cumsum(counts)])
+
+        n_grams = len(self._gram_ids)
+        self._doc_freq = np.bincount(grams, minlength=n_grams) + np.pad(
+            self._doc_freq, (0, n_grams - len(self._doc_freq)))
+        self._gram_ptr = np.concatenate([[0], np.cumsum(self._doc_freq)])
+        # Inserted after the gram's existing postings, which keeps every
+        # gram's documents in ascending order
+        order = np.lexsort((docs, grams))
+        positions = np.searchsorted(self._posting_grams, grams[order], side="right")
+        self._posting_grams = np.insert(self._posting_grams, positions, grams[order])
+        self._posting_docs = np.insert(self._posting_docs, positions, docs[order])
+        self._posting_tfs = np.insert(self._posting_tfs, positions, tfs[order])
+
+    def _idf(self):
+        return np.log((1 + len(self.texts)) / (1 + self._doc_freq)) + 1
+
+    def _doc_norms(self, docs, idf):
+        """
+        TF-IDF vector norm of each of the given documents.
+        """
+        starts = self._doc_ptr[docs]
+        lengths = self._doc_ptr[docs + 1] - starts
+        positions = _range_positions(starts, lengths)
+        weights = self._tfs[positions] * idf[self._keys[positions] % self.KEY_STRIDE]
+        owner = np.repeat(np.arange(len(docs)), lengths)
+        return np.sqrt(np.bincount(owner, weights=weights ** 2, minlength=len(docs)))
+
+    def _pair_scores(self, pair_queries, pair_docs, queries, grams, weights):
+        """
+        Dot product over the given grams (query entries queries/grams/weights,
+        sorted by query, weights scaled by IDF) of each (query, document)
+        pair.
+        """
+        starts = np.searchsorted(queries, pair_queries, side="left")
+        lengths = np.searchsorted(queries, pair_queries, side="right") - starts
+        owner = np.repeat(np.arange(len(pair_queries)), lengths)
+        entries = _range_positions(starts, lengths)
+        keys = pair_docs[owner] * self.KEY_STRIDE + grams[entries]
+        positions = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        found = self._keys[positions] == keys
+        contributions = np.where(found, weights[entries] * self._tfs[positions], 0.0)
+        return np.bincount(owner, weights=contributions, minlength=len(pair_queries))
+
+    def predict(self, campaigns, allowed=None, k=DEFAULT_NEIGHBORS):
+        """
+        Predicts a franchise per campaign from its k nearest neighbours by
+        cosine similarity.
+
+        Returns a DataFrame with campaign, franchise, confidence and neighbor
+        (the closest accepted campaign, in canonical form). Only neighbours
+        labelled with a franchise in allowed (when given) vote. Confidence is
+        the best similarity among neighbours with the predicted franchise times
+        that franchise's share of the weighted vote.
+
+        Candidates are the documents sharing one of the campaign's rarest
+        n-grams (see CANDIDATE_POSTINGS) or its exact canonical form; the best
+        CANDIDATES_PER_QUERY of them are rescored with every shared n-gram.
+        """
+        campaigns = pd.Series(list(campaigns), dtype="object").astype(str).reset_index(drop=True)
+        franchise = np.full(len(campaigns), None, dtype=object)
+        confidence = np.zeros(len(campaigns))
+        neighbor = np.full(len(campaigns), None, dtype=object)
+
+        with self._lock:
+            if self.texts and len(campaigns):
+                # Campaigns sharing a canonical form share one lookup
+                codes, uniques = pd.factorize(canonicalize_series(campaigns, set(self.labels)))
+                results = self._nearest(list(uniques), allowed, k)
+                franchise, confidence, neighbor = (values[codes] for values in results)
+
+        return pd.DataFrame({
+            "campaign": campaigns,
+            "franchise": franchise,
+            "confidence": confidence,
+            "neighbor": neighbor,
+        })
+
+    def _query_vectors(self, texts, idf):
+        """
+        (query, gram, weight) entries of the known grams of texts, sorted by
+        query, and each query's norm (unseen grams included).
+        """
+        unseen_idf = np.log(1 + len(self.texts)) + 1
+        queries, grams, tfs = [], [], []
+        unseen = np.zeros(len(texts))
+        for query, text in enumerate(texts):
+            for gram, tf in ngram_counts(text).items():
+                gram_id = self._gram_ids.get(gram)
+                if gram_id is None:
+                    unseen[query] += (tf * unseen_idf) ** 2
+                    continue
+                queries.append(query)
+                grams.append(gram_id)
+                tfs.append(tf)
+        queries = np.asarray(queries, dtype=np.int64)
+        grams = np.asarray(grams, dtype=np.int64)
+        weights = np.asarray(tfs, dtype=float) * idf[grams]
+        norms = np.sqrt(np.bincount(queries, weights=weights ** 2, minlength=len(texts)) + unseen)
+        return queries, grams, weights, norms
+
+    def _nearest(self, texts, allowed, k):
+        n_queries = len(texts)
+        n_docs = len(self.texts)
+        franchise = np.full(n_queries, None, dtype=object)
+        confidence = np.zeros(n_queries)
+        neighbor = np.full(n_queries, None, dtype=object)
+
+        idf = self._idf()
+        queries, grams, weights, query_norms = self._query_vectors(texts, idf)
+        # Document weights are tf * idf, so query weights carry the idf twice
+        weights = weights * idf[grams]
+        doc_freq = self._doc_freq[grams]
+        candidate = _rarest_entries(queries, doc_freq) & (doc_freq <= COMMON_GRAM_DOC_FREQ)
+        exact = np.array([self._doc_ids.get(text, -1) for text in texts], dtype=np.int64)
+        label_names = np.asarray(self._label_names, dtype=object)
+        n_labels = len(label_names)
+        doc_allowed = None
+        if allowed is not None:
+            doc_allowed = np.isin(label_names, list(allowed))[self._label_codes]
+
+        for lo in range(0, n_queries, QUERY_BATCH_SIZE):
+            hi = min(lo + QUERY_BATCH_SIZE, n_queries)
+            entries = slice(*np.searchsorted(queries, [lo, hi]))
+            batch_queries, batch_grams, batch_weights = queries[entries], grams[entries], weights[entries]
+            rare = candidate[entries]
+
+            # Partial scores from the rarest grams, plus exact canonical matches
+            owner, docs, scores = _expand_postings(
+                batch_grams[rare], batch_weights[rare], self._gram_ptr, self._posting_docs, self._posting_tfs
+            )
+            pair_queries = batch_queries[rare][owner]
+            matched = np.flatnonzero(exact[lo:hi] >= 0) + lo
+            pair_keys, inverse = np.unique(
+                np.concatenate([pair_queries * n_docs + docs, matched * n_docs + exact[matched]]),
+                return_inverse=True
+            )
+            scores = np.bincount(inverse, weights=np.concatenate([scores, np.zeros(len(matched))]),
+                                 minlength=len(pair_keys))
+            pair_queries, pair_docs = pair_keys // n_docs, pair_keys % n_docs
+            if doc_allowed is not None:
+                keep = doc_allowed[pair_docs]
+                pair_queries, pair_docs, scores = pair_queries[keep], pair_docs[keep], scores[keep]
+            if not len(pair_queries):
+                continue
+
+            # Best candidates per query, rescored with their other grams
+            # (pairs come sorted by query and document, and lexsort is stable)
+            order = np.lexsort((-scores, pair_queries))
+            order = order[_group_rank(pair_queries[order]) < CANDIDATES_PER_QUERY]
+            pair_queries, pair_docs, scores = pair_queries[order], pair_docs[order], scores[order]
+            scores = scores + self._pair_scores(
+                pair_queries, pair_docs, batch_queries[~rare], batch_grams[~rare], batch_weights[~rare]
+            )
+            candidate_docs, doc_of = np.unique(pair_docs, return_inverse=True)
+            doc_norms = self._doc_norms(candidate_docs, idf)[doc_of]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                similarity = scores / (doc_norms * query_norms[pair_queries])
+            keep = np.isfinite(similarity)
+            pair_queries, pair_docs, similarity = pair_queries[keep], pair_docs[keep], similarity[keep]
+
+            # k nearest per query vote, weighted by similarity ** VOTE_POWER
+            order = np.lexsort((pair_docs, -similarity, pair_queries))
+            order = order[_group_rank(pair_queries[order]) < k]
+            pair_queries, pair_docs, similarity = pair_queries[order], pair_docs[order], similarity[order]
+            labels = self._label_codes[pair_docs]
+            vote_keys, first, inverse = np.unique(pair_queries * n_labels + labels,
+                                                  return_index=True, return_inverse=True)
+            votes = np.bincount(inverse, weights=similarity ** VOTE_POWER, minlength=len(vote_keys))
+            vote_queries = vote_keys // n_labels
+            totals = np.bincount(vote_queries, weights=votes, minlength=n_queries)
+            # Ties go to the label of the closer neighbour
+            order = np.lexsort((first, -votes, vote_queries))
+            winners = order[_group_rank(vote_queries[order]) == 0]
+            winner_queries = vote_queries[winners]
+            best = first[winners]
+            franchise[winner_queries] = label_names[vote_keys[winners] % n_labels]
+            confidence[winner_queries] = np.minimum(1.0, similarity[best] * votes[winners] / totals[winner_queries])
+            neighbor[winner_queries] = [self.texts[doc] for doc in pair_docs[best]]
+
+        return franchise, confidence, neighbor
+
+    def resolve(self, campaigns, threshold=DEFAULT_HISTORY_THRESHOLD, allowed=None):
+        """
+        Returns ({campaign: franchise}, {campaign: "history"}) for predictions
+        with at least threshold confidence.
+        """
+        predictions = self.predict(campaigns, allowed=allowed)
+        confident = predictions[predictions["confidence"] >= threshold]
+        mappings = dict(zip(confident["campaign"], confident["franchise"]))
+        return mappings, dict.fromkeys(mappings, "history")
+
+
+class MappingHistory:
+    """
+    Accepted mappings of every Division/Brand pair, one NeighborIndex each.
+
+    Fed by "Download Mappings" files (Campaign, Franchise, Source, Division,
+    Brand) and by mappings accepted in the app. Unknown mappings are not
+    learned unless learn_unknown=True, so a campaign the model could not place
+    is asked about again.
+    """
+
+    def __init__(self, learn_unknown=False):
+        self.learn_unknown = learn_unknown
+        self._indexes = {}
+        self._loaded = set()
+        self._lock = threading.Lock()
+
+    def index_for(self, division, brand, create=False):
+        key = (str(division), str(brand))
+        with self._lock:
+            if create and key not in self._indexes:
+                self._indexes[key] = NeighborIndex()
+            return self._indexes.get(key)
+
+    def add_mappings(self, division, brand, mappings):
+        """
+        Adds {campaign: franchise} accepted for a pair. Returns the number of
+        new documents.
+        """
+        pairs = [
+            (str(campaign), str(franchise)) for campaign, franchise in mappings.items()
+            if franchise and (self.learn_unknown or franchise != UNKNOWN_FRANCHISE)
+        ]
+        if not pairs:
+            return 0
+        campaigns, franchises = zip(*pairs)
+        return self.index_for(division, brand, create=True).add(campaigns, franchises)
+
+    def has_table(self, key):
+        """
+        Whether a table was already added under key.
+        """
+        with self._lock:
+            return key in self._loaded
+
+    def add_table(self, df, key=None):
+        """
+        Adds a mappings table. A table already added under the same key (e.g.
+        a file's content hash) is skipped. Returns the number of new documents.
+        """
+        missing = [col for col in MAPPING_COLUMNS if col not in df.columns]
+        if missing:
+            raise ValueError(f"Mapping file is missing columns: {', '.join(missing)}")
+        with self._lock:
+            if key is not None and key in self._loaded:
+                return 0
+
+        added = 0
+        table = df[MAPPING_COLUMNS].dropna()
+        for (division, brand), rows in table.groupby(["Division", "Brand"], observed=True, sort=False):
+            added += self.add_mappings(division, brand, dict(zip(rows["Campaign"], rows["Franchise"])))
+        if key is not None:
+            with self._lock:
+                self._loaded.add(key)
+        return added
+
+    def load(self, path):
+        return self.add_table(read_table(path, compact=False), key=str(path))
+
+    @classmethod
+    def from_files(cls, paths, learn_unknown=False):
+        history = cls(learn_unknown=learn_unknown)
+        for path in paths:
+            history.load(path)
+        return history
+
+    def resolve(self, division, brand, franchises_list, campaigns, threshold=DEFAULT_HISTORY_THRESHOLD):
+        """
+        Confident predictions for a pair, restricted to its current franchises.
+        """
+        index = self.index_for(division, brand)
+        if index is None or not len(index):
+            return {}, {}
+        return index.resolve(campaigns, threshold=threshold, allowed=set(map(str, franchises_list)))
+
+    def stats(self):
+        with self._lock:
+            indexes = list(self._indexes.values())
+            files = len(self._loaded)
+        return {"pairs": len(indexes), "campaigns": sum(len(index) for index in indexes), "files": files}
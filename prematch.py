@@ -0,0 +1,303 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Scores assigned per match stage; fuzzy scores are the n-gram similarity itself
+EXACT_SCORE = 1.0
+ALIAS_SCORE = 0.95
+DEFAULT_AUTO_ASSIGN_THRESHOLD = 0.85
+
+# Fuzzy matching settings
+NGRAM_SIZE = 3
+MIN_FUZZY_TOKEN_LENGTH = 4
+MIN_FUZZY_MARGIN = 0.1
+
+# Compact (space-free) and acronym aliases shorter than this are too ambiguous
+MIN_COMPACT_ALIAS_LENGTH = 6
+MIN_ACRONYM_LENGTH = 3
+
+
+def normalize_series(values):
+    """
+    Lowercases text and replaces every run of non-alphanumerics with one space.
+    """
+    return (
+        pd.Series(values, dtype="object").astype(str)
+        .str.lower()
+        .str.replace(r"[^0-9a-z]+", " ", regex=True)
+        .str.strip()
+    )
+
+
+def normalize_text(value):
+    return normalize_series([value]).iloc[0]
+
+
+def ngram_codes(texts, n=NGRAM_SIZE):
+    """
+    Distinct character n-grams of each normalized text padded with one space
+    on each side, as (text index, gram code) arrays sorted by text then code.
+    Normalized text is ASCII, so a gram is coded as n base-128 digits.
+    """
+    padded = [f" {text} " for text in texts]
+    lengths = np.array([len(text) for text in padded], dtype=np.int64)
+    chars = np.frombuffer("".join(padded).encode("ascii"), dtype=np.uint8).astype(np.int64)
+    owners = np.repeat(np.arange(len(padded)), lengths)
+    starts = np.arange(max(0, len(chars) - n + 1))
+    starts = starts[owners[starts] == owners[starts + n - 1]]
+    codes = np.zeros(len(starts), dtype=np.int64)
+    for k in range(n):
+        codes = codes * 128 + chars[starts + k]
+    owners = owners[starts]
+    if len(padded) < 2 ** 62 // 128 ** n:
+        # One sort key per (text, gram) when it fits in an int64
+        keys = np.sort(owners * 128 ** n + codes)
+        return np.divmod(keys[np.r_[True, keys[1:] != keys[:-1]]], 128 ** n)
+    order = np.lexsort((codes, owners))
+    owners, codes = owners[order], codes[order]
+    first = np.r_[True, (owners[1:] != owners[:-1]) | (codes[1:] != codes[:-1])]
+    return owners[first], codes[first]
+
+
+def _range_positions(starts, counts):
+    """
+    Concatenated arange(start, start + count) for every start and count.
+    """
+    return np.repeat(starts, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+class FranchiseMatcher:
+    """
+    Deterministic campaign -> franchise matcher built from a brand's franchise list.
+
+    Matching runs in three stages, each only over campaigns the previous stage
+    left unresolved:
+    - exact: the normalized franchise name appears as whole words in the campaign
+    - alias: a space-free form, acronym or user-supplied alias appears
+    - fuzzy: character n-gram similarity between campaign words and franchise names
+    """
+
+    def __init__(self, franchises_list, aliases=None, ngram_size=NGRAM_SIZE):
+        self.franchises = [str(f) for f in franchises_list]
+        self.ngram_size = ngram_size
+        self.names = normalize_series(self.franchises).tolist()
+
+        # alias text -> franchise index; aliases claimed by two franchises are dropped
+        alias_owner = {}
+        for idx, name in enumerate(self.names):
+            words = name.split()
+            compact = name.replace(" ", "")
+            if len(words) > 1 and len(compact) >= MIN_COMPACT_ALIAS_LENGTH:
+                alias_owner.setdefault(compact, set()).add(idx)
+            acronym = "".join(w[0] for w in words)
+            if len(words) > 1 and len(acronym) >= MIN_ACRONYM_LENGTH:
+                alias_owner.setdefault(acronym, set()).add(idx)
+        if aliases:
+            lookup = {f: i for i, f in enumerate(self.franchises)}
+            for alias, franchise in aliases.items():
+                if franchise in lookup:
+                    alias_owner.setdefault(normalize_text(alias), set()).add(lookup[franchise])
+        self.aliases = {
+            alias: owners.pop() for alias, owners in alias_owner.items()
+            if len(owners) == 1 and alias and alias not in self.names
+        }
+
+        # Inverted n-gram index over franchise names for fuzzy candidates: the
+        # names holding the gram gram_codes[g] are gram_names[gram_ptr[g]:gram_ptr[g + 1]]
+        names, codes = ngram_codes(self.names, ngram_size)
+        self.name_sizes = np.bincount(names, minlength=len(self.names))
+        self.name_words = np.array([len(name.split()) for name in self.names])
+        order = np.argsort(codes, kind="stable")
+        self.gram_codes, counts = np.unique(codes, return_counts=True)
+        self.gram_names = names[order]
+        self.gram_ptr = np.r_[0, np.cumsum(counts)]
+
+    def match(self, campaigns, threshold=None):
+        """
+        Matches campaigns and returns a DataFrame with one row per campaign:
+        campaign, franchise, score and source ("exact", "alias", "fuzzy" or None).
+
+        With a threshold, fuzzy candidates that cannot reach it are skipped,
+        so campaigns scoring below it may be reported unmatched.
+        """
+        campaigns = pd.Series(campaigns, dtype="object").astype(str).reset_index(drop=True)
+        padded = " " + normalize_series(campaigns) + " "
+
+        franchise_idx = np.full(len(campaigns), -1)
+        scores = np.zeros(len(campaigns))
+        sources = np.full(len(campaigns), None, dtype=object)
+
+        exact_idx = self._match_terms(padded, [(name, i) for i, name in enumerate(self.names) if name])
+        hit = exact_idx >= 0
+        franchise_idx[hit] = exact_idx[hit]
+        scores[hit] = EXACT_SCORE
+        sources[hit] = "exact"
+
+        pending = franchise_idx < 0
+        if pending.any() and self.aliases:
+            alias_idx = np.full(len(campaigns), -1)
+            alias_idx[pending] = self._match_terms(padded[pending], list(self.aliases.items()))
+            # Space-free campaigns ("LRPEffaclarDuo") can still carry a compact
+            # alias, as long as it ends a word ("vitaminc" is not in "VitaminC10")
+            still = alias_idx[pending] < 0
+            if still.any():
+                long_aliases = [(a, i) for a, i in self.aliases.items() if len(a) >= MIN_COMPACT_ALIAS_LENGTH]
+                found = self._match_terms(padded[pending][still], long_aliases, whole_words=False)
+                sub = alias_idx[pending]
+                sub[still] = found
+                alias_idx[pending] = sub
+            hit = alias_idx >= 0
+            franchise_idx[hit] = alias_idx[hit]
+            scores[hit] = ALIAS_SCORE
+            sources[hit] = "alias"
+
+        pending = np.flatnonzero(franchise_idx < 0)
+        if len(pending):
+            codes, texts = pd.factorize(padded.iloc[pending].str.strip())
+            cutoff = 0.0 if threshold is None else threshold - MIN_FUZZY_MARGIN
+            fuzzy_idx, fuzzy_scores = self._fuzzy(list(texts), cutoff)
+            fuzzy_idx, fuzzy_scores = fuzzy_idx[codes], fuzzy_scores[codes]
+            hit = fuzzy_idx >= 0
+            franchise_idx[pending[hit]] = fuzzy_idx[hit]
+            scores[pending[hit]] = fuzzy_scores[hit]
+            sources[pending[hit]] = "fuzzy"
+
+        names = np.array(self.franchises + [None], dtype=object)
+        return pd.DataFrame({
+            "campaign": campaigns,
+            "franchise": names[franchise_idx],
+            "score": scores,
+            "source": sources,
+        })
+
+    def resolve(self, campaigns, threshold=DEFAULT_AUTO_ASSIGN_THRESHOLD):
+        """
+        Returns ({campaign: franchise}, {campaign: source}) for confident matches.
+        """
+        matches = self.match(campaigns, threshold=threshold)
+        confident = matches[matches["score"] >= threshold]
+        return (
+            dict(zip(confident["campaign"], confident["franchise"])),
+            dict(zip(confident["campaign"], confident["source"])),
+        )
+
+    def _match_terms(self, padded, terms, whole_words=True):
+        """
+        Vectorized containment test of every term against every campaign.
+
+        With whole_words=False a term may start inside a word and its letters
+        may be split by spaces, but it must still end a word.
+        Returns the franchise index per campaign, or -1 when nothing or more
+        than one franchise matched. A term contained in a longer matching term
+        ("Effaclar" inside "Effaclar Duo") defers to the longer one.
+        """
+        padded = padded.reset_index(drop=True)
+        result = np.full(len(padded), -1)
+        if not len(padded) or not terms:
+            return result
+
+        if whole_words:
+            hits = [padded.str.contains(f" {term} ", regex=False) for term, _ in terms]
+        else:
+            hits = [padded.str.contains(" ?".join(map(re.escape, term.replace(" ", ""))) + " ", regex=True)
+                    for term, _ in terms]
+        hits = np.column_stack([hit.to_numpy() for hit in hits])
+        lengths = np.array([len(term) for term, _ in terms])
+        owners = np.array([idx for _, idx in terms])
+
+        for row in np.flatnonzero(hits.any(axis=1)):
+            matched = np.flatnonzero(hits[row])
+            if len(matched) > 1:
+                longest = matched[lengths[matched] == lengths[matched].max()]
+                texts = [terms[i][0] for i in longest]
+                matched = [m for m in matched
+                           if m in longest or not any(terms[m][0] in t for t in texts)]
+            candidates = set(owners[matched])
+            if len(candidates) == 1:
+                result[row] = candidates.pop()
+        return result
+
+    def _fuzzy(self, texts, cutoff=0.0):
+        """
+        Best fuzzy franchise index and score per normalized text, or -1.
+
+        Every window of one to three words is compared with the franchise
+        names of as many words by the Dice similarity of their n-gram sets; a
+        franchise's score is that of its best window, and the best franchise
+        must lead the runner-up by MIN_FUZZY_MARGIN. All window/name pairs
+        are scored at once from the n-gram postings, skipping pairs whose
+        sizes alone keep their score below cutoff (such a runner-up could not
+        veto a match at cutoff + MIN_FUZZY_MARGIN either).
+        """
+        best_idx = np.full(len(texts), -1)
+        best_scores = np.zeros(len(texts))
+        tokens = pd.Series(texts, dtype="object").str.split().explode().dropna()
+        if tokens.empty or not len(self.gram_codes):
+            return best_idx, best_scores
+
+        # Windows of 1-3 consecutive tokens of the same text, with at least
+        # MIN_FUZZY_TOKEN_LENGTH characters besides spaces
+        token_rows = tokens.index.to_numpy()
+        token_texts = tokens.to_numpy(dtype=object)
+        token_chars = tokens.str.len().to_numpy()
+        rows, windows, words = [], [], []
+        window_texts, window_chars = token_texts, token_chars
+        for size in range(1, 4):
+            if size > 1:
+                window_texts = window_texts[:-1] + " " + token_texts[size - 1:]
+                window_chars = window_chars[:-1] + token_chars[size - 1:]
+            starts = token_rows[:len(window_texts)]
+            keep = (starts == token_rows[size - 1:]) & (window_chars >= MIN_FUZZY_TOKEN_LENGTH)
+            rows.append(starts[keep])
+            windows.append(window_texts[keep])
+            words.append(np.full(keep.sum(), size))
+        rows = np.concatenate(rows)
+        if not len(rows):
+            return best_idx, best_scores
+        window_of, unique_windows = pd.factorize(np.concatenate(windows))
+        window_words = np.zeros(len(unique_windows), dtype=np.int64)
+        window_words[window_of] = np.concatenate(words)
+
+        # (window, gram) for the grams that occur in some franchise name
+        entry_windows, entry_codes = ngram_codes(unique_windows, self.ngram_size)
+        window_sizes = np.bincount(entry_windows, minlength=len(unique_windows))
+        entry_grams = np.minimum(np.searchsorted(self.gram_codes, entry_codes), len(self.gram_codes) - 1)
+        known = self.gram_codes[entry_grams] == entry_codes
+        entry_windows, entry_grams = entry_windows[known], entry_grams[known]
+
+        # Expanded to (window, name) pairs: one per shared gram
+        counts = self.gram_ptr[entry_grams + 1] - self.gram_ptr[entry_grams]
+        pair_windows = np.repeat(entry_windows, counts)
+        pair_names = self.gram_names[_range_positions(self.gram_ptr[entry_grams], counts)]
+        sizes = window_sizes[pair_windows] + self.name_sizes[pair_names]
+        keep = ((window_words[pair_windows] == self.name_words[pair_names])
+                & (2 * np.minimum(window_sizes[pair_windows], self.name_sizes[pair_names]) >= cutoff * sizes))
+        keys, shared = np.unique(pair_windows[keep] * len(self.names) + pair_names[keep], return_counts=True)
+        pair_windows, pair_names = np.divmod(keys, len(self.names))
+        pair_scores = 2 * shared / (window_sizes[pair_windows] + self.name_sizes[pair_names])
+
+        # Scored pairs of each window occurrence, as (row, name, score)
+        ptr = np.searchsorted(pair_windows, np.arange(len(unique_windows) + 1))
+        counts = ptr[window_of + 1] - ptr[window_of]
+        positions = _range_positions(ptr[window_of], counts)
+        rows = np.repeat(rows, counts)
+        names, scores = pair_names[positions], pair_scores[positions]
+        if not len(rows):
+            return best_idx, best_scores
+
+        # Best score per (row, name), then the top two names per row
+        order = np.lexsort((-scores, names, rows))
+        rows, names, scores = rows[order], names[order], scores[order]
+        first = np.r_[True, (rows[1:] != rows[:-1]) | (names[1:] != names[:-1])]
+        rows, names, scores = rows[first], names[first], scores[first]
+        order = np.lexsort((-scores, rows))
+        rows, names, scores = rows[order], names[order], scores[order]
+        top = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        has_runner_up = np.r_[top[1:], len(rows)] - top > 1
+        runner_up = np.zeros(len(top))
+        runner_up[has_runner_up] = scores[top[has_runner_up] + 1]
+        clear = ~has_runner_up | (scores[top] - runner_up >= MIN_FUZZY_MARGIN)
+        best_idx[rows[top[clear]]] = names[top[clear]]
+        best_scores[rows[top[clear]]] = scores[top[clear]]
+        return best_idx, best_scores
@@ -0,0 +1,195 @@
+"""
+Disk spilling of large per-session values in the Streamlit app.
+
+Each session keeps its big frames and export files in SpillSlots handed out by
+one SessionSpill shared by every session on the server. A background thread
+periodically writes the slots of sessions idle for longer than idle_seconds to
+disk and drops them from memory; they are read back the next time their
+session uses them. Slots must hold the only long-lived reference to their
+value, or spilling frees nothing, so sessions should get() a slot's value only
+in the run that needs it. A slot read after its session went idle is skipped
+rather than spilled while the reader may still hold the value.
+"""
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+
+DEFAULT_SPILL_DIR = os.environ.get(
+    "MAPPING_SPILL_DIR", os.path.join(tempfile.gettempdir(), "franchise_mapping_spill")
+)
+DEFAULT_IDLE_SECONDS = 10 * 60
+DEFAULT_SPILL_INTERVAL_SECONDS = 60
+
+
+class SpillSlot:
+    """
+    Holds one DataFrame or bytes value that can be moved to disk and back.
+
+    The value must not be modified in place: once written, the spill file is
+    reused for later spills and only deleted when the slot is discarded.
+    """
+
+    def __init__(self, value, directory=DEFAULT_SPILL_DIR):
+        self.directory = directory
+        self._value = value
+        self._path = None
+        self._lock = threading.Lock()
+        # Last time the value was handed out, set under the lock
+        self.last_used = time.time()
+
+    @property
+    def spilled(self):
+        return self._value is None
+
+    def get(self):
+        """
+        Returns the value, reading it back from disk if it was spilled.
+        """
+        with self._lock:
+            if self._value is None:
+                with open(self._path, "rb") as f:
+                    self._value = pickle.load(f)
+            self.last_used = time.time()
+            return self._value
+
+    def spill(self, idle_since=None):
+        """
+        Drops the value from memory, writing it to disk the first time.
+        With idle_since, a value read after that time is kept. Returns True
+        when memory was freed.
+        """
+        with self._lock:
+            if self._value is None:
+                return False
+            if idle_since is not None and self.last_used > idle_since:
+                return False
+            if self._path is None:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f"{uuid.uuid4().hex}.pkl")
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(self._value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+                self._path = path
+            self._value = None
+            return True
+
+    def discard(self):
+        """
+        Deletes the spill file, if any. A spilled value is lost.
+        """
+        with self._lock:
+            if self._path is not None:
+                try:
+                    os.remove(self._path)
+                except OSError:
+                    pass
+                self._path = None
+
+    def __del__(self):
+        self.discard()
+
+
+class SessionSpill:
+    """
+    Registry of every session's SpillSlots.
+
+    Slots are held weakly, so a value is released as soon as its session
+    replaces or drops it, and sessions that have closed are forgotten once
+    their slots are gone.
+    """
+
+    def __init__(self, idle_seconds=DEFAULT_IDLE_SECONDS, directory=DEFAULT_SPILL_DIR):
+        self.idle_seconds = idle_seconds
+        self.directory = directory
+        self.spills = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # session id -> [last active time, WeakSet of slots]
+        self._sessions = {}
+
+    def _session(self, session_id):
+        return self._sessions.setdefault(session_id, [time.time(), weakref.WeakSet()])
+
+    def slot(self, session_id, value):
+        """
+        New SpillSlot for value, spilled while session_id is idle.
+        """
+        slot = SpillSlot(value, self.directory)
+        with self._lock:
+            self._session(session_id)[1].add(slot)
+        return slot
+
+    def touch(self, session_id, now=None):
+        """
+        Marks a session as active.
+        """
+        with self._lock:
+            self._session(session_id)[0] = time.time() if now is None else now
+
+    def spill_idle(self, now=None):
+        """
+        Spills the slots of sessions idle for longer than idle_seconds and
+        returns how many were moved to disk. Slots read within idle_seconds
+        are kept, so a session that became active again after the idle check
+        never has its value spilled out from under it.
+        """
+        now = time.time() if now is None else now
+        idle_since = now - self.idle_seconds
+        with self._lock:
+            idle = []
+            for session_id, (last_active, slots) in list(self._sessions.items()):
+                if last_active >= idle_since:
+                    continue
+                if not slots:
+                    del self._sessions[session_id]
+                    continue
+                idle.extend(list(slots))
+        # Written outside the registry lock; each slot has its own
+        spilled = sum(slot.spill(idle_since) for slot in idle)
+        with self._lock:
+            self.spills += spilled
+        return spilled
+
+    def start(self, interval_seconds=DEFAULT_SPILL_INTERVAL_SECONDS):
+        """
+        Runs spill_idle every interval_seconds in a daemon thread, so no
+        session's rerun waits for another session's values to be written.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(interval_seconds,),
+                                            name="session-spill", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+
+    def _run(self, interval_seconds):
+        while not self._stop.wait(interval_seconds):
+            try:
+                self.spill_idle()
+            except Exception:
+                # A failed write (e.g. a full disk) leaves the values in memory
+                pass
+
+    def stats(self):
+        with self._lock:
+            slots = [slot for _, session_slots in self._sessions.values() for slot in list(session_slots)]
+            return {
+                "sessions": len(self._sessions),
+                "slots": len(slots),
+                "spilled": sum(slot.spilled for slot in slots),
+                "spills": self.spills,
+            }
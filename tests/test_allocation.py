@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from allocation import AllocationEngine
+
+
+def make_engine():
+    return AllocationEngine(["SPEND"], "DATE", franchise_types={"Effaclar": "Core", "Mela B3": "Innovation"})
+
+
+def spend_frame():
+    return pd.DataFrame({
+        "DIVISION": ["Derm", "Derm", None, "Derm"],
+        "BRAND": ["LRP", None, "LRP", "LRP"],
+        "FRANCHISE": ["Effaclar", "Mela B3", "Effaclar", "Unknown"],
+        "DATE": ["2024-01-05", "2024-01-20", "2024-01-11", "2024-02-02"],
+        "SPEND": [10.0, 20.0, 40.0, 30.0],
+    })
+
+
+def test_update_keeps_rows_with_missing_division_or_brand():
+    result = make_engine().update(spend_frame()).result()
+    assert result["SPEND_total"].sum() == pytest.approx(100.0)
+
+
+def test_chunked_accumulate_matches_update():
+    df = spend_frame()
+    updated = make_engine().update(df)
+    accumulated = make_engine().accumulate(df.iloc[:2]).accumulate(df.iloc[2:]).accumulate(df.iloc[:1])
+    accumulated_once = make_engine().accumulate(df.iloc[:2]).accumulate(df.iloc[2:])
+
+    assert accumulated_once.result()["SPEND_total"].sum() == pytest.approx(100.0)
+    assert accumulated.result()["SPEND_total"].sum() == pytest.approx(110.0)
+    for by in (["DIVISION", "BRAND", "PERIOD"], ["BRAND"], ["PERIOD"]):
+        expected = updated.result(by=by)
+        actual = accumulated_once.result(by=by)
+        assert len(actual) == len(expected)
+        assert actual["SPEND_total"].sum() == pytest.approx(expected["SPEND_total"].sum())
+        assert actual["SPEND_core"].sum() == pytest.approx(expected["SPEND_core"].sum())
+
+
+def test_shares_by_type():
+    result = make_engine().update(spend_frame()).result(by=["PERIOD"])
+    january = result[result["PERIOD"] == pd.Period("2024-01", "M")].iloc[0]
+    assert january["SPEND_core"] == pytest.approx(50.0)
+    assert january["SPEND_innovation"] == pytest.approx(20.0)
+    assert january["SPEND_core_share"] == pytest.approx(50 / 70)
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from batch_mapping import (campaigns_for_pair, chunked_file_campaign_source, file_campaign_source, parse_args,
+                           run_batch)
+from benchmarks.fake_anthropic import FakeAnthropicClient
+
+CAMPAIGNS = pd.DataFrame({
+    "Campaign": ["LRP_Effaclar_Q1", "LRP_Toleriane", "CeraVe_Cleanser", "LRP_Effaclar_Q1"],
+    "Division": ["Derm", "Derm", "Derm", "Derm"],
+    "Brand": ["LRP", "LRP", "CeraVe", "LRP"],
+})
+
+
+def test_campaigns_are_filtered_per_pair():
+    assert campaigns_for_pair(CAMPAIGNS, "Campaign", "Derm", "LRP", "Division", "Brand") == [
+        "LRP_Effaclar_Q1", "LRP_Toleriane"
+    ]
+
+
+def test_missing_pair_columns_need_all_brands():
+    with pytest.raises(ValueError, match="brand column"):
+        file_campaign_source(CAMPAIGNS, "Campaign", campaign_division_col="Division")
+    with pytest.raises(ValueError, match="division or brand column"):
+        campaigns_for_pair(CAMPAIGNS, "Campaign", "Derm", "LRP")
+    source = file_campaign_source(CAMPAIGNS, "Campaign", all_brands=True)
+    assert source("Derm", "LRP") == ["LRP_Effaclar_Q1", "LRP_Toleriane", "CeraVe_Cleanser"]
+
+
+def test_command_line_requires_pair_columns_or_all_brands(capsys):
+    base = ["--master", "master.csv", "--campaigns", "campaigns.csv", "--output", "out.csv"]
+    with pytest.raises(SystemExit):
+        parse_args(base)
+    assert "--all-brands" in capsys.readouterr().err
+    assert parse_args(base + ["--all-brands"]).all_brands
+    args = parse_args(base + ["--campaign-division-col", "Division", "--campaign-brand-col", "Brand"])
+    assert not args.all_brands
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_run_batch_maps_every_pair(tmp_path, chunked):
+    master = pd.DataFrame({
+        "Division": ["Derm", "Derm", "Derm"],
+        "Brand": ["LRP", "LRP", "CeraVe"],
+        "Franchise": ["Effaclar", "Toleriane", "Cleanser"],
+    })
+    if chunked:
+        path = str(tmp_path / "campaigns.csv")
+        CAMPAIGNS.to_csv(path, index=False)
+        source = chunked_file_campaign_source(path, "Campaign", "Division", "Brand")
+    else:
+        source = file_campaign_source(CAMPAIGNS, "Campaign", "Division", "Brand")
+
+    client = FakeAnthropicClient(latency_seconds=0)
+    consolidated, failures = run_batch(client, master, source, "Division", "Brand", "Franchise", workers=2,
+                                       use_prematch=False, canonicalize=False)
+    rows = consolidated.sort_values("Campaign")[["Campaign", "Franchise", "Source", "Division", "Brand"]]
+    assert rows.values.tolist() == [
+        ["CeraVe_Cleanser", "Cleanser", "llm", "Derm", "CeraVe"],
+        ["LRP_Effaclar_Q1", "Effaclar", "llm", "Derm", "LRP"],
+        ["LRP_Toleriane", "Toleriane", "llm", "Derm", "LRP"],
+    ]
+    assert consolidated["MAPPED_DATE"].notna().all()
+    assert failures == []
+    assert client.calls == 2
@@ -0,0 +1,85 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from automation_franchisemodel import get_unique_campaigns
+from bigquery_io import LocalBackend, QueryCache, _parameter_value, normalize_query
+
+TABLE = "project.dataset.campaigns"
+
+
+def test_query_cache_evicts_least_recently_read(tmp_path):
+    df = pd.DataFrame({"value": range(1000)})
+    cache = QueryCache(str(tmp_path))
+    cache.put("SELECT 1", "project", df)
+    entry_bytes = cache.stats()["bytes"]
+    cache.max_bytes = 2 * entry_bytes
+
+    cache.put("SELECT 2", "project", df)
+    # Reading the first entry makes the second the least recently used
+    past = time.time() - 100
+    for name in os.listdir(tmp_path):
+        os.utime(tmp_path / name, (past, os.path.getmtime(tmp_path / name)))
+    assert cache.get("SELECT  1;", "project") is not None
+    cache.put("SELECT 3", "project", df)
+
+    assert cache.stats()["entries"] == 2
+    assert cache.get("SELECT 1", "project") is not None
+    assert cache.get("SELECT 2", "project") is None
+    assert cache.get("SELECT 3", "project") is not None
+
+
+def test_query_cache_expires_entries(tmp_path):
+    cache = QueryCache(str(tmp_path), ttl_seconds=-1)
+    cache.put("SELECT 1", "project", pd.DataFrame({"value": [1]}))
+    assert cache.get("SELECT 1", "project") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_query_cache_entry_removed_before_the_read_is_a_miss(tmp_path, monkeypatch):
+    cache = QueryCache(str(tmp_path))
+    cache.put("SELECT 1", "project", pd.DataFrame({"value": [1]}))
+    read_parquet = pd.read_parquet
+
+    def evicted_read(path, **kwargs):
+        # Another thread clears the cache between the lookup and the read
+        cache.clear()
+        return read_parquet(path, **kwargs)
+
+    monkeypatch.setattr(pd, "read_parquet", evicted_read)
+    assert cache.get("SELECT 1", "project") is None
+    assert cache.stats()["hits"] == 0
+    assert cache.stats()["misses"] == 1
+
+
+def test_normalize_query_keeps_quoted_text():
+    assert normalize_query("SELECT  *\n FROM t WHERE a = 'x  y';") == "SELECT * FROM t WHERE a = 'x  y'"
+
+
+def test_get_unique_campaigns_on_local_backend():
+    backend = LocalBackend()
+    backend.load_table(TABLE, pd.DataFrame({
+        "CAMPAIGN": ["LRP_A", "LRP_A", "LRP_B", None, "CRV_A", "LRP_C"],
+        "DIVISION": ["Derm", "Derm", "Derm", "Derm", "Derm", "Consumer"],
+        "BRAND": ["LRP", "LRP", "LRP", "LRP", "CeraVe", "LRP"],
+    }))
+
+    campaigns = get_unique_campaigns(TABLE, "CAMPAIGN", "project", division_col="DIVISION", division="Derm",
+                                     brand_col="BRAND", brand="LRP", backend=backend)
+    assert sorted(campaigns) == ["LRP_A", "LRP_B"]
+    assert sorted(get_unique_campaigns(TABLE, "CAMPAIGN", "project", backend=backend)) == [
+        "CRV_A", "LRP_A", "LRP_B", "LRP_C"
+    ]
+    assert get_unique_campaigns(TABLE, "CAMPAIGN", "project", division_col="DIVISION", division="Derm",
+                                brand_col="BRAND", brand="Vichy", backend=backend) == []
+
+
+def test_numpy_parameters_keep_their_type():
+    assert _parameter_value(np.int64(3)) == ("INT64", 3)
+    assert _parameter_value(np.float32(0.5)) == ("FLOAT64", 0.5)
+    assert _parameter_value(np.bool_(True)) == ("BOOL", True)
+    assert _parameter_value(True) == ("BOOL", True)
+    assert _parameter_value(np.str_("LRP")) == ("STRING", "LRP")
+    assert type(_parameter_value(np.int64(3))[1]) is int
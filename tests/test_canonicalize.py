@@ -0,0 +1,50 @@
+import pytest
+
+from canonicalize import CampaignClusters, canonicalize_campaign, canonicalize_series
+
+FRANCHISES = ["Effaclar", "Effaclar Duo", "Toleriane", "Anthelios"]
+
+
+@pytest.mark.parametrize("campaign", [
+    "LRP_Effaclar", "lrp-effaclar", "LRP  Effaclar", "LRP.Effaclar", "LRP/Effaclar", "lrp|EFFACLAR",
+])
+def test_separators_and_case_are_normalized(campaign):
+    assert canonicalize_campaign(campaign) == "lrp effaclar"
+
+
+@pytest.mark.parametrize("campaign", [
+    "2024-05-01_LRP_Effaclar", "LRP_Effaclar_2024-05-01", "LRP_Effaclar_05/01/2024", "LRP 01.05.24 Effaclar",
+    "LRP_Effaclar_Q3_2024", "LRP_Effaclar_FY24_v2", "LRP_Effaclar_IG_Feed_W12", "LRP_Effaclar_Jan2024",
+])
+def test_dates_and_noise_tokens_are_stripped(campaign):
+    assert canonicalize_campaign(campaign) == "lrp effaclar"
+
+
+def test_dates_inside_words_are_kept():
+    assert canonicalize_campaign("LRP_Effaclar_Ref12-05-01") == "lrp effaclar ref12 05 01"
+
+
+def test_franchise_words_are_never_noise():
+    assert canonicalize_campaign("LRP_Search_Launch", ["Search"]) == "lrp search"
+    assert canonicalize_campaign("LRP_Search_Launch") == "lrp"
+
+
+def test_campaigns_made_only_of_noise_keep_their_text():
+    assert canonicalize_series(["Q3_2024_FB", "Video"]).tolist() == ["q3 2024 fb", "video"]
+
+
+def test_clusters_group_variants_of_one_campaign():
+    campaigns = [
+        "2024-05-01_LRP_Effaclar", "LRP_Toleriane_FB", "2024-06-15_LRP_Effaclar", "LRP_Effaclar_Duo_IG_v2",
+        "LRP_Toleriane_IG_v3",
+    ]
+    clusters = CampaignClusters(campaigns, FRANCHISES)
+    assert clusters.representatives == ["2024-05-01_LRP_Effaclar", "LRP_Toleriane_FB", "LRP_Effaclar_Duo_IG_v2"]
+    assert len(clusters) == 3
+    assert clusters.fan_out({"2024-05-01_LRP_Effaclar": "Effaclar", "LRP_Toleriane_FB": "Toleriane"}) == {
+        "2024-05-01_LRP_Effaclar": "Effaclar", "2024-06-15_LRP_Effaclar": "Effaclar",
+        "LRP_Toleriane_FB": "Toleriane", "LRP_Toleriane_IG_v3": "Toleriane",
+    }
+    assert clusters.members_of(["LRP_Effaclar_Duo_IG_v2", "Not_A_Member"]) == [
+        "LRP_Effaclar_Duo_IG_v2", "Not_A_Member"
+    ]
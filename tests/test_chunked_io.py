@@ -0,0 +1,83 @@
+import os
+
+import pandas as pd
+import pytest
+
+import chunked_io
+from chunked_io import resolve_data_path, stream_apply_mappings, unique_values
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    pd.DataFrame({"Campaign": ["a", "b", "a", None], "Spend": [1, 2, 3, 4]}).to_csv(tmp_path / "c.csv", index=False)
+    return tmp_path
+
+
+def test_resolve_data_path_stays_inside_the_data_directory(data_dir, tmp_path_factory):
+    outside = tmp_path_factory.mktemp("outside")
+    os.symlink(outside, data_dir / "link")
+    assert resolve_data_path("c.csv", data_dir) == os.path.realpath(data_dir / "c.csv")
+    for path in ["../c.csv", str(outside / "x.csv"), "link/x.csv", "sub/../../x.csv"]:
+        with pytest.raises(ValueError):
+            resolve_data_path(path, data_dir)
+
+
+def test_stream_apply_mappings_rejects_the_source_as_output(data_dir):
+    source = str(data_dir / "c.csv")
+    with pytest.raises(ValueError):
+        stream_apply_mappings(source, os.path.join(str(data_dir), ".", "c.csv"), "Campaign", {"a": "F"})
+    assert len(pd.read_csv(source)) == 4
+
+
+def test_stream_apply_mappings_writes_every_row(data_dir):
+    output = data_dir / "out.csv"
+    result = stream_apply_mappings(str(data_dir / "c.csv"), str(output), "Campaign", {"a": "F"},
+                                   brand="LRP", chunk_rows=2)
+    written = pd.read_csv(output)
+    assert result["rows"] == 4
+    assert result["franchise_counts"] == {"F": 2, "Unknown": 2}
+    assert written["FRANCHISE"].tolist() == ["F", "Unknown", "F", "Unknown"]
+    assert unique_values(str(data_dir / "c.csv"), "Campaign", chunk_rows=2) == ["a", "b"]
+
+
+@pytest.fixture
+def excel_source(tmp_path):
+    # Notes is empty and Code numeric in the first chunk, text in the second
+    path = tmp_path / "c.xlsx"
+    pd.DataFrame({
+        "Campaign": ["a", "b", "a", "c"],
+        "Notes": [None, None, "late note", "x"],
+        "Code": [1, 2, "A-3", "B-4"],
+    }).to_excel(path, index=False)
+    return path
+
+
+def test_parquet_output_has_one_schema_across_chunks(excel_source, tmp_path):
+    output = tmp_path / "out.parquet"
+    result = stream_apply_mappings(str(excel_source), str(output), "Campaign", {"a": "F"}, brand="LRP",
+                                   chunk_rows=2)
+    written = pd.read_parquet(output)
+    assert result["rows"] == 4
+    assert written["Notes"].tolist()[2:] == ["late note", "x"]
+    assert written["Notes"].isna().tolist() == [True, True, False, False]
+    assert written["Code"].tolist() == ["1", "2", "A-3", "B-4"]
+    assert written["FRANCHISE"].tolist() == ["F", "Unknown", "F", "Unknown"]
+    assert pd.api.types.is_datetime64_any_dtype(written["MAPPED_DATE"])
+
+
+def test_failed_mapping_removes_the_partial_output(excel_source, tmp_path, monkeypatch):
+    apply_mappings = chunked_io.apply_mappings
+    calls = []
+
+    def failing_apply(*args, **kwargs):
+        calls.append(1)
+        if len(calls) > 1:
+            raise RuntimeError("disk full")
+        return apply_mappings(*args, **kwargs)
+
+    monkeypatch.setattr(chunked_io, "apply_mappings", failing_apply)
+    output = tmp_path / "out.parquet"
+    with pytest.raises(RuntimeError):
+        stream_apply_mappings(str(excel_source), str(output), "Campaign", {"a": "F"}, chunk_rows=2)
+    assert len(calls) == 2
+    assert not output.exists()
@@ -0,0 +1,54 @@
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+import data_io
+from data_io import content_hash, read_table, read_upload
+
+CSV = b"Division,Brand,Campaign,Spend\nDerm,LRP,LRP_Effaclar_Q1,1.5\nDerm,LRP,LRP_Toleriane,2\n" \
+      b"Derm,CeraVe,CeraVe_Cleanser,3\nDerm,LRP,LRP_Mela,4\n"
+
+
+def expected_frame():
+    return pd.DataFrame({
+        "Division": ["Derm"] * 4,
+        "Brand": ["LRP", "LRP", "CeraVe", "LRP"],
+        "Campaign": ["LRP_Effaclar_Q1", "LRP_Toleriane", "CeraVe_Cleanser", "LRP_Mela"],
+        "Spend": [1.5, 2.0, 3.0, 4.0],
+    })
+
+
+def check_compact(df):
+    expected = expected_frame()
+    assert df.columns.tolist() == expected.columns.tolist()
+    assert df.astype(object).values.tolist() == expected.astype(object).values.tolist()
+    # Repetitive columns become categoricals, unique text stays text
+    assert isinstance(df["Division"].dtype, pd.CategoricalDtype)
+    assert isinstance(df["Brand"].dtype, pd.CategoricalDtype)
+    assert not isinstance(df["Campaign"].dtype, pd.CategoricalDtype)
+
+
+@pytest.mark.parametrize("has_pyarrow", [True, False])
+def test_read_upload_csv(monkeypatch, has_pyarrow):
+    monkeypatch.setattr(data_io, "HAS_PYARROW", has_pyarrow)
+    check_compact(read_upload(CSV, "campaigns.csv"))
+
+
+def test_read_upload_excel():
+    buffer = BytesIO()
+    expected_frame().to_excel(buffer, index=False)
+    check_compact(read_upload(buffer.getvalue(), "campaigns.xlsx"))
+
+
+def test_read_table_path_without_compacting(tmp_path):
+    path = tmp_path / "campaigns.csv"
+    path.write_bytes(CSV)
+    df = read_table(str(path), compact=False)
+    assert not any(isinstance(dtype, pd.CategoricalDtype) for dtype in df.dtypes)
+    assert df["Campaign"].tolist() == expected_frame()["Campaign"].tolist()
+
+
+def test_content_hash_depends_only_on_bytes():
+    assert content_hash(CSV) == content_hash(bytes(CSV))
+    assert content_hash(CSV) != content_hash(CSV + b"\n")
@@ -0,0 +1,70 @@
+import sys
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+import exports
+from exports import to_csv_bytes, to_excel_bytes, to_parquet_bytes
+from franchise_mapping import AppliedMapping
+
+MAPPED_DATE = pd.Timestamp("2024-05-01 09:30:00")
+COLUMNS = ["Campaign", "Spend", "FRANCHISE", "MATCH_SOURCE", "DIVISION", "BRAND", "MAPPED_DATE"]
+ROWS = [
+    ["LRP_Effaclar_Q1", 1.5, "Effaclar", "llm", "Derm", "LRP", MAPPED_DATE],
+    ["LRP_Brand", 2.0, "Unknown", "unmapped", "Derm", "LRP", MAPPED_DATE],
+    ["LRP_Toleriane", None, "Toleriane", "prematch", "Derm", "LRP", MAPPED_DATE],
+]
+
+
+@pytest.fixture
+def applied_df():
+    campaigns = pd.DataFrame({
+        "Campaign": pd.Series(["LRP_Effaclar_Q1", "LRP_Brand", "LRP_Toleriane"], dtype="category"),
+        "Spend": [1.5, 2.0, None],
+    })
+    applied = AppliedMapping(
+        "Campaign",
+        {"LRP_Effaclar_Q1": "Effaclar", "LRP_Toleriane": "Toleriane"},
+        sources={"LRP_Effaclar_Q1": "llm", "LRP_Toleriane": "prematch"},
+        division="Derm",
+        brand="LRP",
+        mapped_date=MAPPED_DATE,
+    )
+    return applied.apply(campaigns)
+
+
+def as_rows(df):
+    df = df.astype(object)
+    return df.where(df.notna(), None).values.tolist()
+
+
+def test_csv_export_contents(applied_df):
+    df = pd.read_csv(BytesIO(to_csv_bytes(applied_df)), parse_dates=["MAPPED_DATE"])
+    assert df.columns.tolist() == COLUMNS
+    assert as_rows(df) == ROWS
+
+
+def test_parquet_export_contents(applied_df):
+    df = pd.read_parquet(BytesIO(to_parquet_bytes(applied_df)))
+    assert df.columns.tolist() == COLUMNS
+    assert as_rows(df) == ROWS
+
+
+@pytest.mark.parametrize("engine", ["xlsxwriter", "openpyxl", "in_memory"])
+def test_excel_export_contents(applied_df, monkeypatch, engine):
+    if engine == "openpyxl":
+        # Falls back to openpyxl's write-only mode without xlsxwriter
+        monkeypatch.setitem(sys.modules, "xlsxwriter", None)
+    elif engine == "xlsxwriter":
+        pytest.importorskip("xlsxwriter")
+    data = to_excel_bytes(applied_df, sheet_name="Identified Franchises", constant_memory=engine != "in_memory")
+    df = pd.read_excel(BytesIO(data), sheet_name="Identified Franchises")
+    assert df.columns.tolist() == COLUMNS
+    assert as_rows(df) == ROWS
+
+
+def test_excel_export_rejects_too_many_rows(applied_df, monkeypatch):
+    monkeypatch.setattr(exports, "EXCEL_MAX_ROWS", 3)
+    with pytest.raises(ValueError, match="use CSV or Parquet"):
+        to_excel_bytes(applied_df)
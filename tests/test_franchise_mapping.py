@@ -0,0 +1,210 @@
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.fake_anthropic import FakeAnthropicClient
+from franchise_mapping import (AppliedMapping, StreamingMappingParser, apply_mappings, build_request,
+                               chunk_campaigns, compact_json, estimate_tokens, map_campaigns,
+                               parse_response_tolerant)
+from mapping_cache import MappingCache
+
+FRANCHISES = ["Effaclar", "Effaclar Duo", "Mela B3", "Toleriane"]
+
+
+def test_chunk_campaigns_respects_max_campaigns():
+    campaigns = [f"LRP_Effaclar_{i}" for i in range(25)]
+    chunks = chunk_campaigns(campaigns, FRANCHISES, max_campaigns=10)
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert [c for chunk in chunks for c in chunk] == campaigns
+
+
+def test_chunk_campaigns_respects_token_budgets():
+    campaigns = [f"LRP_Toleriane_Spring_Launch_Video_{i:04d}" for i in range(200)]
+    output_budget = 300
+    chunks = chunk_campaigns(campaigns, FRANCHISES, output_token_budget=output_budget)
+    assert len(chunks) > 1
+    longest_franchise = max(estimate_tokens(f) for f in FRANCHISES)
+    for chunk in chunks:
+        output = sum(estimate_tokens(compact_json(c)) + longest_franchise + 4 for c in chunk)
+        assert output <= output_budget
+
+    chunks = chunk_campaigns(campaigns, FRANCHISES, input_token_budget=1000)
+    assert len(chunks) > 1
+    assert [c for chunk in chunks for c in chunk] == campaigns
+
+
+def test_chunk_campaigns_keeps_an_oversized_campaign_in_its_own_chunk():
+    chunks = chunk_campaigns(["x" * 4000, "short"], FRANCHISES, output_token_budget=100)
+    assert chunks == [["x" * 4000], ["short"]]
+
+
+def response_text(mappings):
+    return json.dumps({"mappings": mappings, "summary": {"total_campaigns": len(mappings)}}, indent=2)
+
+
+def test_streaming_parser_yields_only_complete_entries():
+    text = response_text({"LRP_Effaclar_A": "Effaclar", "LRP_Mela_B": "Mela B3", "LRP_Tol_C": "Toleriane"})
+    cut = text.index("Toleriane") + 4
+
+    parser = StreamingMappingParser()
+    entries = []
+    for start in range(0, cut, 7):
+        entries.extend(parser.feed(text[start:min(start + 7, cut)]))
+
+    assert entries == [("LRP_Effaclar_A", "Effaclar"), ("LRP_Mela_B", "Mela B3")]
+    assert not parser.complete
+    assert parser.feed(text[cut:]) == [("LRP_Tol_C", "Toleriane")]
+    assert parser.complete
+
+
+def test_parse_response_tolerant_salvages_truncated_json():
+    text = response_text({"LRP_Effaclar_A": "Effaclar", "LRP_Mela_B": "Mela B3"})
+    result = parse_response_tolerant(text[:text.index("Mela B3")])
+    assert result["truncated"]
+    assert result["mappings"] == {"LRP_Effaclar_A": "Effaclar"}
+    assert "truncated" not in parse_response_tolerant(text)
+
+
+def test_map_campaigns_with_fake_client():
+    client = FakeAnthropicClient(latency_seconds=0)
+    campaigns = ["LRP_EffaclarDuo_Q1", "LRP_Mela_B3_Video", "LRP_Toleriane_Search", "LRP_Brand_Always_On"]
+    result = map_campaigns(client, "Derm", "LRP", FRANCHISES, campaigns, max_campaigns=2, canonicalize=False)
+    assert result["mappings"] == {
+        "LRP_EffaclarDuo_Q1": "Effaclar Duo",
+        "LRP_Mela_B3_Video": "Mela B3",
+        "LRP_Toleriane_Search": "Toleriane",
+        "LRP_Brand_Always_On": "Unknown",
+    }
+    assert result["failed_campaigns"] == []
+    assert client.calls == 2
+
+
+class _CancellingStream:
+    """
+    Wraps a fake stream and sets cancel_event once the response text contains
+    marker, as a user pressing Stop mid-response would.
+    """
+
+    def __init__(self, stream, cancel_event, marker):
+        self._stream = stream
+        self._cancel_event = cancel_event
+        self._marker = marker
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        seen = ""
+        for piece in self._stream.text_stream:
+            seen += piece
+            if self._marker in seen:
+                self._cancel_event.set()
+            yield piece
+
+    def get_final_message(self):
+        return self._stream.get_final_message()
+
+
+def test_cancelled_stream_keeps_partial_results(tmp_path):
+    client = FakeAnthropicClient(latency_seconds=0, stream_chunk_chars=1)
+    cancel_event = threading.Event()
+    stream = client.messages.stream
+    client.messages.stream = lambda **request_args: _CancellingStream(
+        stream(**request_args), cancel_event, '"Effaclar Duo",'
+    )
+    cache = MappingCache(str(tmp_path / "cache.sqlite"))
+    received = []
+    campaigns = ["LRP_EffaclarDuo_Q1", "LRP_Mela_B3_Video", "LRP_Toleriane_Search"]
+
+    result = map_campaigns(client, "Derm", "LRP", FRANCHISES, campaigns, stream=True, cache=cache,
+                           on_entries=lambda pairs, source: received.extend(pairs), cancel_event=cancel_event,
+                           canonicalize=False)
+    assert result["cancelled"]
+    assert result["mappings"] == {"LRP_EffaclarDuo_Q1": "Effaclar Duo"}
+    assert result["sources"] == {"LRP_EffaclarDuo_Q1": "llm"}
+    assert result["failed_campaigns"] == ["LRP_Mela_B3_Video", "LRP_Toleriane_Search"]
+    assert result["errors"] == []
+    assert received == [("LRP_EffaclarDuo_Q1", "Effaclar Duo")]
+    # What was mapped before the stop is kept for the next run
+    assert cache.get_many("Derm", "LRP", FRANCHISES, campaigns) == {"LRP_EffaclarDuo_Q1": "Effaclar Duo"}
+
+
+def test_cancel_before_the_run_sends_nothing():
+    client = FakeAnthropicClient(latency_seconds=0)
+    cancel_event = threading.Event()
+    cancel_event.set()
+    result = map_campaigns(client, "Derm", "LRP", FRANCHISES, ["LRP_Effaclar_Q1"], stream=True,
+                           cancel_event=cancel_event, canonicalize=False)
+    assert result["cancelled"]
+    assert result["mappings"] == {}
+    assert result["failed_campaigns"] == ["LRP_Effaclar_Q1"]
+    assert client.calls == 0
+
+
+def test_unknown_mappings_are_not_cached(tmp_path):
+    cache = MappingCache(str(tmp_path / "cache.sqlite"))
+    campaigns = ["LRP_Effaclar_Q1", "LRP_Brand_Always_On"]
+    map_campaigns(FakeAnthropicClient(latency_seconds=0), "Derm", "LRP", FRANCHISES, campaigns, cache=cache,
+                  canonicalize=False)
+    assert cache.get_many("Derm", "LRP", FRANCHISES, campaigns) == {"LRP_Effaclar_Q1": "Effaclar"}
+
+    client = FakeAnthropicClient(latency_seconds=0)
+    result = map_campaigns(client, "Derm", "LRP", FRANCHISES, campaigns, cache=cache, canonicalize=False)
+    assert result["sources"] == {"LRP_Effaclar_Q1": "cache", "LRP_Brand_Always_On": "llm"}
+    assert client.calls == 1
+
+
+def test_system_prompt_is_marked_for_caching():
+    request = build_request("Derm", "LRP", FRANCHISES, ["LRP_A"])
+    assert request["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert "LRP_A" not in request["system"][0]["text"]
+
+
+def test_long_system_prompt_is_reused_across_chunks():
+    many_franchises = [f"Franchise {i:04d}" for i in range(400)]
+    client = FakeAnthropicClient(latency_seconds=0)
+    campaigns = [f"LRP_Campaign_{i}" for i in range(4)]
+    map_campaigns(client, "Derm", "LRP", many_franchises, campaigns, max_workers=1, max_campaigns=1,
+                  canonicalize=False)
+    assert client.cache_write_tokens > 0
+    assert client.cache_read_tokens == 3 * client.cache_write_tokens
+
+
+def test_short_system_prompt_is_below_the_cache_minimum():
+    client = FakeAnthropicClient(latency_seconds=0)
+    map_campaigns(client, "Derm", "LRP", FRANCHISES, ["LRP_Effaclar_A", "LRP_Mela_B"], max_workers=1,
+                  max_campaigns=1, canonicalize=False)
+    assert client.cache_write_tokens == client.cache_read_tokens == 0
+
+
+@pytest.mark.parametrize("categorical", [False, True])
+def test_applied_mapping_matches_apply_mappings(categorical):
+    df = pd.DataFrame({
+        "CAMPAIGN": ["LRP_Effaclar_A", "LRP_Mela_B", None, "LRP_Other", "LRP_Effaclar_A", 7],
+        "SPEND": np.arange(6, dtype=float),
+    })
+    if categorical:
+        df["CAMPAIGN"] = df["CAMPAIGN"].astype(str).replace("None", np.nan).astype("category")
+    mappings = {"LRP_Effaclar_A": "Effaclar", "LRP_Mela_B": "Mela B3", "nan": "Toleriane", "7": "Effaclar"}
+    sources = {"LRP_Effaclar_A": "cache", "LRP_Mela_B": "llm"}
+    mapped_date = pd.Timestamp("2024-03-01")
+
+    expected = apply_mappings(df, "CAMPAIGN", mappings, sources, "Derm", "LRP", mapped_date)
+    applied = AppliedMapping("CAMPAIGN", mappings, sources, "Derm", "LRP", mapped_date)
+    actual = applied.apply(df)
+
+    assert list(actual.columns) == list(expected.columns)
+    for column in ["FRANCHISE", "MATCH_SOURCE", "DIVISION", "BRAND"]:
+        assert actual[column].astype(str).tolist() == expected[column].astype(str).tolist()
+    assert (actual["MAPPED_DATE"] == expected["MAPPED_DATE"]).all()
+    pd.testing.assert_frame_equal(actual[["CAMPAIGN", "SPEND"]], df)
+
+    counts = expected["FRANCHISE"].value_counts()
+    assert applied.franchise_counts(df).to_dict() == counts.to_dict()
@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+from hierarchy import MasterHierarchy
+
+
+@pytest.fixture
+def master_df():
+    return pd.DataFrame({
+        "Division": ["Derm", "Derm", "Consumer", "Derm", "Derm", None],
+        "Brand": ["LRP", "LRP", "Garnier", "CeraVe", "LRP", "LRP"],
+        "Franchise": ["Toleriane", "Effaclar", "Fructis", None, "Toleriane", "Orphan"],
+    })
+
+
+def test_dropdowns_and_franchises(master_df):
+    hierarchy = MasterHierarchy(master_df, "Division", "Brand", "Franchise")
+    assert hierarchy.divisions == ["Consumer", "Derm"]
+    assert hierarchy.brands_for("Derm") == ["CeraVe", "LRP"]
+    assert hierarchy.brands_for("Unknown") == []
+    # Master file order, without duplicates or missing values
+    assert hierarchy.franchises_for("Derm", "LRP") == ["Toleriane", "Effaclar"]
+    assert hierarchy.franchises_for("Derm", "CeraVe") == []
+
+
+def test_rows_for_pair(master_df):
+    hierarchy = MasterHierarchy(master_df, "Division", "Brand", "Franchise")
+    rows = hierarchy.rows_for(master_df, "Derm", "LRP")
+    assert rows.index.tolist() == [0, 1, 4]
+    assert hierarchy.rows_for(master_df, "Derm", "Garnier").empty
+
+
+def test_pairs_skip_pairs_without_franchises(master_df):
+    hierarchy = MasterHierarchy(master_df, "Division", "Brand", "Franchise")
+    assert list(hierarchy.pairs()) == [
+        ("Consumer", "Garnier", ["Fructis"]),
+        ("Derm", "LRP", ["Toleriane", "Effaclar"]),
+    ]
+
+
+def test_categorical_master_and_shared_columns(master_df):
+    hierarchy = MasterHierarchy(master_df.astype("category"), "Division", "Brand", "Franchise")
+    assert hierarchy.franchises_for("Derm", "LRP") == ["Toleriane", "Effaclar"]
+
+    same = MasterHierarchy(master_df, "Brand", "Brand", "Franchise")
+    assert same.divisions == ["CeraVe", "Garnier", "LRP"]
+    assert same.brands_for("LRP") == ["LRP"]
+    assert same.franchises_for("LRP", "LRP") == ["Toleriane", "Effaclar", "Orphan"]
@@ -0,0 +1,100 @@
+import json
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_anthropic import FakeAnthropicClient
+from franchise_mapping import map_campaigns
+from instrumentation import METRICS_LOGGER_NAME, Instrumentation, configure_json_log, estimate_cost, timed
+
+MODEL = "claude-sonnet-4-20250514"
+
+
+@pytest.fixture
+def json_log(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    yield path, configure_json_log(str(path))
+    logger = logging.getLogger(METRICS_LOGGER_NAME)
+    for handler in list(logger.handlers):
+        if getattr(handler, "baseFilename", None) == str(path):
+            logger.removeHandler(handler)
+            handler.close()
+
+
+def test_stages_accumulate_and_record_errors():
+    metrics = Instrumentation()
+    with metrics.stage("parse", rows=10):
+        pass
+    with metrics.stage("parse") as info:
+        info["rows"] = 5
+    with pytest.raises(KeyError):
+        with metrics.stage("apply"):
+            raise KeyError("campaign")
+
+    stages = metrics.summary()["stages"]
+    assert stages["parse"]["count"] == 2
+    assert stages["parse"]["rows"] == 15
+    assert stages["apply"]["count"] == 1
+    with timed(None, "ignored", rows=3) as info:
+        assert info == {"rows": 3}
+
+
+def test_api_call_tokens_and_cost():
+    metrics = Instrumentation()
+    usage = SimpleNamespace(input_tokens=1000, output_tokens=200, cache_read_input_tokens=2000,
+                            cache_creation_input_tokens=0)
+    metrics.record_api_call(MODEL, 1.0, usage=usage, campaigns=20)
+    metrics.record_api_call(MODEL, 3.0, error="RateLimitError")
+    metrics.record_api_call("unpriced-model", 2.0, usage=usage)
+
+    api = metrics.summary()["api"]
+    assert api["calls"] == 3
+    assert api["errors"] == 1
+    assert api["mean_seconds"] == 2.0
+    assert api["max_seconds"] == 3.0
+    assert api["input_tokens"] == 2000
+    assert api["cache_read_tokens"] == 4000
+    # (1000 * 3 + 2000 * 0.3 + 200 * 15) / 1e6, unpriced models left out
+    assert api["cost"] == pytest.approx(0.0066)
+    assert estimate_cost("unpriced-model", 1, 1) is None
+
+
+def test_cache_hit_rates_and_queries():
+    metrics = Instrumentation()
+    metrics.record_cache("mapping_cache", 3, 1)
+    metrics.record_cache("mapping_cache", 0, 4)
+    metrics.record_query(0.5, rows=100, bytes_processed=2048)
+    metrics.record_query(0.25, cache_hit=True)
+
+    summary = metrics.summary()
+    assert summary["caches"]["mapping_cache"] == {"hits": 3, "misses": 5, "hit_rate": 0.375}
+    assert summary["queries"] == {"count": 2, "seconds": 0.75, "rows": 100, "bytes_processed": 2048}
+
+
+def test_events_are_logged_as_json_lines(json_log):
+    path, logger = json_log
+    assert configure_json_log(str(path)) is logger
+    metrics = Instrumentation(session_id="session-1", logger=logger, context={"division": "Derm"})
+    with metrics.stage("prematch", rows=4):
+        pass
+    metrics.record_cache("prematch", 3, 1)
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [record["event"] for record in records] == ["stage", "cache"]
+    assert all(record["session"] == "session-1" and record["division"] == "Derm" for record in records)
+    assert records[0]["stage"] == "prematch"
+    assert records[0]["rows"] == 4
+
+
+def test_map_campaigns_records_every_model_call():
+    metrics = Instrumentation()
+    client = FakeAnthropicClient(latency_seconds=0)
+    campaigns = ["LRP_Effaclar_Q1", "LRP_Toleriane_Q1", "LRP_Mela_B3"]
+    map_campaigns(client, "Derm", "LRP", ["Effaclar", "Toleriane", "Mela B3"], campaigns, max_campaigns=1,
+                  canonicalize=False, metrics=metrics)
+
+    summary = metrics.summary()
+    assert summary["api"]["calls"] == client.calls == 3
+    assert summary["api"]["input_tokens"] == client.input_tokens
+    assert summary["api"]["output_tokens"] == client.output_tokens
@@ -0,0 +1,66 @@
+import time
+
+from mapping_cache import MappingCache
+
+FRANCHISES = ["Effaclar", "Mela B3"]
+
+
+def make_cache(tmp_path, **options):
+    return MappingCache(str(tmp_path / "cache.sqlite"), **options)
+
+
+def test_lookups_ignore_case_and_whitespace(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many("Derm", "LRP", FRANCHISES, {"LRP  Effaclar A": "Effaclar"})
+    assert cache.get_many("Derm", "LRP", FRANCHISES, ["lrp effaclar a", "LRP_Other"]) == {
+        "lrp effaclar a": "Effaclar"
+    }
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_expired_entries_are_not_returned(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, ttl_seconds=60)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    cache.put_many("Derm", "LRP", FRANCHISES, {"LRP_A": "Effaclar"})
+    assert cache.get_many("Derm", "LRP", FRANCHISES, ["LRP_A"]) == {"LRP_A": "Effaclar"}
+
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get_many("Derm", "LRP", FRANCHISES, ["LRP_A"]) == {}
+    cache.put_many("Derm", "LRP", FRANCHISES, {"LRP_B": "Mela B3"})
+    assert cache.stats()["entries"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, max_entries=2)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    cache.put_many("Derm", "LRP", FRANCHISES, {"LRP_A": "Effaclar", "LRP_B": "Mela B3"})
+
+    monkeypatch.setattr(time, "time", lambda: now + 1)
+    cache.get_many("Derm", "LRP", FRANCHISES, ["LRP_A"])
+    monkeypatch.setattr(time, "time", lambda: now + 2)
+    cache.put_many("Derm", "LRP", FRANCHISES, {"LRP_C": "Effaclar"})
+
+    assert cache.get_many("Derm", "LRP", FRANCHISES, ["LRP_A", "LRP_B", "LRP_C"]) == {
+        "LRP_A": "Effaclar", "LRP_C": "Effaclar"
+    }
+
+
+def test_invalidate_by_brand(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many("Derm", "LRP", FRANCHISES, {"LRP_A": "Effaclar"})
+    cache.put_many("Derm", "CeraVe", FRANCHISES, {"CRV_A": "Effaclar"})
+    cache.invalidate(brand="LRP")
+    assert cache.get_many("Derm", "LRP", FRANCHISES, ["LRP_A"]) == {}
+    assert cache.get_many("Derm", "CeraVe", FRANCHISES, ["CRV_A"]) == {"CRV_A": "Effaclar"}
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
+
+
+def test_changed_franchise_list_invalidates_brand(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many("Derm", "LRP", FRANCHISES, {"LRP_A": "Effaclar"})
+    assert cache.get_many("Derm", "LRP", FRANCHISES + ["Toleriane"], ["LRP_A"]) == {}
+    assert cache.get_many("Derm", "LRP", FRANCHISES, ["LRP_A"]) == {}
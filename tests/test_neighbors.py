@@ -0,0 +1,98 @@
+import pandas as pd
+import pytest
+
+from neighbors import MappingHistory, NeighborIndex
+
+HISTORY = {
+    "LRP_Effaclar_Duo_Q1_2024_FB": "Effaclar Duo",
+    "LRP_Effaclar_Serum_Launch_IG": "Effaclar",
+    "LRP_Toleriane_Double_Repair_YT": "Toleriane",
+    "LRP_Anthelios_SPF50_Summer": "Anthelios",
+    "LRP_Cicaplast_Baume_Search": "Cicaplast",
+}
+
+
+def make_index(mappings=HISTORY):
+    index = NeighborIndex()
+    index.add(list(mappings), list(mappings.values()))
+    return index
+
+
+def test_predict_finds_variants_of_accepted_campaigns():
+    predictions = make_index().predict(["LRP_Effaclar_Duo_Q3_2025_IG", "LRP_Anthelios_SPF50_Summer_v2"])
+    assert predictions["franchise"].tolist() == ["Effaclar Duo", "Anthelios"]
+    assert (predictions["confidence"] > 0.9).all()
+    assert predictions["neighbor"].tolist() == ["lrp effaclar duo", "lrp anthelios spf50 summer"]
+
+
+def test_unrelated_campaign_has_low_confidence():
+    predictions = make_index().predict(["Garnier_Micellar_Water_TV", ""])
+    assert (predictions["confidence"] < 0.5).all()
+
+
+def test_adding_the_same_canonical_campaign_relabels_it():
+    index = make_index()
+    assert index.add(["LRP_Effaclar_Duo_Q4_2024_TT"], ["Effaclar"]) == 0
+    assert len(index) == len(HISTORY)
+    assert index.predict(["LRP_Effaclar_Duo_FB"])["franchise"].tolist() == ["Effaclar"]
+
+
+def test_relabel_within_one_add():
+    index = NeighborIndex()
+    assert index.add(["LRP_Mela_B3_FB", "LRP_Mela_B3_IG"], ["Mela", "Mela B3"]) == 1
+    assert index.predict(["LRP_Mela_B3_YT"])["franchise"].tolist() == ["Mela B3"]
+
+
+def test_allowed_limits_the_voting_neighbours():
+    index = make_index()
+    campaign = ["LRP_Effaclar_Duo_Q3_2025_IG"]
+    assert index.predict(campaign, allowed={"Effaclar", "Toleriane"})["franchise"].tolist() == ["Effaclar"]
+    predictions = index.predict(campaign, allowed={"Vitamin C"})
+    assert predictions["franchise"].isna().all()
+    assert predictions["confidence"].tolist() == [0.0]
+
+
+def test_incremental_adds_match_a_single_build():
+    items = list(HISTORY.items())
+    built = make_index()
+    grown = NeighborIndex()
+    for campaign, franchise in items:
+        grown.add([campaign], [franchise])
+        grown.predict([campaign])
+    campaigns = ["LRP_Effaclar_Duo_IG", "LRP_Toleriane_Repair", "LRP_Cicaplast_Baume_B5", "LRP_Serum"]
+    pd.testing.assert_frame_equal(grown.predict(campaigns), built.predict(campaigns))
+
+
+def test_resolve_keeps_confident_predictions():
+    mappings, sources = make_index().resolve(["LRP_Effaclar_Duo_Q3_2025_IG", "Garnier_Micellar_Water_TV"])
+    assert mappings == {"LRP_Effaclar_Duo_Q3_2025_IG": "Effaclar Duo"}
+    assert sources == {"LRP_Effaclar_Duo_Q3_2025_IG": "history"}
+
+
+def mappings_table():
+    return pd.DataFrame({
+        "Campaign": list(HISTORY) + ["LRP_Mystery_Campaign", "CRV_Hydrating_Cleanser_FB"],
+        "Franchise": list(HISTORY.values()) + ["Unknown", "Hydrating"],
+        "Source": "llm",
+        "Division": "Derm",
+        "Brand": ["LRP"] * (len(HISTORY) + 1) + ["CeraVe"],
+    })
+
+
+def test_add_table_indexes_each_pair_and_skips_unknown():
+    history = MappingHistory()
+    assert history.add_table(mappings_table(), key="file-hash") == len(HISTORY) + 1
+    assert history.has_table("file-hash")
+    assert history.add_table(mappings_table(), key="file-hash") == 0
+    assert history.stats() == {"pairs": 2, "campaigns": len(HISTORY) + 1, "files": 1}
+
+    franchises = ["Effaclar", "Effaclar Duo", "Toleriane"]
+    campaigns = ["LRP_Toleriane_Double_Repair_TT", "LRP_Mystery_Campaign"]
+    mappings, _ = history.resolve("Derm", "LRP", franchises, campaigns)
+    assert mappings == {"LRP_Toleriane_Double_Repair_TT": "Toleriane"}
+    assert history.resolve("Derm", "Vichy", franchises, ["LRP_Toleriane_Double_Repair_TT"]) == ({}, {})
+
+
+def test_add_table_requires_the_mapping_columns():
+    with pytest.raises(ValueError):
+        MappingHistory().add_table(mappings_table().drop(columns=["Brand"]))
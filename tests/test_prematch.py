@@ -0,0 +1,50 @@
+from prematch import DEFAULT_AUTO_ASSIGN_THRESHOLD, FranchiseMatcher
+
+FRANCHISES = ["Vitamin C", "Effaclar", "Effaclar Duo", "Mela B3"]
+
+
+def match(campaigns):
+    return FranchiseMatcher(FRANCHISES).match(campaigns).set_index("campaign")
+
+
+def test_longer_franchise_wins_over_contained_name():
+    matches = match(["LRP_Effaclar_Duo_Q3", "LRP_Effaclar_Q3"])
+    assert matches.loc["LRP_Effaclar_Duo_Q3", "franchise"] == "Effaclar Duo"
+    assert matches.loc["LRP_Effaclar_Q3", "franchise"] == "Effaclar"
+
+
+def test_compact_alias_in_space_free_campaign():
+    matches = match(["LRPEffaclarDuo", "LRP_VitaminC_Serum"])
+    assert matches["franchise"].tolist() == ["Effaclar Duo", "Vitamin C"]
+    assert matches["source"].tolist() == ["alias", "alias"]
+
+
+def test_compact_alias_must_end_a_word():
+    matches = match(["LRP_Vitamin_C10", "LRP_VitaminC10"])
+    assert (matches["source"] != "alias").all()
+    resolved, _ = FranchiseMatcher(FRANCHISES).resolve(matches.index, threshold=DEFAULT_AUTO_ASSIGN_THRESHOLD)
+    assert resolved == {}
+
+
+def test_fuzzy_matches_misspelled_franchise():
+    matches = match(["LRP_Efaclar_Q3", "LRP_Mela_B3_Serum_Vitamn_C"])
+    assert matches.loc["LRP_Efaclar_Q3", "franchise"] == "Effaclar"
+    assert matches.loc["LRP_Efaclar_Q3", "source"] == "fuzzy"
+    assert 0.5 < matches.loc["LRP_Efaclar_Q3", "score"] < 1.0
+
+
+def test_fuzzy_needs_a_clear_winner():
+    matcher = FranchiseMatcher(["Hyalu B5", "Hyalu B3"])
+    matches = matcher.match(["LRP_Hyalu_B4"])
+    assert matches["franchise"].isna().all()
+    assert matches["score"].tolist() == [0.0]
+
+
+def test_threshold_keeps_every_match_that_reaches_it():
+    campaigns = ["LRP_Efaclar_Q3", "LRP_Effaclr_Duo", "LRP_Tolerian", "LRP_Anthelios", "Q3", ""]
+    matcher = FranchiseMatcher(FRANCHISES + ["Toleriane", "Anthelios"])
+    full = matcher.match(campaigns)
+    pruned = matcher.match(campaigns, threshold=0.7)
+    confident = full["score"] >= 0.7
+    assert pruned[confident].equals(full[confident])
+    assert pruned.loc[~confident, "franchise"].isna().all()
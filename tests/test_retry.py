@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from franchise_mapping import call_with_retry
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def failing(*errors, result="ok"):
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return func, calls
+
+
+@pytest.mark.parametrize("status", [429, 500, 529])
+def test_retries_rate_limits_and_server_errors(status):
+    func, calls = failing(StatusError(status), StatusError(status))
+    assert call_with_retry(func, backoff_seconds=0) == "ok"
+    assert len(calls) == 3
+
+
+@pytest.mark.parametrize("error", [StatusError(400), StatusError(401), TypeError("bug"), KeyError("bug")])
+def test_does_not_retry_client_or_programming_errors(error):
+    func, calls = failing(error)
+    with pytest.raises(type(error)):
+        call_with_retry(func, backoff_seconds=0)
+    assert len(calls) == 1
+
+
+def test_gives_up_after_max_retries():
+    func, calls = failing(*[StatusError(503)] * 5)
+    with pytest.raises(StatusError):
+        call_with_retry(func, max_retries=2, backoff_seconds=0)
+    assert len(calls) == 3
+
+
+def test_stops_retrying_once_cancelled():
+    cancel_event = threading.Event()
+    cancel_event.set()
+    func, calls = failing(StatusError(503))
+    with pytest.raises(StatusError):
+        call_with_retry(func, backoff_seconds=60, cancel_event=cancel_event)
+    assert len(calls) == 1
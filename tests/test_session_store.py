@@ -0,0 +1,84 @@
+import gc
+import os
+import time
+
+import pandas as pd
+
+from session_store import SessionSpill, SpillSlot
+
+
+def spill_files(directory):
+    return [name for name in os.listdir(directory) if name.endswith(".pkl")] if os.path.isdir(directory) else []
+
+
+def test_spilled_value_is_read_back(tmp_path):
+    frame = pd.DataFrame({"campaign": ["LRP_A", "LRP_B"], "spend": [1.5, 2.0]})
+    slot = SpillSlot(frame, str(tmp_path))
+    assert slot.spill()
+    assert slot.spilled
+    assert not slot.spill()
+    pd.testing.assert_frame_equal(slot.get(), frame)
+    assert not slot.spilled
+
+
+def test_spill_file_is_reused_and_discarded(tmp_path):
+    slot = SpillSlot(b"export bytes", str(tmp_path))
+    slot.spill()
+    assert slot.get() == b"export bytes"
+    slot.spill()
+    assert len(spill_files(tmp_path)) == 1
+    slot.discard()
+    assert spill_files(tmp_path) == []
+
+
+def test_slot_read_after_the_cutoff_is_kept(tmp_path):
+    slot = SpillSlot(b"value", str(tmp_path))
+    read_at = time.time()
+    slot.get()
+    assert not slot.spill(idle_since=read_at - 1)
+    assert not slot.spilled
+    assert slot.spill(idle_since=time.time() + 1)
+
+
+def test_only_idle_sessions_are_spilled(tmp_path):
+    spill = SessionSpill(idle_seconds=60, directory=str(tmp_path))
+    now = time.time()
+    idle = spill.slot("idle", b"idle value")
+    active = spill.slot("active", b"active value")
+    spill.touch("idle", now - 120)
+    spill.touch("active", now + 61)
+
+    # Even in an idle session, a slot is kept until idle_seconds after it was
+    # created or last read
+    assert spill.spill_idle(now + 30) == 0
+    assert spill.spill_idle(now + 61) == 1
+    assert idle.spilled
+    assert not active.spilled
+    assert spill.stats() == {"sessions": 2, "slots": 2, "spilled": 1, "spills": 1}
+
+
+def test_slot_used_after_the_idle_check_is_not_spilled(tmp_path):
+    spill = SessionSpill(idle_seconds=60, directory=str(tmp_path))
+    now = time.time()
+    slot = spill.slot("session", b"value")
+    spill.touch("session", now - 120)
+    # The session reads the value just before the background pass runs, but
+    # after the registry last saw it active
+    value = slot.get()
+    assert spill.spill_idle(now) == 0
+    assert not slot.spilled
+    assert value == b"value"
+
+
+def test_dropped_slots_release_their_session(tmp_path):
+    spill = SessionSpill(idle_seconds=60, directory=str(tmp_path))
+    slot = spill.slot("closed", b"value")
+    slot.spill()
+    assert len(spill_files(tmp_path)) == 1
+    del slot
+    gc.collect()
+    assert spill_files(tmp_path) == []
+
+    spill.touch("closed", time.time() - 120)
+    spill.spill_idle()
+    assert spill.stats()["sessions"] == 0